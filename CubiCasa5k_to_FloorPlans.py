@@ -1,7 +1,6 @@
 import os
 import random
-import config
-import FloorplanToSTL as stl
+from utils.batch_runner import run_batch
 
 direct = '/home/ubuntu/dev/Floorplan_2/MinkowskiEngine/CubiCasa5k/data/cubicasa5k/'
 choose_frm = [] 
@@ -25,19 +24,6 @@ choose_frm += [direct+'high_quality/'+i for i in os.listdir(direct + 'high_quali
 random.seed(25)
 chosen = random.sample(choose_frm, 1)
 
-complete = 0
-for j,i in enumerate(chosen):
-    if j + 1 >complete:
-        img_path = i + '/F1_scaled.png'
-        svg_path = i + '/model.svg'
-        print(img_path)
-        try:
-            stl.createFloorPlanPointCloud_svg(image_path = img_path, target_path = config.target_path,svg_path = svg_path, calc_an = True)
-        except Exception as e:
-            print(e)
-        with open("Completion_log_.txt" , 'w') as f:
-            f.write("Finished "+str(j+1)+" FloorPlan")
-            f.write('\n')
-
-            
-            
+# Every plan runs in its own job directory under Batch/jobs, finished plans are
+# listed in Batch/manifest.jsonl and skipped when the script is started again
+run_batch(chosen, os.path.abspath('Batch'), workers = os.cpu_count(), timeout = 3600, seed = 25, calc_an = True)
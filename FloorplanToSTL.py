@@ -1,11 +1,66 @@
 from utils.FloorplanToBlenderLib import execution
+from utils.FloorplanToBlenderLib import generate
+from utils.FloorplanToBlenderLib import IO
 from subprocess import check_output
 import os
-import open3d as o3d
 import numpy as np
 import time
+import glob
+import json
+import random
 import config 
-import utils.Placement_utils as pl
+from utils.blender_service import BlenderWorker
+from utils.stage_cache import StageCache
+from utils import telemetry
+from utils.telemetry import span
+import atexit
+
+_blender_worker = None
+
+def get_blender_worker():
+    '''
+    Persistent background Blender shared by all stages of this process
+    '''
+    global _blender_worker
+    if _blender_worker is None:
+        _blender_worker = BlenderWorker(config.blender_install_path, config.blender_worker_script)
+        atexit.register(close_blender_worker)
+    return _blender_worker
+
+def close_blender_worker():
+    global _blender_worker
+    if _blender_worker is not None:
+        _blender_worker.close()
+        _blender_worker = None
+
+def run_blender(script_path, args=None):
+    '''
+    Run a script in background Blender
+    Uses the persistent worker when config.blender_worker is set, else a new Blender process
+    Raises CalledProcessError when the script fails, either way
+    @Param script_path, script to run
+    @Param args, passed to the script after its name
+    '''
+    args = [] if args is None else args
+    with span('blender_'+os.path.basename(script_path)[:-3]):
+        if config.blender_worker:
+            # the worker was started with its own environment, hand the telemetry file over
+            env = {k: os.environ[k] for k in [telemetry.TELEMETRY_ENV] if k in os.environ}
+            get_blender_worker().run(script_path, args, env=env)
+            return
+        check_output([config.blender_install_path,
+         "-noaudio", # this is a dockerfile ubuntu hax fix
+         "--background",
+         "--python",
+         script_path] + args)
+
+def enable_telemetry():
+    '''
+    Send spans of this process and of the Blender scripts to program_path/telemetry.jsonl
+    An already set PIPELINE_TELEMETRY wins
+    '''
+    if config.telemetry and not os.environ.get(telemetry.TELEMETRY_ENV):
+        os.environ[telemetry.TELEMETRY_ENV] = os.path.join(config.program_path, 'telemetry.jsonl')
 
 def createFloorPlan(image_path = config.image_path, target_path = config.target_path, SR_Check=True):
     import config 
@@ -14,66 +69,116 @@ def createFloorPlan(image_path = config.image_path, target_path = config.target_
     else:
         SR = None
     program_path = config.program_path
-    blender_install_path = config.blender_install_path
     blender_script_path = config.blender_script_path
     CubiCasa = config.CubiCasa
     
     
     data_paths = [execution.simple_single(image_path,CubiCasa=CubiCasa,SR=SR)]
   
-    check_output([blender_install_path,
-     "-noaudio", # this is a dockerfile ubuntu hax fix
-     "--background",
-     "--python",
-     blender_script_path,
-     program_path, # Send this as parameter to script
-     target_path
-     ] +  data_paths)
+    run_blender(blender_script_path, [program_path, # Send this as parameter to script
+                 target_path] + data_paths)
  
     print("Created File at "+target_path)
 
 def createFloorPlan_svg(image_path = config.image_path, target_path = config.target_path,svg_path =""):
     import config 
     program_path = config.program_path
-    blender_install_path = config.blender_install_path
     blender_script_path = program_path+'/floorplan_to_PointClouds_in_blender.py'
     
     data_paths = [execution.SVG_polygons(image_path, svg_path)]
   
-    check_output([blender_install_path,
-     "-noaudio", # this is a dockerfile ubuntu hax fix
-     "--background",
-     "--python",
-     blender_script_path,
-     program_path, # Send this as parameter to script
-     target_path
-     ] +  data_paths)
+    run_blender(blender_script_path, [program_path, # Send this as parameter to script
+                 target_path] + data_paths)
     
     print("Created File at "+target_path)
     
-def Placement_Info_from_plan(image_path = config.image_path, target_path = config.target_path, svg_path =""):
+def get_stage_cache():
+    '''
+    Stage cache of this installation, None when disabled in config
+    '''
+    if not config.stage_cache:
+        return None
+    return StageCache(config.stage_cache_path)
+
+def sources(*names):
+    '''
+    Absolute paths of scripts and resources below the program folder
+    Part of the stage keys, so editing a script invalidates its stage
+    '''
+    return [os.path.join(os.path.dirname(os.path.abspath(__file__)), i) for i in names]
+
+def generate_plan(image_path, svg_path, cache=None):
+    '''
+    Generate Data/<n>/ files from svg, or restore them from the cache
+    @Return data_paths, stage key
+    '''
+    if cache is None:
+        with span('generate'):
+            return [execution.SVG_polygons(image_path, svg_path)], None
+    lib = sources('utils/FloorplanToBlenderLib')[0]
+    key = cache.key('generate', [image_path, svg_path] + sorted(glob.glob(lib+'/*.py')) +
+                    sources('utils/loaders/svg_utils.py', 'utils/loaders/svg_cache.py'))
+    if cache.has('generate', key):
+        path = IO.create_new_floorplan_path(generate.base_path, svg=svg_path, image=image_path)
+        meta = cache.restore('generate', key, {'Data': path})
+        IO.index_plan(path, rooms=IO.room_index(IO.read_from_file(path+'room_names')),
+                      files=[path+IO.FLOORPLAN_FILE], status='generated', **meta)
+        print("Restored generate stage from cache")
+        return [path], key
+    with span('generate'):
+        data_paths = [execution.SVG_polygons(image_path, svg_path)]
+    # restored plans are indexed with the same counts
+    cache.store('generate', key, {'Data': data_paths[0]}, IO.plan_counts(data_paths[0]))
+    return data_paths, key
+
+def Placement_Info_from_plan(image_path = config.image_path, target_path = config.target_path, svg_path ="", seed = None, keys = None, blender = True):
+    '''
+    Place random objects in the rooms of a plan, writes scene.json and Placed_polygons.txt
+    @Param blender, build the scene in Blender and save floorplan.blend for the render stage,
+    else read rooms and boxes straight from the Data files, see utils.plan_scene.placement_scene
+    '''
     import config 
+    import utils.Placement_utils as pl
     program_path = config.program_path
-    blender_install_path = config.blender_install_path
     blender_script_path = program_path+'/Placement_Info.py'
 
-    data_paths = [execution.SVG_polygons(image_path, svg_path)]
+    # Placement is random, only a seeded run can be cached
+    cache = get_stage_cache()
+    data_paths, key = generate_plan(image_path, svg_path, cache)
+    if seed is None:
+        cache = None
+    else:
+        random.seed(seed)
+        np.random.seed(seed)
+
+    outputs = {'scene.json': program_path+'/scene.json',
+               'Placed_polygons.txt': 'Placed_polygons.txt'}
+    if blender:
+        outputs['floorplan.blend'] = program_path+'/floorplan.blend'
+    if cache is not None:
+        key = cache.key('placement', sources('Placement_Info.py', 'utils/Placement_utils.py', 'utils/plan_scene.py',
+                                             'utils/mesh_builder.py', 'object_boundbox.txt'),
+                        {'seed': seed, 'target_path': target_path, 'blender': blender}, [key])
+        if keys is not None:
+            keys['placement'] = key
+        if cache.has('placement', key):
+            cache.restore('placement', key, outputs)
+            print("Restored placement stage from cache")
+            return data_paths
   
-    check_output([blender_install_path,
-     "-noaudio", # this is a dockerfile ubuntu hax fix
-     "--background",
-     "--python",
-     blender_script_path,
-     program_path, # Send this as parameter to script
-     target_path
-     ] +  data_paths)
-    
-    R,_,_ = pl.extract_polygons(config)
-    D = []
-    for i in R:
-        rooms = [i for i in pl.Room_add_list]
-        if i.split('.')[0] in rooms:
-            D += pl.add_objects_to_room(i,config)
+    if blender:
+        run_blender(blender_script_path, [program_path, # Send this as parameter to script
+                     target_path] + data_paths)
+    else:
+        from utils.plan_scene import placement_scene
+        from utils.scene_file import write_scene
+        with span('scene_build'):
+            write_scene(program_path, placement_scene(data_paths[0]))
+    
+    with span('placement') as counts:
+        plan = pl.extract_polygons(config)
+        D = pl.place_objects(config, plan)
+        counts.update(rooms=len(plan.rooms), objects=len(D))
 
     t = open("Placed_polygons.txt",'w')
     for i in D:
@@ -82,25 +187,68 @@ def Placement_Info_from_plan(image_path = config.image_path, target_path = confi
             t.write(str(i.center())[1:-1]+',')
             t.write(str(i.rotated%360)+'\n')
     t.close()
+    if cache is not None:
+        cache.store('placement', key, outputs)
     print("Generated_Placement_Info")
     return data_paths
     
+def render_plan(data_paths, target_path, keys = None):
+    '''
+    Render rooms of the placed scene to point clouds, or restore them from the cache
+    Writes <plan>/<room>/<room>.ply, <plan>_a.blend and config.txt
+    '''
+    import config 
+    program_path = config.program_path
+    blender_script_path_pc = program_path+'/floorplan_to_PointClouds_in_blender.py'
+
+    cache = get_stage_cache() if keys is not None and 'placement' in keys else None
+    if cache is not None:
+        key = cache.key('render', sources('floorplan_to_PointClouds_in_blender.py', 'object.blend',
+                                          'Materials.blend', 'materials.json',
+                                          'utils/mesh_builder.py', 'utils/plan_scene.py'),
+                        {'target_path': target_path}, [keys['placement']])
+        keys['render'] = key
+        if cache.has('render', key):
+            meta = cache.restore('render', key, {})
+            # same naming as the render script, next free _Plan_<n>
+            number = [i for i in os.listdir(program_path) if '_Plan_'==i[:6] and os.path.isdir(program_path+'/'+i)]
+            plan = program_path+'/_Plan_'+str(len(number))
+            if meta['empty']:
+                config_text = "No usable rooms in Plan"
+            else:
+                cache.restore('render', key, {'plan': plan, 'plan_a.blend': plan+'_a.blend'})
+                config_text = plan+'_a.blend'
+            with open('config.txt', 'w') as f:
+                f.write(config_text)
+            print("Restored render stage from cache")
+            return
+
+    run_blender(blender_script_path_pc, [program_path, # Send this as parameter to script
+                 target_path] + data_paths)
+
+    if cache is not None:
+        with open('config.txt', 'r') as f:
+            name = f.read().replace('\n', '')
+        if name == "No usable rooms in Plan":
+            cache.store('render', key, {}, {'empty': True})
+        else:
+            name = name[0:len(name)-8]
+            cache.store('render', key, {'plan': name, 'plan_a.blend': name+'_a.blend'}, {'empty': False})
 
 def load_file(file_name, voxel_size=0.02):
+    import open3d as o3d
     import MinkowskiEngine as ME
     pcd = o3d.io.read_point_cloud(file_name)
     coords = np.array(pcd.points)*1000
     feats = np.array(pcd.colors)
     quantized_coords = np.floor(coords / voxel_size)
     inds = ME.utils.sparse_quantize(quantized_coords, return_index=True)
-    return quantized_coords[inds]*0.02, feats[inds], pcd
+    return quantized_coords[inds]*voxel_size, feats[inds], pcd
 
-def annotate(target_path = config.target_path, calc_an = True):
+def annotate(target_path = config.target_path, calc_an = True, voxel_size = 0.02, keys = None):
     import config 
-    import time
     start = time.time()
     program_path = config.program_path
-    blender_install_path = config.blender_install_path
     #blender_script_path_pc = program_path+'/annotate.py'
     blender_script_path_pc = program_path+'/annotate-Blocky.py'
     with open(program_path+'/config.txt', 'r') as file:
@@ -110,20 +258,47 @@ def annotate(target_path = config.target_path, calc_an = True):
     name = name[0:len(name)-8]
     rooms = [i for i in os.listdir(name+'/')]
     print(blender_script_path_pc)
+
+    cache = get_stage_cache() if keys is not None and 'render' in keys else None
+    downsampled = {}
     for i in rooms:
-        filename = name+'/'+i+'/'+i+'.ply'
-        pnts,cls,pcd = load_file(filename)
-        with open(name+'/'+i+'/'+i+'_downsampled.npy', 'wb') as f:
-            np.save(f, pnts)
-        with open(name+'/'+i+'/'+i+'_downsampled(cls).npy', 'wb') as f:
-            np.save(f, cls)
+        downsampled[i+'/'+i+'_downsampled.npy'] = name+'/'+i+'/'+i+'_downsampled.npy'
+        downsampled[i+'/'+i+'_downsampled(cls).npy'] = name+'/'+i+'/'+i+'_downsampled(cls).npy'
+    if cache is not None:
+        key = cache.key('downsample', sources('FloorplanToSTL.py'), {'voxel_size': voxel_size}, [keys['render']])
+        keys['downsample'] = key
+    if cache is not None and cache.has('downsample', key):
+        cache.restore('downsample', key, downsampled)
+        print("Restored downsample stage from cache")
+    else:
+        for i in rooms:
+            filename = name+'/'+i+'/'+i+'.ply'
+            with span('downsample', rooms=1) as counts:
+                pnts,cls,pcd = load_file(filename, voxel_size)
+                with open(name+'/'+i+'/'+i+'_downsampled.npy', 'wb') as f:
+                    np.save(f, pnts)
+                with open(name+'/'+i+'/'+i+'_downsampled(cls).npy', 'wb') as f:
+                    np.save(f, cls)
+                counts.update(points=len(pcd.points), downsampled=len(pnts))
+        if cache is not None:
+            cache.store('downsample', key, downsampled)
+
     if calc_an==True:
-        check_output([blender_install_path,
-         "-noaudio", # this is a dockerfile ubuntu hax fix
-         "--background",
-         "--python",
-          # Send this as parameter to script
-         blender_script_path_pc])
+        labels = {}
+        for i in rooms:
+            labels[i+'/'+i+'_labels_norm.npy'] = name+'/'+i+'/'+i+'_labels_norm.npy'
+            labels[i+'/'+i+'_labels.npy'] = name+'/'+i+'/'+i+'_labels.npy'
+        if cache is not None:
+            key = cache.key('annotate', sources('annotate-Blocky.py', 'object.blend'), {},
+                            [keys['render'], keys['downsample']])
+            keys['annotate'] = key
+        if cache is not None and cache.has('annotate', key):
+            cache.restore('annotate', key, labels)
+            print("Restored annotate stage from cache")
+        else:
+            run_blender(blender_script_path_pc)
+            if cache is not None:
+                cache.store('annotate', key, labels)
     
     os.remove(name+"_a.blend")
     print("Created Anotations")
@@ -132,27 +307,103 @@ def annotate(target_path = config.target_path, calc_an = True):
     
 
     
-def createFloorPlanPointCloud_svg(image_path = config.image_path, target_path = config.target_path,svg_path ="",calc_an = True):
+def scan_plan(data_paths, calc_an = True, voxel_size = 0.02, seed = None):
+    '''
+    Render and annotate stages without Blender, rooms are ray cast on CPU by utils.virtual_scan
+    '''
+    import config 
+    from utils import virtual_scan
+    with span('scan'):
+        plan = virtual_scan.scan_plan(data_paths[0], config.program_path, 'Placed_polygons.txt',
+                                      voxel_size = voxel_size, stride = config.virtual_scan_stride,
+                                      calc_an = calc_an, seed = seed)
+    if plan is None:
+        return "No usable rooms in Plan"
+    return plan
+
+def single_session_plan(data_paths, target_path = config.target_path, calc_an = True, voxel_size = 0.02, seed = None):
+    '''
+    Placement, render, downsample and annotate of one plan in one Blender session, see single_session.py
+    '''
     import config 
-    # Place Random Objects
-    data_paths = Placement_Info_from_plan(image_path = config.image_path, target_path = config.target_path, svg_path =svg_path)
-    
     program_path = config.program_path
-    blender_install_path = config.blender_install_path
-    blender_script_path_pc = program_path+'/floorplan_to_PointClouds_in_blender.py'
+    options = {'seed': seed, 'voxel_size': voxel_size, 'calc_an': calc_an}
+    run_blender(program_path+'/single_session.py', [program_path, # Send this as parameter to script
+                 target_path, json.dumps(options)] + data_paths)
 
-    #data_paths = [execution.SVG_polygons(image_path, svg_path)]
-  
-    check_output([blender_install_path,
-     "-noaudio", # this is a dockerfile ubuntu hax fix
-     "--background",
-     "--python",
-     blender_script_path_pc,
-     program_path, # Send this as parameter to script
-     target_path
-     ] +  data_paths)
-    
-    anotation_time = annotate(target_path = config.target_path, calc_an=calc_an)
+def plan_status(data_paths, status, output=None):
+    '''
+    Record the progress of a plan in the plan index of its data folder
+    '''
+    fields = {'status': status}
+    if output is not None:
+        fields['output'] = output
+    for i in data_paths:
+        IO.index_plan(i, **fields)
+
+def shard_plan(plan_dir):
+    '''
+    Append the rooms of a finished plan folder to the dataset shards
+    '''
+    import config 
+    from utils.dataset_shards import ShardWriter
+    if not config.dataset_shards or plan_dir is None or not os.path.isdir(plan_dir):
+        return
+    with span('shard', plans=1) as counts:
+        counts['rooms'] = ShardWriter(config.dataset_shards_path).append_plan(plan_dir)
+
+def last_plan(program_path):
+    '''
+    Newest _Plan_<n> folder of program_path, None when there is none
+    '''
+    number = [i for i in os.listdir(program_path) if '_Plan_'==i[:6] and os.path.isdir(program_path+'/'+i)]
+    if number == []:
+        return None
+    return program_path+'/_Plan_'+str(len(number)-1)
+
+def createFloorPlanPointCloud_svg(image_path = config.image_path, target_path = config.target_path,svg_path ="",calc_an = True, seed = None, voxel_size = 0.02):
+    import config 
+    enable_telemetry()
+    if config.single_session:
+        with span('plan', svg=svg_path):
+            data_paths, _ = generate_plan(image_path, svg_path, get_stage_cache())
+            single_session_plan(data_paths, target_path, calc_an = calc_an, voxel_size = voxel_size, seed = seed)
+        plan = last_plan(config.program_path)
+        plan_status(data_paths, 'annotated' if calc_an else 'rendered', plan)
+        shard_plan(plan)
+        print("Created File at "+target_path)
+        return
+    if config.virtual_scan:
+        with span('plan', svg=svg_path):
+            data_paths = Placement_Info_from_plan(image_path = image_path, target_path = target_path, svg_path =svg_path, seed = seed,
+                                                  blender = not config.python_placement)
+            plan = scan_plan(data_paths, calc_an = calc_an, voxel_size = voxel_size, seed = seed)
+        if plan != "No usable rooms in Plan":
+            plan_status(data_paths, 'annotated' if calc_an else 'rendered', plan)
+            shard_plan(plan)
+        else:
+            plan_status(data_paths, 'empty')
+        print("Created File at "+str(plan))
+        return
+
+    # Stage keys, filled by every stage that could be cached
+    keys = {}
+    with span('plan', svg=svg_path):
+        # Place Random Objects
+        data_paths = Placement_Info_from_plan(image_path = image_path, target_path = target_path, svg_path =svg_path, seed = seed, keys = keys)
+        plan_status(data_paths, 'placed')
+
+        render_plan(data_paths, target_path, keys = keys)
+        
+        anotation_time = annotate(target_path = target_path, calc_an=calc_an, voxel_size = voxel_size, keys = keys)
+
+    with open(config.program_path+'/config.txt', 'r') as file:
+        name = file.read().replace('\n', '')
+    if name != "No usable rooms in Plan":
+        plan_status(data_paths, 'annotated' if calc_an else 'rendered', name[0:len(name)-8])
+        shard_plan(name[0:len(name)-8])
+    else:
+        plan_status(data_paths, 'empty')
     
     
     print("Created File at "+target_path)
@@ -162,19 +413,12 @@ def createRender(image_path = config.image_path, target_path = config.target_pat
     import config 
     
     program_path = config.program_path
-    blender_install_path = config.blender_install_path
     blender_script_path_pc = program_path+'/Render.py'
 
     data_paths = [execution.SVG_polygons(image_path, svg_path)]
   
-    check_output([blender_install_path,
-     "-noaudio", # this is a dockerfile ubuntu hax fix
-     "--background",
-     "--python",
-     blender_script_path_pc,
-     program_path, # Send this as parameter to script
-     target_path
-     ] +  data_paths)
+    run_blender(blender_script_path_pc, [program_path, # Send this as parameter to script
+                 target_path] + data_paths)
     
     return
     
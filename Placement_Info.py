@@ -1,17 +1,19 @@
 import bpy
 import os
 import numpy as np
-import json
 import sys
 import math
 import mathutils
 from mathutils import Matrix, Vector
 from archimesh.door_window_automation import *
-import skimage
-from skimage import io
+# cv2 reads EXR depth maps only with this set before its import, open3d, cv2 and skimage are imported where used
 os.environ["OPENCV_IO_ENABLE_OPENEXR"]="1"
-import open3d as o3d
-import cv2
+# Blender does not put the script folder on sys.path, realpath follows job dir symlinks
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from utils.telemetry import span
+from utils.FloorplanToBlenderLib import IO
+from utils.mesh_builder import create_walls
+from utils.scene_file import Scene, write_scene
 
 '''
 Floorplan to Blender
@@ -44,14 +46,11 @@ Our helpful functions
 def read_from_file(file_path):
     '''
     Read from file
-    read verts data from file
+    read verts data of the floorplan container written by generate
     @Param file_path, path to file
     @Return data
     '''
-    # Now read the file back into a Python list object
-    with open(file_path+'.txt', 'r') as f:
-        data = json.loads(f.read())
-    return data
+    return IO.read_from_file(file_path)
 
 def init_object(name):
     # Create new blender object and return references to mesh and object
@@ -152,9 +151,6 @@ def main(argv):
     # Select all
     import sys
     print(sys.exec_prefix)
-    
-    objs = bpy.data.objects
-    objs.remove(objs["Cube"], do_unlink=True)
 
     if(len(argv) > 7): # Note YOU need 8 arguments!
         program_path = argv[5]
@@ -162,20 +158,33 @@ def main(argv):
     else:
         exit(0)
 
+    build_scene(program_path, argv[7:])
+    '''
+    Send correct exit code
+    '''
+    bpy.ops.wm.save_as_mainfile(filepath=program_path + target + ".blend")
 
+def build_scene(program_path, data_paths):
     '''
-    Instantiate
+    Build scene
+    Replace the startup cube with the floorplans of data_paths
     '''
-    for i in range(7,len(argv)):
-        base_path = argv[i]
-        send_floorplan(base_path, program_path, i)
+    objs = bpy.data.objects
+    objs.remove(objs["Cube"], do_unlink=True)
+
     '''
-    Send correct exit code
+    Instantiate
     '''
-    bpy.ops.wm.save_as_mainfile(filepath=program_path + target + ".blend")
+    for i, base_path in enumerate(data_paths):
+        send_floorplan(base_path, program_path, i+7)
 
 
-def send_floorplan(base_path,program_path, name=0):
+def send_floorplan(base_path,program_path, name=0, merge_walls=False):
+    '''
+    Build the scene of one floorplan data folder
+    @Param merge_walls, one mesh with a wall_id face attribute per wall category instead
+    of one object per wall, the room lookups (Room_Wall_List, ...) need the objects
+    '''
 
     parent, parent_mesh = init_object("Floorplan"+str(name))
     
@@ -233,121 +242,28 @@ def send_floorplan(base_path,program_path, name=0):
     verts = read_from_file(path_to_top_wall_verts_file)
     faces = read_from_file(path_to_top_wall_faces_file)
 
-    # Create mesh from data
-    boxcount = 0
-    wallcount = 0
-
-    # Create parent
-    top_wall_parent, top_wall_parent_mesh = init_object("TopWalls")
-
-    for i in range(0, len(verts)):
-        roomname = "TopWalls"+str(i)
-        obj = create_custom_mesh(
-            roomname, verts[i], faces[i], pos=pos, rot=rot, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1)))
-        obj.parent = top_wall_parent
-
+    # Walls are extruded prisms built in numpy, see utils.mesh_builder
+    wall_mat = create_mat((0.5, 0.5, 0.5, 1))
+    top_wall_parent = create_walls("TopWalls", verts, faces, 2.5, pos, rot, cen, wall_mat, merged=merge_walls)
     top_wall_parent.parent = parent
     
-    obj = bpy.context.scene.objects["TopWalls"]
-    bpy.context.view_layer.objects.active = obj
-    
-    bpy.ops.object.select_all( action = 'SELECT' )
-    bpy.ops.object.editmode_toggle()
-    
-    bpy.ops.mesh.extrude_context_move(
-    TRANSFORM_OT_translate={"value":(-0, -0, 2.5)}
-    )
-    
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.select_all(action='DESELECT')
-    
     path_to_door_verts_file = program_path +"/" + base_path + "doors_verts"
     path_to_door_faces_file = program_path +"/" + base_path + "doors_faces"
     door_verts = read_from_file(path_to_door_verts_file)
     door_faces = read_from_file(path_to_door_faces_file)
-    # Create parent
-    door_parent, door_parent_mesh = init_object("Door_Walls")
+    door_parent = create_walls("Door_Walls", door_verts, door_faces, 2.5-2.1, [0,0,-1-2.1], rot, cen, wall_mat, merged=merge_walls)
     door_parent.parent = parent
     
-    for i in range(0, len(door_verts)):
-        roomname = "Door_Walls"+str(i)
-        obj = create_custom_mesh(
-            roomname, door_verts[i], door_faces[i], pos=[0,0,-1-2.1], rot=rot, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1)))
-        obj.parent = door_parent
-    
-    obj = bpy.context.scene.objects["Door_Walls"]
-    bpy.context.view_layer.objects.active = obj
-    
-    for i in obj.children:
-        i.select_set(True)
-    bpy.ops.object.editmode_toggle()
-    
-    bpy.ops.mesh.extrude_context_move(
-    TRANSFORM_OT_translate={"value":(-0, -0, (2.5-2.1))}
-    )
-    
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.select_all(action='DESELECT')
-    
-    '''
-    '''
     path_to_window_verts_file = program_path +"/" + base_path + "windows_verts"
     path_to_window_faces_file = program_path +"/" + base_path + "windows_faces"
     window_verts = read_from_file(path_to_window_verts_file)
     window_faces = read_from_file(path_to_window_faces_file)
-    
-    # Create parent
-    win_wall_parent, win_wall_parent_mesh = init_object("Window_Walls")
+    win_wall_parent = create_walls("Window_Walls", window_verts, window_faces, 2.5-2.15, [0,0,-1-1.15-1], rot, cen, wall_mat, merged=merge_walls)
     win_wall_parent.parent = parent
     
-    for i in range(0, len(window_verts)):
-        roomname = "Window_Walls"+str(i)
-        obj = create_custom_mesh(
-            roomname, window_verts[i], window_faces[i], pos=[0,0,-1-1.15-1], rot=rot, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1)))
-        obj.parent = win_wall_parent
-    
-    obj = bpy.context.scene.objects["Window_Walls"]
-    bpy.context.view_layer.objects.active = obj
-    
-    for i in obj.children:
-        i.select_set(True)
-    bpy.ops.object.editmode_toggle()
-    
-    bpy.ops.mesh.extrude_context_move(
-    TRANSFORM_OT_translate={"value":(-0, -0, (2.5-2.15))}
-    )
-    
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.select_all(action='DESELECT')
-    
-    
-    window_verts = read_from_file(path_to_window_verts_file)
-    window_faces = read_from_file(path_to_window_faces_file)
-    
-    # Create parent
-    bot_win_wall_parent, bot_win_wall_parent_mesh = init_object("Bot_Window_Walls")
+    bot_win_wall_parent = create_walls("Bot_Window_Walls", window_verts, window_faces, 1.15, [0,0,-1], rot, cen, wall_mat, merged=merge_walls)
     bot_win_wall_parent.parent = parent
     
-    for i in range(0, len(window_verts)):
-        roomname = "Bot_Window_Walls"+str(i)
-        obj = create_custom_mesh(
-            roomname, window_verts[i], window_faces[i], pos=[0,0,-1], rot=rot, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1)))
-        obj.parent = bot_win_wall_parent
-    
-    obj = bpy.context.scene.objects["Bot_Window_Walls"]
-    bpy.context.view_layer.objects.active = obj
-    
-    for i in obj.children:
-        i.select_set(True)
-    bpy.ops.object.editmode_toggle()
-    
-    bpy.ops.mesh.extrude_context_move(
-    TRANSFORM_OT_translate={"value":(-0, -0, 1.15)}
-    )
-    
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.select_all(action='DESELECT')
-    
     pos[2] = -1
     '''
     Create Floor
@@ -607,47 +523,32 @@ def load_file(file_name, voxel_size=0.02):
     inds = ME.utils.sparse_quantize(quantized_coords, return_index=True)
     return quantized_coords[inds]*0.02, feats[inds], pcd
 '''
+def plan_polygons():
+    '''
+    Plan polygons
+    Room outlines, object boxes and room contents of the built scene,
+    as utils.scene_file.Scene.from_polygons takes them
+    @Return Rooms, BB, Inf
+    '''
+    Rooms = {}
+    Inf = {}
+    for i in bpy.data.objects['Rooms'].children:
+        Rooms[i.name] = [list(t) for t in Mesh_vectors(i)]
+        Inf[i.name] = [[int(j.split('s')[1]) for j in Room_Door_List(i.name)],
+                       [int(j.split('s')[1]) for j in Room_Window_List(i.name)],
+                       Room_Object_List(i.name)]
+    BB = {}
+    for i in bpy.data.objects['Objects'].children:
+        BB[i.name] = Bounding_Box(i)
+    for j in list(bpy.data.objects['Doors'].children) + list(bpy.data.objects['Windows'].children):
+        BB[j.name] = Bounding_Children_Box(j)
+    return Rooms, BB, Inf
+
 # Start
 if __name__ == "__main__":
-    main(sys.argv)
+    with span('scene_build'):
+        main(sys.argv)
     global directory
     directory = sys.argv[5]+'/'
-    os.remove(directory+"rooms.txt")
-    os.remove(directory+"rooms_info.txt")
-    os.remove(directory+"objects.txt")
-    text_file = open(directory+"rooms.txt","w")
-    tf_room_info = open(directory+"rooms_info.txt","w")
-    for i in bpy.data.objects['Rooms'].children:
-        X,Y,Z = Mesh_vectors(i)
-        for t in [X,Y,Z]:
-            text_file.write(i.name+',')
-            for no,j in enumerate(t):
-                if no == len(t)-1:
-                    n = text_file.write(str(j)+'\n')
-                else:
-                    text_file.write(str(j)+',')
-        tf_room_info.write(i.name+'\n')
-        Door_nos = [tf_room_info.write(i.split('s')[1]+',') for i in Room_Door_List(i.name)]
-        tf_room_info.write('\n')
-        Window_nos = [tf_room_info.write(i.split('s')[1]+',') for i in Room_Window_List(i.name)]
-        tf_room_info.write('\n')
-        Obj_nos = [tf_room_info.write(i+',') for i in Room_Object_List(i.name)]
-        tf_room_info.write('\n')
-    tf_room_info.close()  
-    text_file.close()
-    text_file = open(directory+"objects.txt","w")
-    for i in bpy.data.objects['Objects'].children:
-        xmin,ymin,zmin,xmax,ymax,zmax = Bounding_Box(i)
-        text_file.write(i.name+',')
-        n = text_file.write(str(xmin)+','+str(ymin)+','+str(zmin)+','+str(xmax)+','+str(ymax)+','+str(zmax)+'\n')
-    for j in bpy.data.objects['Doors'].children:
-        xmin,ymin,zmin,xmax,ymax,zmax = Bounding_Children_Box(j)
-        text_file.write(j.name+',')
-        n = text_file.write(str(xmin)+','+str(ymin)+','+str(zmin)+','+str(xmax)+','+str(ymax)+','+str(zmax)+'\n')
-    for k in bpy.data.objects['Windows'].children:
-        xmin,ymin,zmin,xmax,ymax,zmax = Bounding_Children_Box(k)
-        text_file.write(k.name+',')
-        n = text_file.write(str(xmin)+','+str(ymin)+','+str(zmin)+','+str(xmax)+','+str(ymax)+','+str(zmax)+'\n')
-    text_file.close()
+    write_scene(directory, Scene.from_polygons(*plan_polygons()))
     exit(0)
-    
\ No newline at end of file
@@ -5,15 +5,12 @@ import json
 import sys
 import math
 import mathutils
-from shapely.geometry import Polygon, Point
 from mathutils import Matrix, Vector
 from archimesh.door_window_automation import *
-import skimage
-from skimage import io
-os.environ["OPENCV_IO_ENABLE_OPENEXR"]="1"
-import open3d as o3d
-import cv2
-import pickle
+# Blender does not put the script folder on sys.path, realpath follows job dir symlinks
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from utils.telemetry import span
+from utils.annotation_utils import Annotate_Using_dd_list
 
 def Mesh_vectors(obj):
     o = obj
@@ -294,27 +291,9 @@ def Labelled_List(pnts,roomname):
         pcd_labels.append(objects[selected_obj_ind].name)
     return pcd_labels
 
-def Annotate_Using_dd_list(Upsampled,Downsampled,ll):
-    batch_size = 1000
-    iters = len(Upsampled)/batch_size
-    L = len(Downsampled)
-    annotated = np.repeat(np.array([Downsampled]),batch_size,axis=0).swapaxes(0,1)
-    Labels_up = []
-
-    for i in range(int(np.floor(iters))+1):
-        batch = Upsampled[batch_size*i:batch_size*(i+1)]
-        batch = np.repeat(np.array([batch]),L,axis=0)
-        if i == int(np.floor(iters)):
-            annotated = np.repeat(np.array([Downsampled]),len(Upsampled[batch_size*i:batch_size*(i+1)]),axis=0).swapaxes(0,1)
-        dists = (batch - annotated)**2
-        dists = np.sum(dists,axis=2)
-        inds = np.argmin(dists,axis=0)
-        Labels_up.append(ll[inds])
-    Labels_up = np.hstack(Labels_up)
-    return Labels_up
-
 '''
 def Box_Annotate(pnts,roomname):
+    import open3d as o3d
     D = bpy.data
     pcd = o3d.utility.Vector3dVector(pnts) 
     bpy.ops.object.select_all(action='DESELECT')
@@ -362,21 +341,30 @@ def Box_Annotate(pnts,roomname):
 '''           
 
 def main(name):
-    name = name[0:len(name)-8]
+    label_plan(name[0:len(name)-8])
+    exit(0)
+
+def label_plan(name):
+    '''
+    Label the downsampled points of every room of a plan folder
+    @Param name, plan folder, _Plan_<n> without the _a.blend
+    '''
+    import open3d as o3d
     rooms = [i for i in os.listdir(name+'/')]
     for i in rooms:
-        with open(name+'/'+i+'/'+i+'_downsampled.npy', 'rb') as f:
-            pnts = np.load(f)
-        downsampledpcd = o3d.geometry.PointCloud()
-        downsampledpcd.points = o3d.utility.Vector3dVector(pnts)
-        downpcd = downsampledpcd.voxel_down_sample(voxel_size=0.05)
-        ll = np.array(Labelled_List(np.asarray(downpcd.points),i))
-        with open(name+'/'+i+'/'+i+'_labels_norm.npy', 'wb') as f:
-            np.save(f, ll)
-        ll_up = Annotate_Using_dd_list(pnts,np.asarray(downpcd.points),ll)
-        with open(name+'/'+i+'/'+i+'_labels.npy', 'wb') as f:
-            np.save(f, ll_up)
-    exit(0)
+        with span('labeling', rooms=1) as counts:
+            with open(name+'/'+i+'/'+i+'_downsampled.npy', 'rb') as f:
+                pnts = np.load(f)
+            downsampledpcd = o3d.geometry.PointCloud()
+            downsampledpcd.points = o3d.utility.Vector3dVector(pnts)
+            downpcd = downsampledpcd.voxel_down_sample(voxel_size=0.05)
+            ll = np.array(Labelled_List(np.asarray(downpcd.points),i))
+            with open(name+'/'+i+'/'+i+'_labels_norm.npy', 'wb') as f:
+                np.save(f, ll)
+            ll_up = Annotate_Using_dd_list(pnts,np.asarray(downpcd.points),ll)
+            with open(name+'/'+i+'/'+i+'_labels.npy', 'wb') as f:
+                np.save(f, ll_up)
+            counts['points'] = len(pnts)
     
 if __name__ == "__main__":
     
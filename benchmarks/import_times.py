@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import subprocess
+
+from benchmarks.run_benchmarks import ROOT, git_commit, read_results
+
+'''
+Import times
+Startup cost of the pipeline entry points, measured with python -X importtime in a
+fresh interpreter, so every Blender launch and worker spawn can be budgeted.
+
+Python entry points are imported with the interpreter running this script. Blender
+scripts are loaded as modules (their __main__ block is not run) inside
+blender --background with PYTHONPROFILEIMPORTTIME=1, so they need config.blender_install_path.
+
+Every entry point reports the total and the modules it imports directly, heaviest
+first, with their cumulative time. Modules the bare interpreter imports on startup
+are left out. Results are appended to
+benchmarks/import_times.jsonl and compared with the last result of another commit.
+
+Usage:
+python -m benchmarks.import_times
+python -m benchmarks.import_times --entries FloorplanToSTL generate --budget FloorplanToSTL=1500 --fail-on-regression
+'''
+
+RESULTS = os.path.join(ROOT, 'benchmarks', 'import_times.jsonl')
+
+# name -> (python module or Blender script)
+ENTRY_POINTS = {'FloorplanToSTL': ('python', 'FloorplanToSTL'),
+                'generate': ('python', 'utils.FloorplanToBlenderLib.generate'),
+                'batch_runner': ('python', 'utils.batch_runner'),
+                'virtual_scan': ('python', 'utils.virtual_scan'),
+                'svg_utils': ('python', 'utils.loaders.svg_utils'),
+                'Placement_Info': ('blender', 'Placement_Info.py'),
+                'render': ('blender', 'floorplan_to_PointClouds_in_blender.py'),
+                'annotate': ('blender', 'annotate-Blocky.py'),
+                'single_session': ('blender', 'single_session.py')}
+
+BLENDER_LOAD = '''
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location("entry_point", %r)
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+sys.exit(0)
+'''
+
+def parse_importtime(text):
+    '''
+    Records of -X importtime output
+    @Return list of (depth, module, self us, cumulative us), in output order
+    '''
+    records = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_us, cumulative = int(fields[0]), int(fields[1])
+        except (ValueError, IndexError):
+            # header line
+            continue
+        name = fields[2]
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        records.append((depth, name.strip(), self_us, cumulative))
+    return records
+
+def run_imports(kind, code):
+    '''
+    Run code with import profiling in a fresh python or Blender
+    @Return process, seconds, import records
+    '''
+    env = dict(os.environ, PYTHONPROFILEIMPORTTIME='1')
+    if kind == 'python':
+        cmd = [sys.executable, '-X', 'importtime', '-c', code]
+    else:
+        import config
+        cmd = [config.blender_install_path, '--background', '--python-use-system-env', '--python-expr', code]
+    start = time.time()
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return proc, time.time() - start, parse_importtime(proc.stderr.decode(errors='replace'))
+
+_startup = {}
+
+def startup_modules(kind):
+    '''
+    Modules the bare interpreter imports before any entry point code
+    '''
+    if kind not in _startup:
+        proc, seconds, records = run_imports(kind, 'import sys; sys.exit(0)')
+        _startup[kind] = set(name for depth, name, s, cumulative in records)
+    return _startup[kind]
+
+def measure(entry):
+    '''
+    Import an entry point in a fresh process
+    @Return dict total_ms, wall_ms, top (list of [module, cumulative ms]), error
+    '''
+    kind, target = ENTRY_POINTS[entry]
+    code = 'import ' + target if kind == 'python' else BLENDER_LOAD % os.path.join(ROOT, target)
+    proc, wall, records = run_imports(kind, code)
+    startup = startup_modules(kind)
+    records = [r for r in records if r[1] not in startup]
+    total = sum(cumulative for depth, name, s, cumulative in records if depth == 0) / 1000.0
+    # what the entry point imports itself, one level below a python entry module
+    level = 1 if kind == 'python' else 0
+    top = sorted([[name, cumulative/1000.0] for depth, name, s, cumulative in records if depth == level],
+                 key=lambda i: -i[1])
+    error = None
+    if proc.returncode != 0:
+        error = proc.stderr.decode(errors='replace').strip().splitlines()[-1:] or ['exit ' + str(proc.returncode)]
+        error = error[0]
+    return {'total_ms': total, 'wall_ms': wall*1000.0, 'top': top, 'error': error}
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Import time of the pipeline entry points")
+    parser.add_argument('--entries', nargs='*', default=[i for i in ENTRY_POINTS if ENTRY_POINTS[i][0] == 'python'],
+                        choices=sorted(ENTRY_POINTS), help="default: the entry points that need no Blender")
+    parser.add_argument('--top', type=int, default=8, help="modules listed per entry point")
+    parser.add_argument('--budget', action='append', default=[], help="<entry>=<ms>, total import time allowed")
+    parser.add_argument('--results', default=RESULTS)
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown of the total")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    budgets = dict((i.split('=')[0], float(i.split('=')[1])) for i in args.budget)
+    commit, dirty = git_commit()
+    history = read_results(args.results)
+    failed = []
+    for entry in args.entries:
+        record = measure(entry)
+        record.update({'entry': entry, 'commit': commit, 'dirty': dirty, 'date': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        line = "%-16s %9.1f ms imports %9.1f ms process" % (entry, record['total_ms'], record['wall_ms'])
+        previous = [r for r in history if r['entry'] == entry and r['commit'] != commit and not r.get('error')]
+        if previous and previous[-1]['total_ms'] > 0 and not record['error']:
+            ratio = record['total_ms'] / previous[-1]['total_ms']
+            line += "  x%.2f vs %s" % (ratio, previous[-1]['commit'][:8])
+            if ratio > 1 + args.threshold:
+                line += "  REGRESSION"
+                failed.append(entry)
+        if entry in budgets and record['total_ms'] > budgets[entry]:
+            line += "  OVER BUDGET %.0f ms" % budgets[entry]
+            failed.append(entry)
+        if record['error']:
+            line += "  ERROR " + record['error']
+        print(line)
+        for name, ms in record['top'][:args.top]:
+            print("    %-40s %9.1f ms" % (name, ms))
+        sys.stdout.flush()
+    if failed and args.fail_on_regression:
+        exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
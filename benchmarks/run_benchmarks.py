@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import tempfile
+import subprocess
+
+'''
+Benchmarks
+Times the non-Blender hot paths of the pipeline on synthetic CubiCasa style plans
+(benchmarks/synthetic_svg.py) and keeps the results per git commit, so slowdowns
+show up before a full CubiCasa5k run.
+
+Cases:
+generate_svg_plan     utils.FloorplanToBlenderLib.generate.generate_svg_plan
+house                 utils.loaders.house.House construction
+get_polygons          utils.post_prosessing.get_polygons on stored prediction tensors
+add_objects_to_room   utils.Placement_utils.add_objects_to_room
+annotate_dd_list      utils.annotation_utils.Annotate_Using_dd_list
+
+Usage:
+python -m benchmarks.run_benchmarks --sizes small medium --repeats 3
+python -m benchmarks.run_benchmarks --rooms 20 --doors 10 --cases house get_polygons
+
+Every run appends to benchmarks/results.jsonl and compares each case with the
+last result of another commit. A median slower by more than --threshold is
+reported as a regression, --fail-on-regression turns that into exit code 1.
+A case that raises exits with code 2 after all cases ran.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results.jsonl')
+
+# rooms, doors, windows, icons, points of one room for the label transfer
+# Annotate_Using_dd_list holds three points/6 x 1000 x 3 float64 arrays per batch,
+# about 12 kB per point, so 60000 points need some 720 MB
+SIZES = {'small': {'rooms': 4, 'doors': 3, 'windows': 4, 'icons': 2, 'points': 20000},
+         'medium': {'rooms': 12, 'doors': 12, 'windows': 10, 'icons': 8, 'points': 40000},
+         'large': {'rooms': 36, 'doors': 40, 'windows': 30, 'icons': 24, 'points': 60000}}
+
+CASES = ['generate_svg_plan', 'house', 'get_polygons', 'add_objects_to_room', 'annotate_dd_list']
+
+def git_commit():
+    '''
+    Current commit and whether the tree has local changes
+    '''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT).decode().strip() != ''
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+def timeit(fn, repeats, setup=None):
+    '''
+    Time fn repeats times, setup runs untimed before every call
+    @Return list of seconds
+    '''
+    times = []
+    for i in range(repeats):
+        if setup is not None:
+            setup(i)
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+def bench_generate_svg_plan(case_dir, plan, params, repeats):
+    from utils.FloorplanToBlenderLib import generate
+    from utils.loaders import svg_cache
+    work = os.path.join(case_dir, 'generate')
+    os.makedirs(work, exist_ok=True)
+    svg = os.path.join(case_dir, 'model.svg')
+    png = os.path.join(case_dir, 'F1_scaled.png')
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        def setup(i):
+            # every call writes a new Data/<n>/, start from an empty folder
+            shutil.rmtree('Data', ignore_errors=True)
+            # time the npz load, not the in memory copy of the last repeat
+            svg_cache.clear_memory()
+        return timeit(lambda: generate.generate_svg_plan(png, svg, False), repeats, setup)
+    finally:
+        os.chdir(cwd)
+
+def bench_house(case_dir, plan, params, repeats):
+    from utils.loaders.house import House
+    from utils.loaders import svg_cache
+    svg = os.path.join(case_dir, 'model.svg')
+    return timeit(lambda: House(svg, plan['height'], plan['width']), repeats, lambda i: svg_cache.clear_memory())
+
+def load_predictions(case_dir, plan, params):
+    '''
+    Prediction tensors (heatmaps, rooms, icons) for get_polygons
+    Taken from params['predictions'] when given, else made once from the House
+    ground truth of the plan and stored in the case folder
+    '''
+    import numpy as np
+    path = params.get('predictions') or os.path.join(case_dir, 'predictions.npz')
+    if not os.path.isfile(path):
+        from utils.loaders.house import House
+        house = House(os.path.join(case_dir, 'model.svg'), plan['height'], plan['width'])
+        heatmaps = house.get_heatmaps()
+        rooms = np.eye(12)[house.walls].transpose(2, 0, 1)
+        icons = np.eye(11)[house.icons].transpose(2, 0, 1)
+        np.savez_compressed(path, heatmaps=heatmaps, rooms=rooms, icons=icons)
+    data = np.load(path)
+    return data['heatmaps'], data['rooms'], data['icons']
+
+def bench_get_polygons(case_dir, plan, params, repeats):
+    from utils.post_prosessing import get_polygons
+    predictions = load_predictions(case_dir, plan, params)
+    return timeit(lambda: get_polygons(predictions, 0.2, [1, 2]), repeats)
+
+def write_placement_scene(folder, plan, scale=100.0):
+    '''
+    scene.json as Placement_Info.py writes it, made from the synthetic plan instead
+    of a Blender scene
+    @Return room names
+    '''
+    from utils.scene_file import SceneRoom, Scene, write_scene
+    wall = plan['wall']
+
+    def touches(rect, room):
+        x0, y0, x1, y1 = room
+        return rect[0] <= x1 + wall and rect[2] >= x0 - wall and rect[1] <= y1 + wall and rect[3] >= y0 - wall
+
+    boxes = {}
+    for k, (x0, y0, x1, y1) in enumerate(plan['doors']):
+        boxes['Door%d' % k] = [x0/scale, y0/scale, 0.0, x1/scale, y1/scale, 2.1]
+    for k, (x0, y0, x1, y1) in enumerate(plan['windows']):
+        boxes['Window%d' % k] = [x0/scale, y0/scale, 1.15, x1/scale, y1/scale, 2.15]
+
+    counts = {}
+    rooms = []
+    for room, (x0, y0, x1, y1) in plan['rooms']:
+        # Blender style names, Bedroom, Bedroom.001, ...
+        n = counts.get(room, 0)
+        counts[room] = n + 1
+        name = room if n == 0 else room + '.%03d' % n
+        polygon = [[x0/scale, x1/scale, x1/scale, x0/scale], [y0/scale, y0/scale, y1/scale, y1/scale], [0.0]*4]
+        rect = (x0, y0, x1, y1)
+        rooms.append(SceneRoom(name, polygon,
+                               [k for k, d in enumerate(plan['doors']) if touches(d, rect)],
+                               [k for k, w in enumerate(plan['windows']) if touches(w, rect)], []))
+    write_scene(folder, Scene(rooms, boxes))
+    return [r.name for r in rooms]
+
+def bench_add_objects_to_room(case_dir, plan, params, repeats):
+    import numpy as np
+    import utils.Placement_utils as pl
+    folder = os.path.join(case_dir, 'placement')
+    os.makedirs(folder, exist_ok=True)
+    shutil.copy(os.path.join(ROOT, 'object_boundbox.txt'), folder)
+    names = write_placement_scene(folder, plan)
+    config = types.SimpleNamespace(program_path=folder)
+    rooms = [i for i in names if i.split('.')[0] in pl.Room_add_list]
+
+    def run():
+        for i in rooms:
+            pl.add_objects_to_room(i, config)
+    return timeit(run, repeats, lambda i: np.random.seed(i))
+
+def bench_annotate_dd_list(case_dir, plan, params, repeats):
+    import numpy as np
+    from utils.annotation_utils import Annotate_Using_dd_list
+    rnd = np.random.RandomState(0)
+    n = params['points']
+    upsampled = rnd.rand(n, 3) * [plan['width']/100.0, plan['height']/100.0, 2.5]
+    # the labeler works on a 0.05 voxel grid of the 0.02 downsampled cloud, about 1/6 of the points
+    downsampled = upsampled[rnd.choice(n, max(1, n//6), replace=False)]
+    labels = rnd.randint(0, 10, len(downsampled))
+    return timeit(lambda: Annotate_Using_dd_list(upsampled, downsampled, labels), repeats)
+
+BENCHES = {'generate_svg_plan': bench_generate_svg_plan,
+           'house': bench_house,
+           'get_polygons': bench_get_polygons,
+           'add_objects_to_room': bench_add_objects_to_room,
+           'annotate_dd_list': bench_annotate_dd_list}
+
+def run_case(case, size, params, repeats, work_dir):
+    '''
+    Run one benchmark case on one plan size
+    @Return result record
+    '''
+    from benchmarks.synthetic_svg import write_plan
+    case_dir = os.path.join(work_dir, size)
+    plan_params = {k: params[k] for k in ['rooms', 'doors', 'windows', 'icons', 'seed'] if k in params}
+    plan = write_plan(case_dir, **plan_params)
+    record = {'case': case, 'size': size, 'params': params, 'repeats': repeats}
+    try:
+        times = sorted(BENCHES[case](case_dir, plan, params, repeats))
+        record.update({'min': times[0], 'median': times[len(times)//2], 'mean': sum(times)/len(times), 'error': None})
+    except Exception as e:
+        record.update({'min': None, 'median': None, 'mean': None, 'error': type(e).__name__ + ': ' + str(e)})
+    return record
+
+def read_results(path=RESULTS):
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(i) for i in f if i.strip()]
+
+def compare(record, history, threshold):
+    '''
+    Compare a result with the last result of the same case and size from another commit
+    @Return (previous record, ratio) or (None, None)
+    '''
+    previous = [r for r in history if r['case'] == record['case'] and r['size'] == record['size']
+                and r['params'] == record['params'] and r['commit'] != record['commit'] and r.get('median')]
+    if not previous or not record.get('median'):
+        return None, None
+    prev = previous[-1]
+    return prev, record['median'] / prev['median']
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmarks of the non-Blender pipeline stages")
+    parser.add_argument('--cases', nargs='*', default=CASES, choices=CASES)
+    parser.add_argument('--sizes', nargs='*', default=['small', 'medium'], choices=sorted(SIZES))
+    parser.add_argument('--rooms', type=int, help="custom plan instead of --sizes")
+    parser.add_argument('--doors', type=int)
+    parser.add_argument('--windows', type=int)
+    parser.add_argument('--icons', type=int)
+    parser.add_argument('--points', type=int, default=40000)
+    parser.add_argument('--predictions', help="npz with heatmaps, rooms, icons for get_polygons")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--results', default=RESULTS)
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown of the median")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--keep', help="keep the generated plans in this folder")
+    args = parser.parse_args(argv)
+
+    if args.rooms:
+        sizes = {'custom': {'rooms': args.rooms, 'doors': args.doors, 'windows': args.windows,
+                            'icons': args.icons, 'points': args.points}}
+    else:
+        sizes = {k: dict(SIZES[k]) for k in args.sizes}
+    if args.predictions:
+        for k in sizes:
+            sizes[k]['predictions'] = os.path.abspath(args.predictions)
+
+    sys.path.insert(0, ROOT)
+    commit, dirty = git_commit()
+    history = read_results(args.results)
+    work_dir = args.keep or tempfile.mkdtemp(prefix='floorplan_bench_')
+    regressions = []
+    errors = []
+    try:
+        for size, params in sizes.items():
+            for case in args.cases:
+                record = run_case(case, size, params, args.repeats, work_dir)
+                record.update({'commit': commit, 'dirty': dirty, 'date': time.strftime('%Y-%m-%dT%H:%M:%S')})
+                with open(args.results, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+                prev, ratio = compare(record, history, args.threshold)
+                line = "%-20s %-7s " % (case, size)
+                if record['error']:
+                    line += "ERROR " + record['error']
+                    errors.append(record)
+                else:
+                    line += "median %9.4f s  min %9.4f s" % (record['median'], record['min'])
+                if ratio is not None:
+                    line += "  x%.2f vs %s" % (ratio, prev['commit'][:8])
+                    if ratio > 1 + args.threshold:
+                        line += "  REGRESSION"
+                        regressions.append(record)
+                print(line)
+                sys.stdout.flush()
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if errors:
+        exit(2)
+    if regressions and args.fail_on_regression:
+        exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,136 @@
+import os
+import math
+import random
+
+'''
+Synthetic plans
+Writes CubiCasa5k style model.svg floorplans of controllable size, plus the
+F1_scaled.png the SVG pipeline reads next to it, with the walls drawn in black so
+the floor outline is found.
+
+Rooms are laid out on a grid, every cell edge is one wall polygon. Doors are put
+on interior walls, windows on exterior walls and closets in the room corners,
+with the same tags and classes as CubiCasa5k (g#Wall, g#Door, g#Window,
+"Space <type>", "FixedFurniture <type>" with a BoundaryPolygon).
+'''
+
+ROOM_TYPES = ['Bedroom', 'LivingRoom', 'Kitchen', 'Bath', 'Entry', 'Storage']
+
+def _points(pts):
+    # CubiCasa point lists end with a space, get_points drops the last token
+    return ' '.join(str(x)+','+str(y) for x, y in pts) + ' '
+
+def _rect(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+def plan_layout(rooms, room_w=300, room_h=250, wall=10, margin=50):
+    '''
+    Grid for the wanted number of rooms
+    @Return cols, rows, image width, image height
+    '''
+    cols = int(math.ceil(math.sqrt(rooms)))
+    rows = int(math.ceil(rooms / float(cols)))
+    width = 2*margin + cols*room_w + wall
+    height = 2*margin + rows*room_h + wall
+    return cols, rows, width, height
+
+def make_svg(rooms=6, doors=None, windows=None, icons=None, seed=0,
+             room_w=300, room_h=250, wall=10, margin=50):
+    '''
+    Make synthetic plan
+    @Param rooms, number of rooms
+    @Param doors, number of doors, default one per room, capped by the interior walls
+    @Param windows, number of windows, default one per room, capped by the exterior walls
+    @Param icons, number of closets, default one per room
+    @Param seed, for room types and door/window positions
+    @Return svg text, image width, image height, plan dict with the rectangles of rooms, doors and windows
+    '''
+    rnd = random.Random(seed)
+    doors = rooms if doors is None else doors
+    windows = rooms if windows is None else windows
+    icons = rooms if icons is None else icons
+    cols, rows, width, height = plan_layout(rooms, room_w, room_h, wall, margin)
+    cells = [(c, r) for r in range(rows) for c in range(cols)][:rooms]
+    occupied = set(cells)
+
+    # one wall per cell edge, shared edges once
+    edges = {}
+    for c, r in cells:
+        for edge, outside in [(('h', c, r), (c, r-1)), (('h', c, r+1), (c, r+1)),
+                              (('v', c, r), (c-1, r)), (('v', c+1, r), (c+1, r))]:
+            interior = outside in occupied
+            edges[edge] = edges.get(edge, False) or interior
+
+    def edge_rect(edge):
+        kind, c, r = edge
+        x = margin + c*room_w
+        y = margin + r*room_h
+        if kind == 'h':
+            return _rect(x, y, x + room_w + wall, y + wall)
+        return _rect(x, y, x + wall, y + room_h + wall)
+
+    def opening_rect(edge, size, kind_name):
+        kind, c, r = edge
+        x = margin + c*room_w
+        y = margin + r*room_h
+        if kind == 'h':
+            s = x + wall + rnd.randint(20, room_w - size - 20)
+            rect = (s, y, s + size, y + wall)
+        else:
+            s = y + wall + rnd.randint(20, room_h - size - 20)
+            rect = (x, s, x + wall, s + size)
+        plan[kind_name].append(rect)
+        return _rect(*rect)
+
+    interior = [e for e in sorted(edges) if edges[e]]
+    exterior = [e for e in sorted(edges) if not edges[e]]
+    plan = {'rooms': [], 'doors': [], 'windows': [], 'walls': [], 'wall': wall}
+    door_edges = set(rnd.sample(interior, min(doors, len(interior))))
+    window_edges = set(rnd.sample(exterior, min(windows, len(exterior))))
+
+    out = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d">' % (width, height),
+           '<g id="Model" class="Model">',
+           '<g class="Floor">']
+    for edge in sorted(edges):
+        cls = "Wall" if edges[edge] else "Wall External"
+        plan['walls'].append(edge_rect(edge))
+        out.append('<g id="Wall" class="%s"><polygon points="%s"/>' % (cls, _points(edge_rect(edge))))
+        if edge in door_edges:
+            out.append('<g id="Door" class="Door Swing Beside"><polygon points="%s"/></g>' % _points(opening_rect(edge, 80, 'doors')))
+        if edge in window_edges:
+            out.append('<g id="Window" class="Window Regular"><polygon points="%s"/></g>' % _points(opening_rect(edge, 100, 'windows')))
+        out.append('</g>')
+
+    for n, (c, r) in enumerate(cells):
+        x = margin + c*room_w + wall
+        y = margin + r*room_h + wall
+        room = ROOM_TYPES[n % len(ROOM_TYPES)]
+        rect = (x, y, x + room_w - wall, y + room_h - wall)
+        plan['rooms'].append((room, rect))
+        out.append('<g class="Space %s "><polygon points="%s"/></g>' % (room, _points(_rect(*rect))))
+        if n < icons:
+            out.append('<g class="FixedFurniture Closet " transform="matrix(1,0,0,1,%d,%d)">' % (x + 5, y + 5) +
+                       '<g class="BoundaryPolygon"><polygon points="%s"/></g></g>' % _points(_rect(0, 0, 60, 40)))
+    out += ['</g>', '</g>', '</svg>']
+    return '\n'.join(out), width, height, plan
+
+def write_plan(folder, **kwargs):
+    '''
+    Write model.svg and F1_scaled.png, white with the walls of the plan in black, into folder
+    @Param kwargs, passed to make_svg
+    @Return plan dict of make_svg
+    '''
+    import numpy as np
+    import cv2
+    os.makedirs(folder, exist_ok=True)
+    svg, width, height, plan = make_svg(**kwargs)
+    with open(os.path.join(folder, 'model.svg'), 'w') as f:
+        f.write(svg)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    # detect.detectOuterContours needs the outline of the plan
+    cv2.fillPoly(img, [np.array(i, dtype=np.int32) for i in plan['walls']], (0, 0, 0))
+    cv2.imwrite(os.path.join(folder, 'F1_scaled.png'), img)
+    plan['width'] = width
+    plan['height'] = height
+    return plan
@@ -0,0 +1,112 @@
+import bpy
+import os
+import sys
+import time
+import runpy
+import traceback
+from multiprocessing.connection import Listener
+
+'''
+Blender worker
+
+Long lived background Blender that runs the pipeline scripts
+(Placement_Info.py, floorplan_to_PointClouds_in_blender.py, annotate-Blocky.py)
+on request. The heavy imports of those scripts (open3d, cv2, skimage, archimesh)
+stay in sys.modules between jobs, so only the first job pays for them.
+
+Start it with
+blender -noaudio --background --python blender_worker.py -- <host> <port> <authkey>
+and send jobs through utils.blender_service.BlenderWorker.
+
+A job is a dict {'script': path, 'args': [...], 'cwd': path, 'env': {...}}.
+Before every job the scene is reset to the startup file, and sys.argv is laid
+out exactly as for a cold launch, so the scripts can keep reading sys.argv[5:].
+'''
+
+def reset_scene():
+    '''
+    Reset scene
+    Load the startup file again, same state as a freshly launched Blender
+    '''
+    bpy.ops.wm.read_homefile()
+
+def run_job(job):
+    '''
+    Run job
+    Execute one pipeline script as __main__ inside this Blender session
+    @Param job, dict with script, args, cwd and env
+    @Return dict with returncode, error and time
+    '''
+    start = time.time()
+    script = job['script']
+    old_argv = sys.argv
+    old_cwd = os.getcwd()
+    old_env = {k: os.environ.get(k) for k in job.get('env', {})}
+
+    reset_scene()
+    sys.argv = [bpy.app.binary_path, "-noaudio", "--background", "--python", script] + list(job.get('args', []))
+    os.environ.update(job.get('env', {}))
+    if job.get('cwd'):
+        os.chdir(job['cwd'])
+
+    returncode = 0
+    error = None
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        # the pipeline scripts end with exit(0)
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            returncode = 1
+            error = str(e.code)
+    except Exception:
+        returncode = 1
+        error = traceback.format_exc()
+    finally:
+        sys.argv = old_argv
+        os.chdir(old_cwd)
+        for k, v in old_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    if error is not None:
+        print(error)
+    sys.stdout.flush()
+    return {'returncode': returncode, 'error': error, 'time': time.time() - start}
+
+def main(argv):
+    if "--" not in argv:
+        print("Usage: blender --background --python blender_worker.py -- <host> <port> <authkey>")
+        exit(1)
+    host, port, authkey = argv[argv.index("--") + 1:][:3]
+
+    listener = Listener((host, int(port)), authkey=authkey.encode())
+    print("Blender worker listening on " + host + ":" + str(port))
+    sys.stdout.flush()
+
+    while True:
+        conn = listener.accept()
+        try:
+            while True:
+                try:
+                    job = conn.recv()
+                except EOFError:
+                    break
+                # None is the shutdown request
+                if job is None:
+                    conn.send({'returncode': 0, 'error': None, 'time': 0})
+                    listener.close()
+                    return
+                conn.send(run_job(job))
+        finally:
+            conn.close()
+
+# Start
+if __name__ == "__main__":
+    main(sys.argv)
+    exit(0)
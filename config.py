@@ -10,4 +10,23 @@ blender_script_path_pc = program_path+"/floorplan_to_PointClouds_in_blender.py"
 SR_scale = 2
 SR_method = 'lapsrn'
 
-CubiCasa = True
\ No newline at end of file
+CubiCasa = True
+# Keep one background Blender alive and send it every stage instead of relaunching
+blender_worker = False
+blender_worker_script = program_path+"/blender_worker.py"
+# Skip pipeline stages whose inputs did not change, outputs are copied to stage_cache_path and never evicted
+stage_cache = False
+stage_cache_path = program_path+"/.stage_cache"
+# Write per stage timing records to program_path/telemetry.jsonl, summarize with python -m utils.telemetry <dir>
+telemetry = True
+# Run placement, render and annotation of a plan in one Blender session, without .blend files in between
+single_session = False
+# Sample the room point clouds by ray casting the plan on CPU instead of rendering them in Blender
+virtual_scan = False
+# Pixel stride of the virtual scan camera, 1 casts all 640x480 rays per frame
+virtual_scan_stride = 1
+# With virtual_scan, read the placement input from the Data files instead of building the scene in Blender
+python_placement = True
+# Append every finished room to training shards in dataset_shards_path, see utils.dataset_shards
+dataset_shards = False
+dataset_shards_path = program_path+"/Shards"
@@ -7,11 +7,13 @@ import math
 import mathutils
 from mathutils import Matrix, Vector
 from archimesh.door_window_automation import *
-import skimage
-from skimage import io
+# cv2 reads EXR depth maps only with this set before its import, open3d, cv2 and skimage are imported where used
 os.environ["OPENCV_IO_ENABLE_OPENEXR"]="1"
-import open3d as o3d
-import cv2
+# Blender does not put the script folder on sys.path, realpath follows job dir symlinks
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from utils.telemetry import span
+from utils.FloorplanToBlenderLib import IO
+from utils.mesh_builder import create_walls
 '''
 Floorplan to Blender
 
@@ -43,14 +45,11 @@ Our helpful functions
 def read_from_file(file_path):
     '''
     Read from file
-    read verts data from file
+    read verts data of the floorplan container written by generate
     @Param file_path, path to file
     @Return data
     '''
-    # Now read the file back into a Python list object
-    with open(file_path+'.txt', 'r') as f:
-        data = json.loads(f.read())
-    return data
+    return IO.read_from_file(file_path)
 
 def init_object(name):
     # Create new blender object and return references to mesh and object
@@ -182,7 +181,12 @@ def main(argv):
     '''
 
 
-def create_floorplan(base_path,program_path, name=0):
+def create_floorplan(base_path,program_path, name=0, merge_walls=False):
+    '''
+    Build the scene of one floorplan data folder
+    @Param merge_walls, one mesh with a wall_id face attribute per wall category instead
+    of one object per wall, the room lookups (Room_Wall_List, ...) need the objects
+    '''
 
     parent, parent_mesh = init_object("Floorplan"+str(name))
     
@@ -240,121 +244,28 @@ def create_floorplan(base_path,program_path, name=0):
     verts = read_from_file(path_to_top_wall_verts_file)
     faces = read_from_file(path_to_top_wall_faces_file)
 
-    # Create mesh from data
-    boxcount = 0
-    wallcount = 0
-
-    # Create parent
-    top_wall_parent, top_wall_parent_mesh = init_object("TopWalls")
-
-    for i in range(0, len(verts)):
-        roomname = "TopWalls"+str(i)
-        obj = create_custom_mesh(
-            roomname, verts[i], faces[i], pos=pos, rot=rot, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1)))
-        obj.parent = top_wall_parent
-
+    # Walls are extruded prisms built in numpy, see utils.mesh_builder
+    wall_mat = create_mat((0.5, 0.5, 0.5, 1))
+    top_wall_parent = create_walls("TopWalls", verts, faces, 2.5, pos, rot, cen, wall_mat, merged=merge_walls)
     top_wall_parent.parent = parent
     
-    obj = bpy.context.scene.objects["TopWalls"]
-    bpy.context.view_layer.objects.active = obj
-    
-    bpy.ops.object.select_all( action = 'SELECT' )
-    bpy.ops.object.editmode_toggle()
-    
-    bpy.ops.mesh.extrude_context_move(
-    TRANSFORM_OT_translate={"value":(-0, -0, 2.5)}
-    )
-    
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.select_all(action='DESELECT')
-    
     path_to_door_verts_file = program_path +"/" + base_path + "doors_verts"
     path_to_door_faces_file = program_path +"/" + base_path + "doors_faces"
     door_verts = read_from_file(path_to_door_verts_file)
     door_faces = read_from_file(path_to_door_faces_file)
-    # Create parent
-    door_parent, door_parent_mesh = init_object("Door_Walls")
+    door_parent = create_walls("Door_Walls", door_verts, door_faces, 2.5-2.1, [0,0,-1-2.1], rot, cen, wall_mat, merged=merge_walls)
     door_parent.parent = parent
     
-    for i in range(0, len(door_verts)):
-        roomname = "Door_Walls"+str(i)
-        obj = create_custom_mesh(
-            roomname, door_verts[i], door_faces[i], pos=[0,0,-1-2.1], rot=rot, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1)))
-        obj.parent = door_parent
-    
-    obj = bpy.context.scene.objects["Door_Walls"]
-    bpy.context.view_layer.objects.active = obj
-    
-    for i in obj.children:
-        i.select_set(True)
-    bpy.ops.object.editmode_toggle()
-    
-    bpy.ops.mesh.extrude_context_move(
-    TRANSFORM_OT_translate={"value":(-0, -0, (2.5-2.1))}
-    )
-    
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.select_all(action='DESELECT')
-    
-    '''
-    '''
     path_to_window_verts_file = program_path +"/" + base_path + "windows_verts"
     path_to_window_faces_file = program_path +"/" + base_path + "windows_faces"
     window_verts = read_from_file(path_to_window_verts_file)
     window_faces = read_from_file(path_to_window_faces_file)
-    
-    # Create parent
-    win_wall_parent, win_wall_parent_mesh = init_object("Window_Walls")
+    win_wall_parent = create_walls("Window_Walls", window_verts, window_faces, 2.5-2.15, [0,0,-1-1.15-1], rot, cen, wall_mat, merged=merge_walls)
     win_wall_parent.parent = parent
     
-    for i in range(0, len(window_verts)):
-        roomname = "Window_Walls"+str(i)
-        obj = create_custom_mesh(
-            roomname, window_verts[i], window_faces[i], pos=[0,0,-1-1.15-1], rot=rot, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1)))
-        obj.parent = win_wall_parent
-    
-    obj = bpy.context.scene.objects["Window_Walls"]
-    bpy.context.view_layer.objects.active = obj
-    
-    for i in obj.children:
-        i.select_set(True)
-    bpy.ops.object.editmode_toggle()
-    
-    bpy.ops.mesh.extrude_context_move(
-    TRANSFORM_OT_translate={"value":(-0, -0, (2.5-2.15))}
-    )
-    
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.select_all(action='DESELECT')
-    
-    
-    window_verts = read_from_file(path_to_window_verts_file)
-    window_faces = read_from_file(path_to_window_faces_file)
-    
-    # Create parent
-    bot_win_wall_parent, bot_win_wall_parent_mesh = init_object("Bot_Window_Walls")
+    bot_win_wall_parent = create_walls("Bot_Window_Walls", window_verts, window_faces, 1.15, [0,0,-1], rot, cen, wall_mat, merged=merge_walls)
     bot_win_wall_parent.parent = parent
     
-    for i in range(0, len(window_verts)):
-        roomname = "Bot_Window_Walls"+str(i)
-        obj = create_custom_mesh(
-            roomname, window_verts[i], window_faces[i], pos=[0,0,-1], rot=rot, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1)))
-        obj.parent = bot_win_wall_parent
-    
-    obj = bpy.context.scene.objects["Bot_Window_Walls"]
-    bpy.context.view_layer.objects.active = obj
-    
-    for i in obj.children:
-        i.select_set(True)
-    bpy.ops.object.editmode_toggle()
-    
-    bpy.ops.mesh.extrude_context_move(
-    TRANSFORM_OT_translate={"value":(-0, -0, 1.15)}
-    )
-    
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.select_all(action='DESELECT')
-    
     pos[2] = -1
     '''
     Create Floor
@@ -1097,17 +1008,26 @@ def objs_in_room(roomname):
              list.append(i)
     return list
 
-def Add_random_objs(index):
+def read_placed_polygons(path='Placed_polygons.txt'):
+    f = open(path,'r')
+    placed = []
+    for i in f.readlines():
+        placed.append([i.split(',')[0],float(i.split(',')[1]),float(i.split(',')[2]),float(i.split(',')[3][:-2])])
+    f.close()
+    return placed
+
+def Add_random_objs(index, placed=None):
+    '''
+    Add the objects chosen by the placement stage
+    @Param placed, list of [name, x, y, rotation in degrees], read from Placed_polygons.txt when None
+    '''
     if index == None:
         index = create_object_index()
-    f = open('Placed_polygons.txt','r')
-    names = []
-    Cents = []
-    rots = []
-    for i in f.readlines():
-        names.append(i.split(',')[0])
-        Cents.append([float(i.split(',')[1]),float(i.split(',')[2])])
-        rots.append(float(i.split(',')[3][:-2]))
+    if placed is None:
+        placed = read_placed_polygons()
+    names = [i[0] for i in placed]
+    Cents = [[i[1],i[2]] for i in placed]
+    rots = [i[3] for i in placed]
         
     for i,j in enumerate(names):
         typ = int(j.split('_')[1])
@@ -1381,6 +1301,8 @@ def set_camera_location_and_rotation(translation, rotation, camera_name='Camera'
 
 
 def save_data(depth_maps, all_translations=None, all_rotations=None, timestamps=None):
+    import skimage
+    from skimage import io
     print("Starting Save")
     if not len(depth_maps) == len(all_translations) or not len(depth_maps) == len(all_rotations):
         print('ERROR')
@@ -1442,6 +1364,27 @@ def save_poses(RT,ind):
             np.savetxt(f, line)
     return
 
+def rendered_frames():
+    '''
+    Frames of the current room whose rgb and depth images are already on disk
+    The newest one is left out, it may have been cut short by the crash
+    '''
+    rgb = BasePath + RGBPath
+    exr = BasePath + EXRDepthPath
+    done = set()
+    if not os.path.isdir(rgb) or not os.path.isdir(exr):
+        return done
+    for f in os.listdir(rgb):
+        if not f.startswith(RGBFileNameFormat) or not f.endswith(EXT):
+            continue
+        frame = int(f[len(RGBFileNameFormat):-len(EXT)])
+        depth = exr + RGBFileNameFormat + '%04d.exr'%(frame)
+        if os.path.getsize(rgb + f) > 0 and os.path.isfile(depth) and os.path.getsize(depth) > 0:
+            done.add(frame)
+    if done:
+        done.remove(max(done))
+    return done
+
 def animation(render=False):
     translation = mathutils.Vector()
     rotation = mathutils.Matrix.Rotation(0, 3, 'X')
@@ -1454,8 +1397,9 @@ def animation(render=False):
     print(sceneStart, sceneEnd)
     if not os.path.isdir(directory):
         os.mkdir(BasePath)
-    os.mkdir(BasePath +Name[:-1])
-    os.mkdir(BasePath +Name+ 'pose')
+    os.makedirs(BasePath +Name[:-1], exist_ok=True)
+    os.makedirs(BasePath +Name+ 'pose', exist_ok=True)
+    done = rendered_frames()
     for i in range(sceneStart, sceneEnd):
         # UpdateScene()
         # GetRotation and translation
@@ -1463,9 +1407,15 @@ def animation(render=False):
         print('Index', i, 'test',  bpy.data.scenes['Scene'].frame_current)
         print(RT)
         save_poses(RT,i)
-        # Render
-        if render:
-            bpy.ops.render.render(animation=False)
+        # Render, frames of an interrupted run are kept
+        if render and get_key_frame() in done:
+            print('Frame', get_key_frame(), 'already rendered')
+            allTranslations.append(mathutils.Vector(translation))
+            allRotations.append(rotation.to_quaternion())
+            timestamps.append(get_key_frame())
+        elif render:
+            with span('render_frame', frames=1):
+                bpy.ops.render.render(animation=False)
             #depthMap = get_depth_map()
             # add data to list
             allTranslations.append(mathutils.Vector(translation))
@@ -1638,7 +1588,7 @@ def Room_to_RGBD(name):
     K = get_calibration_matrix_K_from_blender(bpy.data.objects['Camera'].data)
     K = np.array(K)
     K = [list(i) for i in list(K)]
-    os.mkdir(directory+Name+'Intrinsic')
+    os.makedirs(directory+Name+'Intrinsic', exist_ok=True)
     with open(directory+Name+'Intrinsic/Camera_Intrinsic.txt','wb') as f:
         for line in np.matrix(K):
             np.savetxt(f, line)
@@ -1767,8 +1717,61 @@ def Create_RGBD(roomname):
     DelAnimation()
     MakeAnimation(roomname)
     Room_to_RGBD(plan+'/'+roomname)
+
+def read_checkpoint(path):
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+def write_checkpoint(path, data):
+    # write then rename, a crash never leaves half a checkpoint
+    with open(path+'.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path+'.tmp', path)
+
+def room_complete(roomname):
+    '''
+    Room complete
+    Checks the room checkpoint against the files on disk
+    @Param roomname
+    @Return True when all frames, poses, intrinsics and the .ply are there
+    '''
+    path = directory+plan+'/'+roomname+'/'
+    checkpoint = read_checkpoint(path+'checkpoint.json')
+    if checkpoint is None:
+        return False
+    frames = checkpoint['frames']
+    def count(folder, ext):
+        if not os.path.isdir(path+folder):
+            return 0
+        return len([i for i in os.listdir(path+folder) if i.endswith(ext) and os.path.getsize(path+folder+'/'+i) > 0])
+    ply = path+roomname+'.ply'
+    return (count('rgb', '.png') == frames and count('EXRdepth', '.exr') == frames and count('pose', '.txt') == frames
+            and os.path.isfile(path+'Intrinsic/Camera_Intrinsic.txt')
+            and os.path.isfile(ply) and os.path.getsize(ply) > 0)
+
+def Room_checkpoint(roomname):
+    '''
+    Render one room and fuse its point cloud, skipped when a verified checkpoint exists
+    '''
+    if room_complete(roomname):
+        print("Room "+roomname+" already complete, skipping")
+        return
+    with span('render_room', rooms=1) as counts:
+        Create_RGBD(roomname)
+        frames = get_scene_end_frame() - get_scene_start_frame()
+        counts['frames'] = frames
+    with span('rgbd_fusion', frames=frames) as counts:
+        pcd = RGBD_to_PointCloud(directory+plan+'/'+roomname)
+        counts['points'] = len(pcd.points)
+    write_checkpoint(directory+plan+'/'+roomname+'/checkpoint.json', {'frames': frames})
     
 def _build_xy_crop_boundary(polygon, z_range=(-100, 100)):
+    import open3d as o3d
     z_min = z_range[0]
     z_max = z_range[1]
 
@@ -1856,6 +1859,7 @@ def Rot_trans(main_path,path_d,path_c,ind):
     return pcd_m
 
 def Labelled_List(roomname):
+    import open3d as o3d
     from tqdm import tqdm as tq
     path = directory+plan+'/'+roomname
     pcd = o3d.io.read_point_cloud(path+'/'+path.split('/')[-1]+'.ply') 
@@ -1998,59 +2002,82 @@ def load_file(file_name, voxel_size=0.02):
     inds = ME.utils.sparse_quantize(quantized_coords, return_index=True)
     return quantized_coords[inds]*0.02, feats[inds], pcd
 '''
-# Start
-if __name__ == "__main__":
-    #main(sys.argv)
-    bpy.ops.wm.open_mainfile(filepath = sys.argv[5]+'/floorplan.blend')
-    dict = {'Bedroom':{'Bed':1,
-                       'Desk':1
-                       },
-            'LivingRoom':{'Sofa':1,
-                          'Bookshelf':1,
-                          'Closet':1,
-                          'Table':1
-                          },
-            'Kitchen':{'Closet':1
-                    },
-            }
-    global directory, plan
-    directory = sys.argv[5]+'/'
-    number = [i for i in os.listdir(directory) if '_Plan_'==i[:6] and ".blend" not in i]
-    if number == [] :
-        plan = '_Plan_0'
-    else:
-        plan = '_Plan_'+str(len(number))
-   
-    print(directory+plan)
-    os.mkdir(directory+plan)
-    
+# Rooms rendered and the objects added to them
+Room_types = {'Bedroom':{'Bed':1,
+                   'Desk':1
+                   },
+        'LivingRoom':{'Sofa':1,
+                      'Bookshelf':1,
+                      'Closet':1,
+                      'Table':1
+                      },
+        'Kitchen':{'Closet':1
+                },
+        }
+
+def plan_source(directory, placed='Placed_polygons.txt'):
+    '''
+    Identity of the placed scene a run renders, sha1 of floorplan.blend and Placed_polygons.txt
+    '''
+    import hashlib
+    h = hashlib.sha1()
+    for path in [directory+'floorplan.blend', placed]:
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+        h.update(b'\0')
+    return h.hexdigest()
+
+def next_plan(directory, resume=True, source=None):
+    '''
+    Name of the next plan folder, _Plan_<n>
+    @Param resume, look for an unfinished last plan
+    @Param source, plan_source of this run, only a plan of the same source is resumed
+    @Return plan, checkpoint of the unfinished last plan to resume or None
+    '''
+    number = [i for i in os.listdir(directory) if '_Plan_'==i[:6] and os.path.isdir(directory+i)]
+    if number == [] or not resume:
+        return '_Plan_'+str(len(number)), None
+    # An unfinished plan of an earlier run of the same scene is resumed from its saved scene,
+    # a different scene starts a new plan
+    last = '_Plan_'+str(len(number)-1)
+    checkpoint = read_checkpoint(directory+last+'_checkpoint.json')
+    if (checkpoint is not None and not checkpoint['complete'] and checkpoint.get('source') == source
+            and os.path.isfile(directory+last+"_a.blend")):
+        return last, checkpoint
+    return '_Plan_'+str(len(number)), None
+
+def populate_scene(room_types, placed=None):
+    '''
+    Fill the usable rooms with objects
+    @Param room_types, rooms to use, dict like Room_types
+    @Param placed, placement result, read from Placed_polygons.txt when None
+    @Return names of the usable rooms
+    '''
     index = None
     rooms = []
-    for i in bpy.data.objects['Rooms'].children:
-        t1,t2 = obj_xy_dims(i)
-        V = conv_to_vectors(i.name)
-        V = [t['vector'] for t in V]
-        check_invalid_polygon = False
-        for k in V:
-            # POINT WALL FILTER
-            if k[0]==0 and k[1]==0:
-                check_invalid_polygon = True
-            # SLANT WALL FILTER
-            if int(k[0])!=0 and int(k[1])!=0:
-                check_invalid_polygon = True
-        if i.name.split('.')[0] in [j for j in dict] and check_invalid_polygon==False:
-            index = Room_populate(i.name,index)
-            rooms.append(i.name)
-    index = Add_random_objs(index)
-    
-    if rooms==[]:
-        print("No usable rooms in Plan")
-        text_file = open("config.txt", "w")
-        n = text_file.write("No usable rooms in Plan")
-        text_file.close()
-        exit(0)
-        
-    count = 0
+    with span('scene_populate') as counts:
+        for i in bpy.data.objects['Rooms'].children:
+            t1,t2 = obj_xy_dims(i)
+            V = conv_to_vectors(i.name)
+            V = [t['vector'] for t in V]
+            check_invalid_polygon = False
+            for k in V:
+                # POINT WALL FILTER
+                if k[0]==0 and k[1]==0:
+                    check_invalid_polygon = True
+                # SLANT WALL FILTER
+                if int(k[0])!=0 and int(k[1])!=0:
+                    check_invalid_polygon = True
+            if i.name.split('.')[0] in [j for j in room_types] and check_invalid_polygon==False:
+                index = Room_populate(i.name,index)
+                rooms.append(i.name)
+        index = Add_random_objs(index, placed)
+        counts['rooms'] = len(rooms)
+    return rooms
+
+def use_gpu():
     prop = bpy.context.preferences.addons['cycles'].preferences
     prop.get_devices()
     prop.compute_device_type = 'CUDA'
@@ -2062,6 +2089,11 @@ if __name__ == "__main__":
 
     for scene in bpy.data.scenes:
         scene.cycles.device = 'GPU'
+
+def finish_scene():
+    '''
+    Texture the rooms, join object parts and drop the helper objects
+    '''
     for i in bpy.data.objects['Rooms'].children:
         roomtexture(i.name)
     
@@ -2073,16 +2105,53 @@ if __name__ == "__main__":
     select_obj(bpy.data.objects['Floor'])
     bpy.ops.object.delete()
     bpy.ops.object.select_all(action='DESELECT')
+
+def render_rooms(rooms):
+    '''
+    Render and fuse every room of the current plan, resumable by the checkpoints
+    '''
+    write_checkpoint(directory+plan+'_checkpoint.json', {'rooms': rooms, 'complete': False, 'source': source})
+    for i in rooms:
+        Room_checkpoint(i)
+    write_checkpoint(directory+plan+'_checkpoint.json', {'rooms': rooms, 'complete': True, 'source': source})
+
+# Start
+if __name__ == "__main__":
+    #main(sys.argv)
+    bpy.ops.wm.open_mainfile(filepath = sys.argv[5]+'/floorplan.blend')
+    global directory, plan, source
+    directory = sys.argv[5]+'/'
+    source = plan_source(directory)
+    plan, resume = next_plan(directory, source=source)
+   
+    print(directory+plan)
+    os.makedirs(directory+plan, exist_ok=True)
+    
+    if resume is not None:
+        print("Resuming "+plan)
+        bpy.ops.wm.open_mainfile(filepath=directory+plan+"_a.blend")
+        rooms = resume['rooms']
+    else:
+        rooms = populate_scene(Room_types)
+    
+    if rooms==[]:
+        print("No usable rooms in Plan")
+        text_file = open("config.txt", "w")
+        n = text_file.write("No usable rooms in Plan")
+        text_file.close()
+        exit(0)
+        
+    count = 0
+    use_gpu()
+    if resume is None:
+        finish_scene()
     
     # CREATING CONFIG FILE FOR ANNOTATIONS
     text_file = open("config.txt", "w")
     n = text_file.write(directory+plan+"_a.blend")
     text_file.close()     
-    bpy.ops.wm.save_as_mainfile(filepath=directory+plan+"_a.blend")
-    
-    for i in rooms:
-        Create_RGBD(i)
-        RGBD_to_PointCloud(directory+plan+'/'+i)
+    if resume is None:
+        bpy.ops.wm.save_as_mainfile(filepath=directory+plan+"_a.blend")
+    render_rooms(rooms)
         
     exit(0)
-    
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import random
+import importlib.util
+from types import SimpleNamespace
+import numpy as np
+os.environ["OPENCV_IO_ENABLE_OPENEXR"]="1"
+# Blender does not put the script folder on sys.path, realpath follows job dir symlinks
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from utils.telemetry import span
+from utils import Placement_utils as pl
+from utils.virtual_scan import quantize
+
+'''
+Single session
+
+Runs placement, scene population, rendering and labeling of one plan in a single
+Blender session. The scene is built once and handed from stage to stage in memory,
+room polygons and placed objects are passed as Python objects, so no floorplan.blend,
+_Plan_<n>_a.blend, scene.json or Placed_polygons.txt are written or read.
+
+The stages are the functions of Placement_Info.py, floorplan_to_PointClouds_in_blender.py
+and annotate-Blocky.py, loaded as modules. Downsampling happens here with the same
+voxel quantization as FloorplanToSTL.load_file. Placement_utils needs shapely in
+Blender's Python.
+
+Rooms are checkpointed as in the render script, but an interrupted plan is not
+resumed, there is no saved scene to resume from.
+
+blender -noaudio --background --python single_session.py <program_path> <target> <options json> <data paths...>
+options: {"seed": int or null, "voxel_size": 0.02, "calc_an": true}
+'''
+
+def load_script(name, path):
+    '''
+    Import a pipeline script as a module, its __main__ block is not run
+    '''
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def downsample(path, roomname, voxel_size):
+    '''
+    Write <room>_downsampled.npy and <room>_downsampled(cls).npy from the fused cloud
+    '''
+    import open3d as o3d
+    with span('downsample', rooms=1) as counts:
+        pcd = o3d.io.read_point_cloud(path+roomname+'.ply')
+        coords = np.array(pcd.points)*1000
+        pnts, inds = quantize(coords, voxel_size)
+        np.save(path+roomname+'_downsampled.npy', pnts)
+        np.save(path+roomname+'_downsampled(cls).npy', np.array(pcd.colors)[inds])
+        counts.update(points=len(coords), downsampled=len(pnts))
+
+def run(program_path, target, data_paths, seed=None, voxel_size=0.02, calc_an=True):
+    '''
+    Run all stages of one plan
+    @Return plan folder, None when the plan has no usable rooms
+    '''
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    directory = program_path+'/'
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    placement = load_script('placement_info', script_dir+'/Placement_Info.py')
+    render = load_script('render_scene', script_dir+'/floorplan_to_PointClouds_in_blender.py')
+    annotate = load_script('annotate_blocky', script_dir+'/annotate-Blocky.py')
+
+    with span('scene_build'):
+        placement.build_scene(program_path, data_paths)
+    with span('placement') as counts:
+        plan_polygons = placement.plan_polygons()
+        D = pl.place_objects(SimpleNamespace(program_path=program_path), plan_polygons)
+        placed = [[i.name, i.center()[0], i.center()[1], i.rotated%360] for i in D if '_' in i.name]
+        counts.update(rooms=len(plan_polygons[0]), objects=len(placed))
+
+    render.directory = directory
+    annotate.directory = directory
+    # never resumed, the checkpoint has no source to match
+    render.source = None
+    render.plan, _ = render.next_plan(directory, resume=False)
+    plan = render.plan
+    os.makedirs(directory+plan, exist_ok=True)
+    rooms = render.populate_scene(render.Room_types, placed)
+    if rooms == []:
+        print("No usable rooms in Plan")
+        return None
+    render.use_gpu()
+    render.finish_scene()
+    render.render_rooms(rooms)
+
+    for i in rooms:
+        downsample(directory+plan+'/'+i+'/', i, voxel_size)
+    if calc_an:
+        annotate.label_plan(directory+plan)
+    return directory+plan
+
+# Start
+if __name__ == "__main__":
+    if len(sys.argv) < 9:
+        print("Usage: blender --background --python single_session.py <program_path> <target> <options json> <data paths...>")
+        exit(1)
+    options = json.loads(sys.argv[7])
+    plan = run(sys.argv[5], sys.argv[6], sys.argv[8:], seed=options.get('seed'),
+               voxel_size=options.get('voxel_size', 0.02), calc_an=options.get('calc_an', True))
+    print("Created "+str(plan))
+    exit(0)
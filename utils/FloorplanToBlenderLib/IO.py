@@ -1,6 +1,7 @@
 import numpy as np
 import json
 import os
+import copy
 from shutil import which
 import configparser
 import shutil
@@ -45,26 +46,148 @@ def config_get_default():
     config.read('config.ini')
     return config['DEFAULT']['image_path'], config['DEFAULT']['blender_installation_path'], config['DEFAULT']['file_structure'], config['DEFAULT']['mode']
 
-def save_to_file(file_path, data, show=True):
+# Container of all data files of a floorplan folder, written by write_floorplan
+FLOORPLAN_FILE = 'floorplan.npz'
+FLOORPLAN_VERSION = 1
+
+# Data files of a floorplan not yet written, folder -> name -> data
+_pending = {}
+
+# Containers already read, folder -> (mtime, data)
+_loaded = {}
+
+def stage_file(file_path, data, show=True):
     '''
-    Save to file
-    Saves our resulting array as json in file.
-    @Param file_path, path to outputfile
+    Stage file
+    Collects our resulting array for the floorplan container of its folder,
+    nothing is written before write_floorplan.
+    @Param file_path, path to outputfile, Data/<n>/<name>
     @Param data, data to write to file
     '''
-    with open(file_path+'.txt', 'w') as f:
-        f.write(json.dumps(data))
+    folder, name = os.path.split(file_path)
+    _pending.setdefault(os.path.normpath(folder), {})[name] = data
+
+    if show:
+        print("Staged data : " + file_path)
+
+def discard_staged(fn):
+    '''
+    Decorator of a function generating floorplan folders, when it raises the
+    data files it staged are dropped instead of waiting for a write_floorplan
+    '''
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            _pending.clear()
+            raise
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+def pack_ragged(data):
+    '''
+    Flatten nested lists to numpy
+    The outer levels are peeled off into offset arrays until the rest is rectangular,
+    e.g. verts of all walls -> values n x 3, offsets of the walls.
+    @Param data, nested lists of numbers or strings
+    @Return values, list of offsets, outermost first
+    '''
+    offsets = []
+    items = data
+    while True:
+        try:
+            values = np.array(items)
+            if values.dtype.kind in 'biufU' or values.size == 0:
+                return values, offsets
+        except ValueError:
+            pass
+        offsets.append(np.cumsum([0] + [len(i) for i in items]))
+        items = [j for i in items for j in i]
+
+def _rows(values):
+    # lists down to the innermost level, like the json data files were
+    if values.ndim < 2:
+        return values
+    return [_rows(i) for i in values]
+
+def unpack_ragged(values, offsets):
+    '''
+    Inverse of pack_ragged, nested lists as the json data files gave them
+    The innermost level stays numpy, e.g. one vertex or one face; mesh.from_pydata
+    of Blender 2.93 tests faces with "if faces", so no outer level may be an array
+    @Return nested lists of arrays, a 1d array for flat data
+    '''
+    items = _rows(values)
+    for o in reversed(offsets):
+        items = [items[o[k]:o[k+1]] for k in range(len(o)-1)]
+    return items
+
+def write_floorplan(path, show=True):
+    '''
+    Write the collected data files of a floorplan folder into one container
+    Arrays are stored as <name> plus <name>__offsets<k>, dicts like transform as json.
+    @Param path, Data/<n>/ folder
+    @Return path of the container
+    '''
+    folder = os.path.normpath(path)
+    files = _pending.pop(folder, {})
+    arrays = {'__version__': np.array(FLOORPLAN_VERSION)}
+    other = {}
+    for name, data in files.items():
+        if isinstance(data, dict):
+            other[name] = data
+            continue
+        values, offsets = pack_ragged(data)
+        # the Blender scripts shift verts in place, keep them float
+        arrays[name] = values.astype(np.float64) if name.endswith('verts') else values
+        for k, o in enumerate(offsets):
+            arrays[name+'__offsets'+str(k)] = o
+    arrays['__json__'] = np.array(json.dumps(other))
+    file_path = os.path.join(folder, FLOORPLAN_FILE)
+    np.savez(file_path, **arrays)
+    _loaded.pop(folder, None)
 
     if show:
-        print("Created file : " + file_path + ".txt")
+        print("Created file : " + file_path)
+    return file_path
+
+def load_floorplan(path):
+    '''
+    Read the container of a floorplan folder, read once and kept while unchanged
+    @Param path, Data/<n>/ folder
+    @Return dict name -> data, arrays as numpy
+    '''
+    folder = os.path.normpath(path)
+    file_path = os.path.join(folder, FLOORPLAN_FILE)
+    mtime = os.path.getmtime(file_path)
+    if folder in _loaded and _loaded[folder][0] == mtime:
+        return _loaded[folder][1]
+    data = {}
+    with np.load(file_path) as f:
+        version = int(f['__version__'])
+        if version > FLOORPLAN_VERSION:
+            raise ValueError(file_path + " has version " + str(version) + ", this reader knows up to " + str(FLOORPLAN_VERSION))
+        names = [i for i in f.files if '__' not in i]
+        for name in names:
+            offsets = []
+            while name+'__offsets'+str(len(offsets)) in f.files:
+                offsets.append(f[name+'__offsets'+str(len(offsets))])
+            data[name] = unpack_ragged(f[name], offsets)
+        data.update(json.loads(str(f['__json__'])))
+    _loaded[folder] = (mtime, data)
+    return data
 
 def read_from_file(file_path):
     '''
     Read from file
-    read verts data from file
+    read verts data from the floorplan container, or the json file of older data folders
     @Param file_path, path to file
-    @Return data
+    @Return data, a copy the caller may change
     '''
+    folder, name = os.path.split(file_path)
+    if os.path.isfile(os.path.join(folder, FLOORPLAN_FILE)):
+        return copy.deepcopy(load_floorplan(folder)[name])
     #Now read the file back into a Python list object
     with open(file_path+'.txt', 'r') as f:
         data = json.loads(f.read())
@@ -82,29 +205,64 @@ def clean_data_folder(folder):
         for d in dirs:
             shutil.rmtree(os.path.join(root, d))
 
-def create_new_floorplan_path(path):
+def create_new_floorplan_path(path, **fields):
     '''
     Creates next free name to floorplan data
+    The number comes from the plan index of utils.artifact_store
     @Param path, path to floorplan
+    @Param fields, initial plan index values, e.g. svg
     @Return end path
     '''
-    res = 0;
-    for root, dirs, files in os.walk(path):
-        for dir in dirs:
-            try:
-                if(int(dir) is not None):
-                    res = int(dir) + 1
-            except:
-                continue
+    from utils.artifact_store import ArtifactStore
+    store = ArtifactStore(path)
+    try:
+        return store.allocate(**fields)
+    finally:
+        store.close()
 
-    res = path + str(res) + "/"
 
-    # create dir
-    if not os.path.exists(res):
-        os.makedirs(res)
+def room_index(room_names):
+    '''
+    Rooms as the plan index keeps them, Blender names repeated rooms Bedroom, Bedroom.001, ...
+    @Param room_names, content of the room_names data file
+    @Return list of (name, type)
+    '''
+    rooms = []
+    for i in room_names:
+        count = len([j for j, t in rooms if t == i])
+        rooms.append((i if count == 0 else i + '.%03d' % (count), i))
+    return rooms
 
-    return res;
+def index_plan(path, rooms=None, **fields):
+    '''
+    Record a floorplan folder in the plan index of its data folder
+    @Param path, floorplan folder of create_new_floorplan_path
+    @Param rooms, list of (name, type), None to keep the rooms
+    @Param fields, plan values, see utils.artifact_store.PLAN_FIELDS
+    '''
+    from utils.artifact_store import ArtifactStore
+    store = ArtifactStore(os.path.dirname(os.path.normpath(path)))
+    try:
+        store.record_plan(path, **fields)
+        if rooms is not None:
+            store.record_rooms(path, rooms)
+    finally:
+        store.close()
 
+def plan_counts(path):
+    '''
+    Door and window counts the plan index keeps for a floorplan folder
+    @Return dict doors, windows, empty for a plan without a row
+    '''
+    from utils.artifact_store import ArtifactStore
+    store = ArtifactStore(os.path.dirname(os.path.normpath(path)))
+    try:
+        plan = store.plan(path)
+    finally:
+        store.close()
+    if plan is None:
+        return {}
+    return dict((i, plan[i]) for i in ['doors', 'windows'] if plan[i] is not None)
 
 def get_current_path():
     '''
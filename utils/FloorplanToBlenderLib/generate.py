@@ -5,6 +5,8 @@ from . import detect
 from . import IO
 from . import transform
 from utils.loaders.svg_utils import *
+from utils.loaders.svg_cache import load_plan
+from utils.telemetry import span
 '''
 Generate
 This file contains code for generate data files, used when creating blender project.
@@ -22,159 +24,157 @@ path = "Data/"
 # Super-Resolution 
 Path_pb = ["EDSR_x","ESPCN_x","LapSRN_x","FSRCNN_x"]
 meth = ["edsr","espcn","lapsrn","fsrcnn"] 
+
+# CubiCasa5k icon and room classes of the svg, class numbers as in utils.loaders
+icons_list = {"Window": 1,
+              "Door": 2,
+              "Closet": 3,
+              "ClosetRound": 3,
+              "ClosetTriangle": 3,
+              "CoatCloset": 3,
+              "CoatRack": 3,
+              "CounterTop": 3,
+              "Housing": 3,
+              "ElectricalAppliance": 4,
+              "WoodStove": 4,
+              "GasStove": 4,
+              "Toilet": 5,
+              "Urinal": 5,
+              "SideSink": 6,
+              "Sink": 6,
+              "RoundSink": 6,
+              "CornerSink": 6,
+              "DoubleSink": 6,
+              "DoubleSinkRight": 6,
+              "WaterTap": 6,
+              "SaunaBenchHigh": 7,
+              "SaunaBenchLow": 7,
+              "SaunaBenchMid": 7,
+              "SaunaBench": 7,
+              "Fireplace": 8,
+              "FireplaceCorner": 8,
+              "FireplaceRound": 8,
+              "PlaceForFireplace": 8,
+              "PlaceForFireplaceCorner": 8,
+              "PlaceForFireplaceRound": 8,
+              "Bathtub": 9,
+              "BathtubRound": 9,
+              "Chimney": 10,
+              "Misc": None,
+              "BaseCabinetRound": None,
+              "BaseCabinetTriangle": None,
+              "BaseCabinet": None,
+              "WallCabinet": None,
+              "Shower": None,
+              "ShowerCab": None,
+              "ShowerPlatform": None,
+              "ShowerScreen": None,
+              "ShowerScreenRoundRight": None,
+              "ShowerScreenRoundLeft": None,
+              "Jacuzzi": None}
+
+rooms_list = {"Alcove": 11,
+              "Attic": 11,
+              "Ballroom": 11,
+              "Bar": 11,
+              "Basement": 11,
+              "Bath": 6,
+              "Bedroom": 5,
+              "CarPort": 10,
+              "Church": 11,
+              "Closet": 9,
+              "ConferenceRoom": 11,
+              "Conservatory": 11,
+              "Counter": 11,
+              "Den": 11,
+              "Dining": 4,
+              "DraughtLobby": 7,
+              "DressingRoom": 9,
+              "EatingArea": 4,
+              "Elevated": 11,
+              "Elevator": 11,
+              "Entry": 7,
+              "ExerciseRoom": 11,
+              "Garage": 10,
+              "Garbage": 11,
+              "Hall": 11,
+              "HallWay": 7,
+              "HotTub": 11,
+              "Kitchen": 3,
+              "Library": 11,
+              "LivingRoom": 4,
+              "Loft": 11,
+              "Lounge": 4,
+              "MediaRoom": 11,
+              "MeetingRoom": 11,
+              "Museum": 11,
+              "Nook": 11,
+              "Office": 11,
+              "OpenToBelow": 11,
+              "Outdoor": 1,
+              "Pantry": 11,
+              "Reception": 11,
+              "RecreationRoom": 11,
+              "RetailSpace": 11,
+              "Room": 11,
+              "Sanctuary": 11,
+              "Sauna": 6,
+              "ServiceRoom": 11,
+              "ServingArea": 11,
+              "Skylights": 11,
+              "Stable": 11,
+              "Stage": 11,
+              "StairWell": 11,
+              "Storage": 9,
+              "SunRoom": 11,
+              "SwimmingPool": 11,
+              "TechnicalRoom": 11,
+              "Theatre": 11,
+              "Undefined": 11,
+              "UserDefined": 11,
+              "Utility": 11,
+              "Background": 0,  # Not in data. The default outside label
+              "Wall": 2,
+              "Railing": 8}
+
+# Names the Blender scripts see, one per class number
+saved_icon_names = dict((v,k) for k, v in icons_list.items() if k in ["No Icon", "Window", "Door", "Closet", "ElectricalAppliance" ,"Toilet", "Sink",
+                    "SaunaBench", "Fireplace", "Bathtub", "Chimney"])
+saved_room_names = dict((v,k) for k, v in rooms_list.items() if k in ["Background", "Outdoor", "Wall", "Kitchen", "LivingRoom" ,"Bedroom", "Bath",
+                    "Entry", "Railing", "Storage", "Garage", "Undefined"])
+
+@IO.discard_staged
 def generate_svg_plan(imgpath, Svg_path,info):
     global path
     
-    import numpy as np
-    import cv2
-    from torch.utils.data import DataLoader
-    from utils.loaders import FloorplanSVG, DictToTensor, Compose, RotateNTurns
-    
-    svg = minidom.parse(Svg_path)
-    icons_list = {"Window": 1,
-                  "Door": 2,
-                  "Closet": 3,
-                  "ClosetRound": 3,
-                  "ClosetTriangle": 3,
-                  "CoatCloset": 3,
-                  "CoatRack": 3,
-                  "CounterTop": 3,
-                  "Housing": 3,
-                  "ElectricalAppliance": 4,
-                  "WoodStove": 4,
-                  "GasStove": 4,
-                  "Toilet": 5,
-                  "Urinal": 5,
-                  "SideSink": 6,
-                  "Sink": 6,
-                  "RoundSink": 6,
-                  "CornerSink": 6,
-                  "DoubleSink": 6,
-                  "DoubleSinkRight": 6,
-                  "WaterTap": 6,
-                  "SaunaBenchHigh": 7,
-                  "SaunaBenchLow": 7,
-                  "SaunaBenchMid": 7,
-                  "SaunaBench": 7,
-                  "Fireplace": 8,
-                  "FireplaceCorner": 8,
-                  "FireplaceRound": 8,
-                  "PlaceForFireplace": 8,
-                  "PlaceForFireplaceCorner": 8,
-                  "PlaceForFireplaceRound": 8,
-                  "Bathtub": 9,
-                  "BathtubRound": 9,
-                  "Chimney": 10,
-                  "Misc": None,
-                  "BaseCabinetRound": None,
-                  "BaseCabinetTriangle": None,
-                  "BaseCabinet": None,
-                  "WallCabinet": None,
-                  "Shower": None,
-                  "ShowerCab": None,
-                  "ShowerPlatform": None,
-                  "ShowerScreen": None,
-                  "ShowerScreenRoundRight": None,
-                  "ShowerScreenRoundLeft": None,
-                  "Jacuzzi": None}
-
-    rooms_list = {"Alcove": 11,
-                      "Attic": 11,
-                      "Ballroom": 11,
-                      "Bar": 11,
-                      "Basement": 11,
-                      "Bath": 6,
-                      "Bedroom": 5,
-                      "CarPort": 10,
-                      "Church": 11,
-                      "Closet": 9,
-                      "ConferenceRoom": 11,
-                      "Conservatory": 11,
-                      "Counter": 11,
-                      "Den": 11,
-                      "Dining": 4,
-                      "DraughtLobby": 7,
-                      "DressingRoom": 9,
-                      "EatingArea": 4,
-                      "Elevated": 11,
-                      "Elevator": 11,
-                      "Entry": 7,
-                      "ExerciseRoom": 11,
-                      "Garage": 10,
-                      "Garbage": 11,
-                      "Hall": 11,
-                      "HallWay": 7,
-                      "HotTub": 11,
-                      "Kitchen": 3,
-                      "Library": 11,
-                      "LivingRoom": 4,
-                      "Loft": 11,
-                      "Lounge": 4,
-                      "MediaRoom": 11,
-                      "MeetingRoom": 11,
-                      "Museum": 11,
-                      "Nook": 11,
-                      "Office": 11,
-                      "OpenToBelow": 11,
-                      "Outdoor": 1,
-                      "Pantry": 11,
-                      "Reception": 11,
-                      "RecreationRoom": 11,
-                      "RetailSpace": 11,
-                      "Room": 11,
-                      "Sanctuary": 11,
-                      "Sauna": 6,
-                      "ServiceRoom": 11,
-                      "ServingArea": 11,
-                      "Skylights": 11,
-                      "Stable": 11,
-                      "Stage": 11,
-                      "StairWell": 11,
-                      "Storage": 9,
-                      "SunRoom": 11,
-                      "SwimmingPool": 11,
-                      "TechnicalRoom": 11,
-                      "Theatre": 11,
-                      "Undefined": 11,
-                      "UserDefined": 11,
-                      "Utility": 11,
-                      "Background": 0,  # Not in data. The default outside label
-                      "Wall": 2,
-                      "Railing": 8}
-    
     wall = []
     window = []
     door = []
     icons = []
     rooms = []
     
-    img = cv2.imread(imgpath)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    
-    for e in svg.getElementsByTagName('g'):
-
-        if e.getAttribute("id") == "Wall":
-            X, Y = get_points(e)
-            wall.append([X,Y,3])
-
-        if e.getAttribute("id") == "Window":
-            X, Y = get_points(e)
-            window.append([X,Y])
-
-        if e.getAttribute("id") == "Door":
-            # How to reperesent empty door space
-            X, Y = get_points(e)
-            door.append([X,Y])
-
-        if "FixedFurniture " in e.getAttribute("class"):
-            num = get_icon_number(e,icons_list)
-            rr, cc, X, Y = get_icon(e)
-            icons.append([X,Y,num])
-
-        if "Space " in e.getAttribute("class"):
-            num = get_room_number(e,rooms_list)
-            X, Y = get_points(e)
-            rooms.append([X,Y,num])
+    with span('svg_parse') as counts:
+        svg = load_plan(Svg_path)
+        for e in svg:
+
+            if e.kind == "Wall":
+                wall.append([e.X,e.Y,3])
+
+            if e.kind == "Window":
+                window.append([e.X,e.Y])
+
+            if e.kind == "Door":
+                # How to reperesent empty door space
+                door.append([e.X,e.Y])
+
+            if e.kind == "FixedFurniture":
+                num = get_icon_number(e,icons_list)
+                icons.append([e.X,e.Y,num])
+
+            if e.kind == "Space":
+                num = get_room_number(e,rooms_list)
+                rooms.append([e.X,e.Y,num])
+        counts.update(walls=len(wall), doors=len(door), windows=len(window), icons=len(icons), rooms=len(rooms))
     
     wall = np.array([[[int(i[0][j]),int(i[1][j])] for j in range(len(i[0]))] for i in wall])
     door = np.array([[[int(i[0][j]),int(i[1][j])] for j in range(len(i[0]))] for i in door])
@@ -192,25 +192,12 @@ def generate_svg_plan(imgpath, Svg_path,info):
                      if rooms_type[k]!=None])
     
     # Get path to save data
-    path = IO.create_new_floorplan_path(base_path)
-    
-    l = []
-    for k, v in icons_list.items():
-        if k in ["No Icon", "Window", "Door", "Closet", "ElectricalAppliance" ,"Toilet", "Sink",
-                    "SaunaBench", "Fireplace", "Bathtub", "Chimney"]:
-            l.append((v,k))
-    l = dict(l)
+    path = IO.create_new_floorplan_path(base_path, svg=Svg_path, image=imgpath)
     
-    IO.save_to_file(path+"icon_names",[l[i] for i in icons_type if i!=None] , info)
+    IO.stage_file(path+"icon_names",[saved_icon_names[i] for i in icons_type if i!=None] , info)
     
-    l = []
-    for k, v in rooms_list.items():
-        if k in ["Background", "Outdoor", "Wall", "Kitchen", "LivingRoom" ,"Bedroom", "Bath",
-                    "Entry", "Railing", "Storage", "Garage", "Undefined"]:
-            l.append((v,k))
-    l = dict(l)
-    
-    IO.save_to_file(path+"room_names",[l[i] for i in rooms_type if i!=None], info)
+    room_names = [saved_room_names[i] for i in rooms_type if i!=None]
+    IO.stage_file(path+"room_names",room_names, info)
     
     shape = generate_floor_file(imgpath, info)
     new_shape = generate_walls_file(imgpath, info,svg=True,wall=wall,windows=window,doors=door,icons=icons,rooms=rooms)
@@ -236,11 +223,13 @@ def generate_svg_plan(imgpath, Svg_path,info):
     rotation=None
     
     transform = generate_transform_file(imgpath, info, position, rotation, shape)
-    
-    
+    container = IO.write_floorplan(path, info)
+    IO.index_plan(path, rooms=IO.room_index(room_names), doors=len(door), windows=len(window),
+                  files=[container], status='generated')
 
     return path, shape
     
+@IO.discard_staged
 def generate_all_files(imgpath, info, position=None, rotation=None, CubiCasa=False, SR=[2,"lapsrn"]):
     '''
     Generate all data files
@@ -394,6 +383,7 @@ def generate_all_files(imgpath, info, position=None, rotation=None, CubiCasa=Fal
 
 
         transform = generate_transform_file(imgpath, info, position, rotation, shape)
+        IO.index_plan(path, files=[IO.write_floorplan(path, info)], image=imgpath, status='generated')
 
         return path, shape
 
@@ -414,6 +404,7 @@ def generate_all_files(imgpath, info, position=None, rotation=None, CubiCasa=Fal
     #verts, height = generate_doors_file(imgpath, info)
 
     transform = generate_transform_file(imgpath, info, position, rotation, shape)
+    IO.index_plan(path, files=[IO.write_floorplan(path, info)], image=imgpath, status='generated')
 
     return path, shape
 
@@ -441,25 +432,7 @@ def get_shape(verts, scale):
     if len(verts) == 0:
         return [0,0,0]
 
-    posList = transform.verts_to_poslist(verts)
-    high = [0,0,0]
-    low = posList[0]
-
-    for pos in posList:
-        if pos[0] > high[0]:
-            high[0] = pos[0]
-        if pos[1] > high[1]:
-            high[1] = pos[1]
-        if pos[2] > high[2]:
-            high[2] = pos[2]
-        if pos[0] < low[0]:
-            low[0] = pos[0]
-        if pos[1] < low[1]:
-            low[1] = pos[1]
-        if pos[2] < low[2]:
-            low[2] = pos[2]
-
-    return [high[0] - low[0],high[1] - low[1],high[2] - low[2]]
+    return transform.verts_shape(verts)
 
 def generate_transform_file(imgpath, info, position, rotation, shape):
     '''
@@ -489,7 +462,7 @@ def generate_transform_file(imgpath, info, position, rotation, shape):
     else:
         transform["shape"] = shape
 
-    IO.save_to_file(path+"transform", transform, info)
+    IO.stage_file(path+"transform", transform, info)
 
     return transform
 
@@ -518,7 +491,7 @@ def generate_icons_file(img_path, info, svg = False, CubiCasa=False, polygons=[]
         #Create verts
         icon_count = 0
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, height)])
+            verts.extend([transform.scale_point_to_array(box, scale, height)])
             icon_count+= 1
 
         # create faces
@@ -533,8 +506,8 @@ def generate_icons_file(img_path, info, svg = False, CubiCasa=False, polygons=[]
         if(info):
             print("Number of icons detected : ", icon_count)
 
-        IO.save_to_file(path+"icons_verts", verts, info)
-        IO.save_to_file(path+"icons_faces", faces, info)
+        IO.stage_file(path+"icons_verts", verts, info)
+        IO.stage_file(path+"icons_faces", faces, info)
 
         return get_shape(verts, scale)
     
@@ -563,7 +536,7 @@ def generate_icons_file(img_path, info, svg = False, CubiCasa=False, polygons=[]
         #Create verts
         icon_count = 0
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, height)])
+            verts.extend([transform.scale_point_to_array(box, scale, height)])
             icon_count+= 1
 
         # create faces
@@ -578,8 +551,8 @@ def generate_icons_file(img_path, info, svg = False, CubiCasa=False, polygons=[]
         if(info):
             print("Number of icons detected : ", icon_count)
 
-        IO.save_to_file(path+"icon_verts", verts, info)
-        IO.save_to_file(path+"icon_faces", faces, info)
+        IO.stage_file(path+"icon_verts", verts, info)
+        IO.stage_file(path+"icon_faces", faces, info)
         return  get_shape(verts, scale)
     
     dw_polygon_numbers=[i for i,j in enumerate(types) if j['type']=='icon' and j['class'] in [1,2]]
@@ -599,7 +572,7 @@ def generate_icons_file(img_path, info, svg = False, CubiCasa=False, polygons=[]
     #Create verts
     dw_count = 0
     for box in boxes:
-        verts.extend([transform.scale_point_to_vector(box, scale, height)])
+        verts.extend([transform.scale_point_to_array(box, scale, height)])
         dw_count+= 1
 
     # create faces
@@ -613,8 +586,8 @@ def generate_icons_file(img_path, info, svg = False, CubiCasa=False, polygons=[]
     if(info):
         print("Number of doors/windows detected : ", dw_count)
 
-    IO.save_to_file(path+"dw_verts", verts, info)
-    IO.save_to_file(path+"dw_faces", faces, info)
+    IO.stage_file(path+"dw_verts", verts, info)
+    IO.stage_file(path+"dw_faces", faces, info)
 
     return get_shape(verts, scale)
 
@@ -643,7 +616,7 @@ def generate_rooms_file(img_path, info, svg = False, CubiCasa=False, room_polygo
         #Create verts
         room_count = 0
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, height)])
+            verts.extend([transform.scale_point_to_array(box, scale, height)])
             room_count+= 1
 
         # create faces
@@ -658,8 +631,8 @@ def generate_rooms_file(img_path, info, svg = False, CubiCasa=False, room_polygo
         if(info):
             print("Number of rooms detected : ", room_count)
 
-        IO.save_to_file(path+"rooms_verts", verts, info)
-        IO.save_to_file(path+"rooms_faces", faces, info)
+        IO.stage_file(path+"rooms_verts", verts, info)
+        IO.stage_file(path+"rooms_faces", faces, info)
 
         return get_shape(verts, scale)
 
@@ -682,7 +655,7 @@ def generate_rooms_file(img_path, info, svg = False, CubiCasa=False, room_polygo
         #Create verts
         room_count = 0
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, height)])
+            verts.extend([transform.scale_point_to_array(box, scale, height)])
             room_count+= 1
 
         # create faces
@@ -697,8 +670,8 @@ def generate_rooms_file(img_path, info, svg = False, CubiCasa=False, room_polygo
         if(info):
             print("Number of rooms detected : ", room_count)
 
-        IO.save_to_file(path+"rooms_verts", verts, info)
-        IO.save_to_file(path+"rooms_faces", faces, info)
+        IO.stage_file(path+"rooms_verts", verts, info)
+        IO.stage_file(path+"rooms_faces", faces, info)
 
         return get_shape(verts, scale)
 
@@ -735,7 +708,7 @@ def generate_rooms_file(img_path, info, svg = False, CubiCasa=False, room_polygo
     #Create verts
     room_count = 0
     for box in boxes:
-        verts.extend([transform.scale_point_to_vector(box, scale, height)])
+        verts.extend([transform.scale_point_to_array(box, scale, height)])
         room_count+= 1
 
     # create faces
@@ -750,8 +723,8 @@ def generate_rooms_file(img_path, info, svg = False, CubiCasa=False, room_polygo
     if(info):
         print("Number of rooms detected : ", room_count)
 
-    IO.save_to_file(path+"rooms_verts", verts, info)
-    IO.save_to_file(path+"rooms_faces", faces, info)
+    IO.stage_file(path+"rooms_verts", verts, info)
+    IO.stage_file(path+"rooms_faces", faces, info)
 
     return get_shape(verts, scale)
 
@@ -781,7 +754,7 @@ def generate_small_windows_file(img_path, info,svg=False,win_pol=[]):
         #Create verts
         room_count = 0
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, height)])
+            verts.extend([transform.scale_point_to_array(box, scale, height)])
             room_count+= 1
 
         # create faces
@@ -796,8 +769,8 @@ def generate_small_windows_file(img_path, info,svg=False,win_pol=[]):
         if(info):
             print("Number of windows detected : ", room_count)
 
-        IO.save_to_file(path+"windows_verts", verts, info)
-        IO.save_to_file(path+"windows_faces", faces, info)
+        IO.stage_file(path+"windows_verts", verts, info)
+        IO.stage_file(path+"windows_faces", faces, info)
 
         return get_shape(verts, scale)
     
@@ -848,8 +821,8 @@ def generate_small_windows_file(img_path, info,svg=False,win_pol=[]):
     Windows
     '''
     #Create verts for window
-    v, faces, window_amount1 = transform.create_nx4_verts_and_faces(windows, height=0.25, scale=scale) # create low piece
-    v2, faces, window_amount2 = transform.create_nx4_verts_and_faces(windows, height=1, scale=scale, ground= 0.75) # create heigher piece
+    v, faces, window_amount1 = transform.create_nx4_verts_and_faces_array(windows, height=0.25, scale=scale) # create low piece
+    v2, faces, window_amount2 = transform.create_nx4_verts_and_faces_array(windows, height=1, scale=scale, ground= 0.75) # create heigher piece
 
     verts = v
     verts.extend(v2)
@@ -859,8 +832,8 @@ def generate_small_windows_file(img_path, info,svg=False,win_pol=[]):
         print("Windows created : ", window_amount)
 
 
-    IO.save_to_file(path+"windows_verts", verts, info)
-    IO.save_to_file(path+"windows_faces", faces, info)
+    IO.stage_file(path+"windows_verts", verts, info)
+    IO.stage_file(path+"windows_faces", faces, info)
 
     return get_shape(verts, scale)
 
@@ -889,7 +862,7 @@ def generate_doors_file(img_path, info,svg=False,CubiCasa = False, door_pol=None
         #Create verts
         room_count = 0
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, height)])
+            verts.extend([transform.scale_point_to_array(box, scale, height)])
             room_count+= 1
 
         # create faces
@@ -904,18 +877,17 @@ def generate_doors_file(img_path, info,svg=False,CubiCasa = False, door_pol=None
         if(info):
             print("Number of doors detected : ", room_count)
 
-        IO.save_to_file(path+"doors_verts", verts, info)
-        IO.save_to_file(path+"doors_faces", faces, info)
+        IO.stage_file(path+"doors_verts", verts, info)
+        IO.stage_file(path+"doors_faces", faces, info)
 
         return get_shape(verts, scale)
     
     if CubiCasa == True and polygons is not None and types is not None:
-        from shapely.geometry import MultiPolygon, Polygon
-        from shapely.ops import cascaded_union
+        import shapely
         
-        Doors = cascaded_union([Polygon(j) for i,j in enumerate(polygons) if types[i]['type']=='icon' and types[i]['class'] in [2]])
+        Doors = shapely.union_all(bulk_polygons([j for i,j in enumerate(polygons) if types[i]['type']=='icon' and types[i]['class'] in [2]]))
         
-        boxes = [np.array([[[i.exterior.coords.xy[0][j],i.exterior.coords.xy[1][j]]] for j in range(len(i.exterior.coords.xy[0]))]).astype('int32') for i in Doors]
+        boxes = polygon_boxes(simple_polygons(Doors))
 
         height = 0.999
 
@@ -931,7 +903,7 @@ def generate_doors_file(img_path, info,svg=False,CubiCasa = False, door_pol=None
         #Create verts
         room_count = 0
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, height)])
+            verts.extend([transform.scale_point_to_array(box, scale, height)])
             room_count+= 1
 
         # create faces
@@ -946,8 +918,8 @@ def generate_doors_file(img_path, info,svg=False,CubiCasa = False, door_pol=None
         if(info):
             print("Number of doors detected : ", room_count)
 
-        IO.save_to_file(path+"doors_verts", verts, info)
-        IO.save_to_file(path+"doors_faces", faces, info)
+        IO.stage_file(path+"doors_verts", verts, info)
+        IO.stage_file(path+"doors_faces", faces, info)
 
         return get_shape(verts, scale)
     
@@ -992,13 +964,13 @@ def generate_doors_file(img_path, info,svg=False,CubiCasa = False, door_pol=None
     Doors
     '''
     #Create verts for door
-    verts, faces, door_amount = transform.create_nx4_verts_and_faces(doors, height, scale)
+    verts, faces, door_amount = transform.create_nx4_verts_and_faces_array(doors, height, scale)
 
     if(info):
         print("Doors created : ", door_amount)
 
-    IO.save_to_file(path+"doors_verts", verts, info)
-    IO.save_to_file(path+"doors_faces", faces, info)
+    IO.stage_file(path+"doors_verts", verts, info)
+    IO.stage_file(path+"doors_faces", faces, info)
 
     return get_shape(verts, scale)
 
@@ -1038,7 +1010,7 @@ def generate_floor_file(img_path, info, SR=False ,SR_img = None):
     scale = 100
 
     #Create verts
-    verts = transform.scale_point_to_vector(contour, scale, height)
+    verts = transform.scale_point_to_array(contour, scale, height)
 
     # create faces
     count = 0
@@ -1050,11 +1022,80 @@ def generate_floor_file(img_path, info, SR=False ,SR_img = None):
     if(info):
         print("Approximated apartment size : ", cv2.contourArea(contour))
 
-    IO.save_to_file(path+"floor_verts", verts, info)
-    IO.save_to_file(path+"floor_faces", faces, info)
+    IO.stage_file(path+"floor_verts", verts, info)
+    IO.stage_file(path+"floor_faces", faces, info)
 
     return get_shape(verts, scale)
 
+def bulk_polygons(pols):
+    '''
+    Shapely polygons of many point lists in one call, invalid ones repaired
+    @Param pols, list of nx2 point lists, lists of less than 3 points are skipped
+    @Return array of shapely geometries
+    '''
+    import shapely
+    pols = [np.asarray(i, dtype=np.float64).reshape(-1, 2) for i in pols]
+    pols = [i for i in pols if len(i) >= 3]
+    if not pols:
+        return np.array([], dtype=object)
+    coords = np.concatenate(pols)
+    indices = np.repeat(np.arange(len(pols)), [len(i) for i in pols])
+    geoms = shapely.polygons(shapely.linearrings(coords, indices=indices))
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        geoms[invalid] = shapely.make_valid(geoms[invalid])
+    return geoms
+
+def simple_polygons(geom):
+    '''
+    Polygons without holes covering a geometry
+    Polygons with holes are split by a vertical line through a hole until none is left,
+    the mesh files only hold one outline per wall piece.
+    @Param geom, shapely geometry
+    @Return list of shapely Polygons
+    '''
+    import shapely
+    from shapely.geometry import LineString
+    from shapely.ops import split
+    out = []
+    todo = [i for i in shapely.get_parts(geom) if i.geom_type == 'Polygon' and not i.is_empty]
+    while todo:
+        p = todo.pop()
+        if len(p.interiors) == 0:
+            out.append(p)
+            continue
+        x = p.interiors[0].centroid.x
+        minx, miny, maxx, maxy = p.bounds
+        parts = split(p, LineString([(x, miny - 1), (x, maxy + 1)]))
+        todo.extend(i for i in shapely.get_parts(parts) if i.geom_type == 'Polygon' and not i.is_empty)
+    out.reverse()
+    return out
+
+def wall_pieces(walls, openings):
+    '''
+    Walls with doors, windows and icons cut out
+    The walls are merged with union_all, every merged piece only subtracts the
+    openings an STRtree finds intersecting it.
+    @Param walls, list of wall point lists
+    @Param openings, list of opening point lists
+    @Return list of shapely Polygons without holes
+    '''
+    import shapely
+    pieces = shapely.get_parts(shapely.union_all(bulk_polygons(walls)))
+    holes = bulk_polygons(openings)
+    if len(holes) and len(pieces):
+        tree = shapely.STRtree(holes)
+        piece_idx, hole_idx = tree.query(pieces, predicate='intersects')
+        for i in np.unique(piece_idx):
+            pieces[i] = shapely.difference(pieces[i], shapely.union_all(holes[hole_idx[piece_idx == i]]))
+    return [p for i in pieces for p in simple_polygons(i)]
+
+def polygon_boxes(polygons):
+    '''
+    Outlines as int32 boxes, the format of detect.detectPreciseBoxes
+    '''
+    return [np.asarray(i.exterior.coords).astype('int32').reshape(-1, 1, 2) for i in polygons]
+
 def generate_walls_file(img_path, info, CubiCasa=False,svg = False, polygons=[],types=[],wall=[],windows=[],doors=[],icons=[],rooms=[]):
     '''
     Generate wall data file for floorplan
@@ -1064,16 +1105,10 @@ def generate_walls_file(img_path, info, CubiCasa=False,svg = False, polygons=[],
     '''
     # Get Boxes from CubiCasa workflow
     if svg == True:
-        from shapely.geometry import MultiPolygon, Polygon
-        from shapely.ops import cascaded_union
-       
-        Walls = cascaded_union([Polygon(i) for i in wall])
-        Icons = [icons,doors,windows]
-        
-        Icons = cascaded_union([MultiPolygon([Polygon(j) for j in i]) for i in Icons])
-        
-        polygons = Walls.difference(Icons)
-        boxes = [np.array([[[i.exterior.coords.xy[0][j],i.exterior.coords.xy[1][j]]] for j in range(len(i.exterior.coords.xy[0]))]).astype('int32') for i in polygons]
+        with span('wall_union', walls=len(wall)) as counts:
+            polygons = wall_pieces(list(wall), list(icons)+list(doors)+list(windows))
+            counts['pieces'] = len(polygons)
+        boxes = polygon_boxes(polygons)
 
         # create verts (points 3d), points to use in mesh creations
         verts = []
@@ -1087,19 +1122,19 @@ def generate_walls_file(img_path, info, CubiCasa=False,svg = False, polygons=[],
         scale = 100
 
         # Convert boxes to verts and faces
-        verts, faces, wall_amount = transform.create_nx4_verts_and_faces(boxes, wall_height, scale)
+        verts, faces, wall_amount = transform.create_nx4_verts_and_faces_array(boxes, wall_height, scale)
 
         if(info):
             print("Walls created : ", wall_amount)
 
         # One solution to get data to blender is to write and read from file.
-        IO.save_to_file(path+"wall_verts", verts, info)
-        IO.save_to_file(path+"wall_faces", faces, info)
+        IO.stage_file(path+"wall_verts", verts, info)
+        IO.stage_file(path+"wall_faces", faces, info)
 
         # Create top walls verts
         verts = []
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, 0)])
+            verts.extend([transform.scale_point_to_array(box, scale, 0)])
 
         # create faces
         faces = []
@@ -1112,23 +1147,19 @@ def generate_walls_file(img_path, info, CubiCasa=False,svg = False, polygons=[],
             faces.append([(temp)])
 
         # One solution to get data to blender is to write and read from file.
-        IO.save_to_file(path+"top_wall_verts", verts, info)
-        IO.save_to_file(path+"top_wall_faces", faces, info)
+        IO.stage_file(path+"top_wall_verts", verts, info)
+        IO.stage_file(path+"top_wall_faces", faces, info)
 
         return get_shape(verts, scale)
     
     if CubiCasa == True:
         
-        from shapely.geometry import MultiPolygon, Polygon
-        from shapely.ops import cascaded_union
-        
-        Walls = cascaded_union([Polygon(j) for i,j in enumerate(polygons) if types[i]['type']=='wall'])
-        
-        Icons = cascaded_union([Polygon(j) for i,j in enumerate(polygons) if types[i]['type']=='icon' and types[i]['class'] in [1,2]])
+        Walls = [j for i,j in enumerate(polygons) if types[i]['type']=='wall']
         
+        Icons = [j for i,j in enumerate(polygons) if types[i]['type']=='icon' and types[i]['class'] in [1,2]]
         
-        polygons = Walls.difference(Icons)
-        boxes = [np.array([[[i.exterior.coords.xy[0][j],i.exterior.coords.xy[1][j]]] for j in range(len(i.exterior.coords.xy[0]))]).astype('int32') for i in polygons]
+        polygons = wall_pieces(Walls, Icons)
+        boxes = polygon_boxes(polygons)
 
         # create verts (points 3d), points to use in mesh creations
         verts = []
@@ -1142,19 +1173,19 @@ def generate_walls_file(img_path, info, CubiCasa=False,svg = False, polygons=[],
         scale = 100
 
         # Convert boxes to verts and faces
-        verts, faces, wall_amount = transform.create_nx4_verts_and_faces(boxes, wall_height, scale)
+        verts, faces, wall_amount = transform.create_nx4_verts_and_faces_array(boxes, wall_height, scale)
 
         if(info):
             print("Walls created : ", wall_amount)
 
         # One solution to get data to blender is to write and read from file.
-        IO.save_to_file(path+"wall_verts", verts, info)
-        IO.save_to_file(path+"wall_faces", faces, info)
+        IO.stage_file(path+"wall_verts", verts, info)
+        IO.stage_file(path+"wall_faces", faces, info)
 
         # Create top walls verts
         verts = []
         for box in boxes:
-            verts.extend([transform.scale_point_to_vector(box, scale, 0)])
+            verts.extend([transform.scale_point_to_array(box, scale, 0)])
 
         # create faces
         faces = []
@@ -1167,8 +1198,8 @@ def generate_walls_file(img_path, info, CubiCasa=False,svg = False, polygons=[],
             faces.append([(temp)])
 
         # One solution to get data to blender is to write and read from file.
-        IO.save_to_file(path+"top_wall_verts", verts, info)
-        IO.save_to_file(path+"top_wall_faces", faces, info)
+        IO.stage_file(path+"top_wall_verts", verts, info)
+        IO.stage_file(path+"top_wall_faces", faces, info)
 
         return get_shape(verts, scale)
             
@@ -1196,19 +1227,19 @@ def generate_walls_file(img_path, info, CubiCasa=False,svg = False, polygons=[],
     scale = 100
 
     # Convert boxes to verts and faces
-    verts, faces, wall_amount = transform.create_nx4_verts_and_faces(boxes, wall_height, scale)
+    verts, faces, wall_amount = transform.create_nx4_verts_and_faces_array(boxes, wall_height, scale)
 
     if(info):
         print("Walls created : ", wall_amount)
 
     # One solution to get data to blender is to write and read from file.
-    IO.save_to_file(path+"wall_verts", verts, info)
-    IO.save_to_file(path+"wall_faces", faces, info)
+    IO.stage_file(path+"wall_verts", verts, info)
+    IO.stage_file(path+"wall_faces", faces, info)
 
     # Create top walls verts
     verts = []
     for box in boxes:
-        verts.extend([transform.scale_point_to_vector(box, scale, 0)])
+        verts.extend([transform.scale_point_to_array(box, scale, 0)])
 
     # create faces
     faces = []
@@ -1221,7 +1252,7 @@ def generate_walls_file(img_path, info, CubiCasa=False,svg = False, polygons=[],
         faces.append([(temp)])
 
     # One solution to get data to blender is to write and read from file.
-    IO.save_to_file(path+"top_wall_verts", verts, info)
-    IO.save_to_file(path+"top_wall_faces", faces, info)
+    IO.stage_file(path+"top_wall_verts", verts, info)
+    IO.stage_file(path+"top_wall_faces", faces, info)
 
     return get_shape(verts, scale)
\ No newline at end of file
@@ -30,6 +30,31 @@ def recursive_loop_element(thelist, res):
             res.extend( recursive_loop_element(thelist[0], []))
             return  recursive_loop_element(thelist[1:], res)
 
+def flatten_array(thelist):
+    '''
+    Flatten array
+    Transforms any nested list or array to a one dimentional numpy array,
+    without recursing over the elements of a level
+    @Param thelist, incoming list
+    @Return res, float array
+    '''
+    try:
+        return np.asarray(thelist, dtype=np.float64).ravel()
+    except (ValueError, TypeError):
+        # ragged, only the levels that differ in length are looped
+        parts = [flatten_array(i) for i in thelist]
+        return np.concatenate(parts) if parts else np.zeros(0)
+
+def verts_to_array(verts):
+    '''
+    Verts to array
+    Convert any verts array to an array of positions
+    @Param verts of undecided size
+    @Return res, nx3 array
+    '''
+    flat = flatten_array(verts)
+    return flat[:len(flat) - len(flat) % 3].reshape(-1, 3)
+
 def verts_to_poslist(verts):
     '''
     Verts to poslist
@@ -37,14 +62,44 @@ def verts_to_poslist(verts):
     @Param verts of undecided size
     @Return res, list of position
     '''
-    list_of_elements = recursive_loop_element(verts, [])
+    return verts_to_array(verts).tolist()
 
-    res = []
-    i = 0
-    while(i < len(list_of_elements)-1):
-        res.append([list_of_elements[i],list_of_elements[i+1],list_of_elements[i+2]])
-        i+= 3
-    return res
+def bounding_box(verts):
+    '''
+    Bounding box
+    @Param verts of undecided size
+    @Return low, high, arrays of the smallest and largest x, y, z
+    '''
+    pos = verts_to_array(verts)
+    if len(pos) == 0:
+        return np.zeros(3), np.zeros(3)
+    return pos.min(axis=0), pos.max(axis=0)
+
+def verts_shape(verts):
+    '''
+    Shape
+    Size of the verts, measured from the origin when all positions are negative
+    @Param verts of undecided size
+    @Return [x, y, z] size
+    '''
+    low, high = bounding_box(verts)
+    return (np.maximum(high, 0) - low).tolist()
+
+def points_array(boxes):
+    '''
+    Points array
+    All 2d points of boxes, e.g. contours as k x 1 x 2 arrays
+    @Param boxes
+    @Return nx2 array
+    '''
+    try:
+        arr = np.asarray(boxes, dtype=np.float64)
+        if arr.size == 0:
+            return np.zeros((0, 2))
+        return arr.reshape(-1, arr.shape[-1])[:, :2]
+    except (ValueError, TypeError):
+        parts = [points_array(i) for i in boxes]
+        return np.concatenate(parts) if parts else np.zeros((0, 2))
 
 def scale_point_to_vector(boxes, scale = 1, height = 0):
     '''
@@ -61,6 +116,17 @@ def scale_point_to_vector(boxes, scale = 1, height = 0):
     return res
 
 
+def scale_point_to_array(boxes, scale = 1, height = 0):
+    '''
+    Scale point to array
+    scale_point_to_vector returning an nx3 array
+    @Param boxes
+    @Param scale
+    @Param height
+    '''
+    pts = points_array(boxes)
+    return np.column_stack([pts[:, 0]/scale, pts[:, 1]/scale, np.full(len(pts), height, dtype=np.float64)])
+
 def write_verts_on_2d_image(boxes, blank_image):
     '''
     Write verts as lines and show image
@@ -119,6 +185,32 @@ def create_nx4_verts_and_faces(boxes, height = 1, scale = 1, ground = 0):
     faces = [(0, 1, 3, 2)]
     return verts, faces, wall_counter
 
+def create_nx4_verts_and_faces_array(boxes, height = 1, scale = 1, ground = 0):
+    '''
+    Create verts and faces
+    create_nx4_verts_and_faces returning arrays
+    @Param boxes,
+    @Param height,
+    @Param scale,
+    @Return verts - as list of k x 4 x 3 arrays, one per box, faces - as array to use on all boxes, wall_amount - as integer
+    '''
+    verts = []
+    wall_counter = 0
+    for box in boxes:
+        b = np.asarray(box, dtype=np.float64)
+        # first point of every element, like box[index][0]
+        curr = (b[:, 0, :2] if b.ndim == 3 else b[:, :2]) / scale
+        # is last, link to first
+        next = np.roll(curr, -1, axis=0)
+        low = np.full((len(curr), 1), ground, dtype=np.float64)
+        high = np.full((len(curr), 1), height, dtype=np.float64)
+        verts.append(np.stack([np.hstack([curr, low]), np.hstack([curr, high]),
+                               np.hstack([next, low]), np.hstack([next, high])], axis=1))
+        wall_counter += len(curr)
+
+    faces = [(0, 1, 3, 2)]
+    return verts, faces, wall_counter
+
 def create_verts(boxes, height, scale):
     '''
     Simplified converts 2d poses to 3d poses, and adds a height position
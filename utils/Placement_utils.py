@@ -1,9 +1,6 @@
-from shapely.geometry import Polygon, box, MultiPolygon, LineString, Point
-from sympy import Point as Pnt
-from sympy import Polygon as Pol
-from sympy import Segment, N
-import time
+from shapely.geometry import Polygon, MultiPolygon, LineString, Point
 import numpy as np 
+from utils.scene_file import Scene, load_scene
 
 global Room_add_list
 Room_add_list = {'Bedroom':{'Bed':[1,True],
@@ -19,63 +16,253 @@ Room_add_list = {'Bedroom':{'Bed':[1,True],
                         },
                 }
 
+# +x, +y, -x, -y, the rays of Shapley3Dobj.ray_trace
+RAY_DIRECTIONS = np.array([[1.,0.],[0.,1.],[-1.,0.],[0.,-1.]])
+
+def cast_rays(origins, directions, points):
+    '''
+    Intersect rays with all edges of a polygon at once
+    @Param origins, nx2 ray starts, or one point for all rays
+    @Param directions, nx2 ray directions
+    @Param points, mx2 closed outline, last point = first, as exterior.coords
+    @Return hits nx2, distances n, edge indices n of the nearest hit of every ray,
+    edge i runs from points[i] to points[i+1], nan / inf / -1 for rays that hit nothing
+    '''
+    d = np.asarray(directions, dtype=float).reshape(-1, 2)
+    o = np.broadcast_to(np.asarray(origins, dtype=float), d.shape)
+    points = np.asarray(points, dtype=float)[:, :2]
+    a = points[:-1]
+    e = points[1:]-points[:-1]
+    # o + t d = a + s e for every ray (rows) and edge (columns)
+    w = a[None, :, :]-o[:, None, :]
+    denom = d[:, None, 0]*e[None, :, 1]-d[:, None, 1]*e[None, :, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (w[..., 0]*e[None, :, 1]-w[..., 1]*e[None, :, 0])/denom
+        s = (w[..., 0]*d[:, None, 1]-w[..., 1]*d[:, None, 0])/denom
+    eps = 1e-9
+    # parallel edges never count, a ray along a wall hits the walls at its ends
+    valid = (denom != 0) & (t >= 0) & (s >= -eps) & (s <= 1+eps)
+    t = np.where(valid, t, np.inf)
+    edges = np.argmin(t, axis=1)
+    t = t[np.arange(len(d)), edges]
+    missed = np.isinf(t)
+    hits = np.where(missed[:, None], np.nan, o+np.where(missed, 0, t)[:, None]*d)
+    dists = t*np.linalg.norm(d, axis=1)
+    edges[missed] = -1
+    return hits, dists, edges
+
+# Cell size in meters of the OccupancyRaster used to sample object positions
+RASTER_RESOLUTION = 0.05
+# Most free raster cells Place_Object tries as start point before giving up
+PLACE_TRIES = 200
+# Place wall snapped objects at enumerated spots along the room edges instead of random retries
+SNAP_CANDIDATES = True
+# Spacing in meters of the snap candidates along an edge
+SNAP_STEP = 0.1
+# Doors and windows closer than this to a room edge block their span of it
+OPENING_GAP = 0.3
+
+class OccupancyRaster:
+    '''
+    Occupancy raster of a room
+    Cells of the room bounding box, taken by the walls and the objects placed so far.
+    A cell is free only if no part of it can touch a wall or an object, so a footprint
+    fitting on free cells fits in the room.
+    @Param room_pol, shapely polygon of the room
+    @Param objects, Shapley3Dobj in the room, windows are not obstacles as in Place_Object
+    @Param resolution, cell size in meters
+    '''
+    def __init__(self, room_pol, objects=[], resolution=RASTER_RESOLUTION):
+        import shapely
+        self.resolution = resolution
+        self.half_diag = resolution*np.sqrt(2)/2
+        x0,y0,x1,y1 = room_pol.bounds
+        self.X, self.Y = np.meshgrid(np.arange(x0+resolution/2, x1, resolution),
+                                     np.arange(y0+resolution/2, y1, resolution))
+        # cells closer to a wall than half their diagonal are not fully inside
+        self.occupied = ~shapely.contains_xy(room_pol.buffer(-self.half_diag), self.X, self.Y)
+        self.doors = []
+        for i in objects:
+            self.add(i)
+
+    def add(self, obj):
+        '''
+        Burn in the footprint of an object, doors also keep their clearance
+        '''
+        if 'Window' in obj.name:
+            return
+        if 'Door' in obj.name:
+            self.doors.append([obj.center(), np.max(obj.dims())])
+        self.burn(obj.obj_bb)
+
+    def burn(self, polygon):
+        import shapely
+        self.occupied |= shapely.contains_xy(polygon.buffer(self.half_diag), self.X, self.Y)
+
+    def feasible(self, width, depth, doors=True):
+        '''
+        Cells where an axis aligned width x depth footprint can be centered
+        The occupancy eroded by the footprint, a window sum over a summed area table
+        @Param doors, also keep the door clearance of Place_Object from the cell center
+        @Return boolean array of the raster shape
+        '''
+        kx = int(np.floor(width/2/self.resolution + 0.5))
+        ky = int(np.floor(depth/2/self.resolution + 0.5))
+        ny, nx = self.occupied.shape
+        # outside the raster is outside the room
+        occ = np.pad(self.occupied, ((ky, ky), (kx, kx)), constant_values=True)
+        S = np.zeros((occ.shape[0]+1, occ.shape[1]+1), dtype=np.int32)
+        S[1:, 1:] = occ.cumsum(axis=0).cumsum(axis=1)
+        a, b = 2*ky+1, 2*kx+1
+        free = (S[a:a+ny, b:b+nx] - S[:ny, b:b+nx] - S[a:a+ny, :nx] + S[:ny, :nx]) == 0
+        if not doors:
+            return free
+        # door clearance of Place_Object, between the centers
+        for (x, y), clearence in self.doors:
+            free &= np.hypot(self.X-x, self.Y-y) >= clearence + max(width, depth)/2
+        return free
+
+    def centers(self, width, depth, doors=True):
+        '''
+        Centers where the footprint fits unrotated or turned by 90 degrees
+        @Param doors, see feasible
+        @Return nx2 array of cell centers in random order, empty when the object fits nowhere
+        '''
+        free = np.flatnonzero(self.feasible(width, depth, doors) | self.feasible(depth, width, doors))
+        free = free[np.random.permutation(len(free))]
+        return np.column_stack([self.X.flat[free], self.Y.flat[free]])
+
+class RoomIndex:
+    '''
+    Room index
+    Footprints and door clearances of the objects in a room, for the collision test of
+    Place_Object and Snap_Object. Door centers and clearances are taken once when a door
+    is added, the STRtree of the footprints is rebuilt only when a query follows an add.
+    @Param objects, Shapley3Dobj in the room, windows are not obstacles
+    '''
+    def __init__(self, objects=[]):
+        self.footprints = []
+        # x, y, clearance of every door
+        self.doors = np.zeros((0, 3))
+        self.tree = None
+        for i in objects:
+            self.add(i)
+
+    def add(self, obj):
+        if 'Window' in obj.name:
+            return
+        if 'Door' in obj.name:
+            x, y = obj.center()
+            self.doors = np.append(self.doors, [[x, y, np.max(obj.dims())]], axis=0)
+        self.footprints.append(obj.obj_bb)
+        self.tree = None
+
+    def collides(self, footprint):
+        '''
+        Footprint overlaps an object or is within the clearance of a door
+        '''
+        import shapely
+        if self.footprints:
+            if self.tree is None:
+                self.tree = shapely.STRtree(self.footprints)
+            # the query geometry is prepared by the tree
+            if len(self.tree.query(footprint, predicate='intersects')):
+                return True
+        if len(self.doors):
+            x, y, X, Y = footprint.bounds
+            d = np.hypot(self.doors[:, 0]-(x+X)/2, self.doors[:, 1]-(y+Y)/2)
+            return bool(np.any(d < self.doors[:, 2] + max(X-x, Y-y)/2))
+        return False
+
+class Footprint:
+    '''
+    Footprint
+    Corners of an object box as a 4x2 array, moved and turned in place with one
+    matrix product. The shapely polygon is made on first use after a change.
+    @Param xmin, ymin, xmax, ymax, the unrotated box
+    '''
+    __slots__ = ['corners', '_polygon']
+
+    def __init__(self, xmin, ymin, xmax, ymax):
+        # corner order of shapely box
+        self.corners = np.array([[xmax, ymin], [xmax, ymax], [xmin, ymax], [xmin, ymin]], dtype=float)
+        self._polygon = None
+
+    @property
+    def polygon(self):
+        if self._polygon is None:
+            self._polygon = Polygon(self.corners)
+        return self._polygon
+
+    def center(self):
+        x, y = self.corners.mean(axis=0)
+        return float(x), float(y)
+
+    def dims(self):
+        return list(np.ptp(self.corners, axis=0))
+
+    def translate(self, dx, dy):
+        self.corners += [dx, dy]
+        self._polygon = None
+
+    def rotate(self, theta):
+        '''
+        Turn about the center
+        @Param theta, radians, counterclockwise
+        '''
+        c = self.corners.mean(axis=0)
+        rot_mat = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+        self.corners = (self.corners-c)@rot_mat.T+c
+        self._polygon = None
+
 class Shapley3Dobj:
-    
+    '''
+    An object box in a room
+    @Param room_pol, [x list, y list, z list] of the room outline
+    @Param obj_bb, [xmin, ymin, zmin, xmax, ymax, zmax]
+    '''
+    __slots__ = ['name', 'roomname', 'rotated', 'room_pol', 'room_points', 'footprint']
+
     def __init__(self,name, roomname, room_pol, obj_bb):
         self.name = name
         self.roomname = roomname 
         self.rotated = 0
         self.room_pol = Polygon([[i,j,k] for i,j,k in zip(room_pol[0],room_pol[1],room_pol[2])])
-        self.obj_bb = box(obj_bb[0],obj_bb[1],obj_bb[3],obj_bb[4])
+        # closed outline, room_points[i] to room_points[i+1] is edge i
+        self.room_points = np.array(self.room_pol.exterior.coords.xy).T
+        self.footprint = Footprint(obj_bb[0],obj_bb[1],obj_bb[3],obj_bb[4])
+
+    @property
+    def obj_bb(self):
+        return self.footprint.polygon
         
     def center(self):
-        return self.obj_bb.centroid.xy[0][0],self.obj_bb.centroid.xy[1][0]
+        return self.footprint.center()
     
     def is_inside(self):
         return self.room_pol.contains(self.obj_bb)
     
     def translate(self,x_c,y_c):
-        points = np.array(self.obj_bb.exterior.coords.xy)
-        points = points+np.array([[x_c,y_c]]).T
-        self.obj_bb = Polygon(points.T)
-        return self.obj_bb
+        self.footprint.translate(x_c,y_c)
+        return self.footprint
     
     def rotate(self,theta):
-        theta = np.radians(theta)
-        x_c,y_c = self.center()
-        points = np.array(self.obj_bb.exterior.coords.xy)-np.array([[x_c,y_c]]).T
-        rots = int(np.floor(theta/np.pi))
-        extra = theta-rots*np.pi
-        for i in range(rots):
-            rot_mat = np.array([[np.cos(np.pi),np.sign(rots)*-np.sin(np.pi)],[np.sign(rots)*np.sin(np.pi),np.cos(np.pi)]])
-            points = rot_mat@points
-        rot_mat = np.array([[np.cos(extra),-np.sin(extra)],[np.sin(extra),np.cos(extra)]])
-        points = rot_mat@points
-        self.obj_bb = Polygon((points+np.array([[x_c,y_c]]).T).T)
-        self.rotated += np.degrees(theta)
-        return self.obj_bb
+        self.footprint.rotate(np.radians(theta))
+        self.rotated += theta
+        return self.footprint
     
     def dims(self,room=False):
         if room==True:
-            bb_x,bb_y = np.min(np.array(self.room_pol.exterior.coords.xy),axis=1)
-            bb_X,bb_Y = np.max(np.array(self.room_pol.exterior.coords.xy),axis=1)
-            return [bb_X-bb_x,bb_Y-bb_y]
-        else:
-            bb_x,bb_y = np.min(np.array(self.obj_bb.exterior.coords.xy),axis=1)
-            bb_X,bb_Y = np.max(np.array(self.obj_bb.exterior.coords.xy),axis=1)
+            bb_x,bb_y,bb_X,bb_Y = self.room_pol.bounds
             return [bb_X-bb_x,bb_Y-bb_y]
+        return self.footprint.dims()
         
     def get_room_lines(self):
-        points = np.array(self.room_pol.exterior.coords.xy).T
-        points = np.append(points,points[[0],:],axis=0)
-        lines = []
-        for i in range(len(points)-2):
-            lines.append(LineString([Point(*points[i]),Point(*points[i+1])]))
-        return lines
+        points = self.room_points
+        return [LineString([points[i],points[i+1]]) for i in range(len(points)-1)]
     
     def random_point_in_room(self):
-        bb_x,bb_y = np.min(np.array(self.room_pol.exterior.coords.xy),axis=1)
-        bb_X,bb_Y = np.max(np.array(self.room_pol.exterior.coords.xy),axis=1)
+        bb_x,bb_y,bb_X,bb_Y = self.room_pol.bounds
         while True:
             X = bb_x+(bb_X-bb_x)*np.random.rand(1)
             Y = bb_y+(bb_Y-bb_y)*np.random.rand(1)
@@ -83,9 +270,9 @@ class Shapley3Dobj:
                 return X,Y
     
     def orient_to_nearest_wall(self):
-        int_point, ind, dists = self.ray_trace()
-        line_no = np.argmax([i.intersects(Point(*int_point[ind]).buffer(0.00001)) for i in self.get_room_lines()])
-        V = np.array(self.get_room_lines()[line_no].coords.xy).T
+        int_point, ind, dists, edges = self.ray_trace()
+        # edge i of the outline is get_room_lines()[i]
+        V = self.room_points[edges[ind]:edges[ind]+2]
         orient = np.array([[0,1],[-1,0]])@((V[[1]]-V[[0]])/np.linalg.norm(V[1]-V[0])).T
         orient = orient.T[0]
         ref = np.array([0,-1])
@@ -94,18 +281,25 @@ class Shapley3Dobj:
         else:
             return np.degrees(np.arccos(np.dot(orient,ref)/(np.linalg.norm(orient) * np.linalg.norm(ref)))),int_point[ind],int_point,dists
     
-    def Place_Object(self,room_objects,snap=True):
-        import time
-        start = time.time()
-        while True:
-            while True:
-                x,y = self.random_point_in_room()
-                x_c,y_c = self.center()
-                self.translate(x[0]-x_c,y[0]-y_c)
-                if time.time()-start>10:
-                    return False
-                if self.is_inside()==True:
-                    break
+    def Place_Object(self,room_objects,snap=True,raster=None,index=None):
+        '''
+        Move the object to a random free spot of its room, turned to the nearest wall
+        At most PLACE_TRIES random free raster cells are tried once each as start point,
+        the turned or snapped object is checked against room_objects at its final spot
+        @Param room_objects, Shapley3Dobj already in the room
+        @Param snap, push the object against that wall
+        @Param raster, OccupancyRaster of room_objects, made when None
+        @Param index, RoomIndex of room_objects, made when None
+        @Return placed, False when none of the tried cells gives a free spot
+        '''
+        if raster is None:
+            raster = OccupancyRaster(self.room_pol, room_objects)
+        if index is None:
+            index = RoomIndex(room_objects)
+        # a snapped object leaves its cell, its door clearance is only known at the wall
+        for point in raster.centers(*self.dims(),doors=not snap)[:PLACE_TRIES]:
+            x_c,y_c = self.center()
+            self.translate(point[0]-x_c,point[1]-y_c)
             if snap == True:
                 x_l,y_l = self.dims()
                 theta,to_point,_,_ = self.orient_to_nearest_wall()
@@ -117,50 +311,81 @@ class Shapley3Dobj:
             else:
                 theta,to_point,_,_ = self.orient_to_nearest_wall()
                 self.rotate(theta)
-            check = False
-            for i in room_objects:
-                if 'Window' not in i.name:
-                    if i.obj_bb.intersects(self.obj_bb):
-                        check = True
-                        break
-            for i in room_objects:
-                if 'Door' in i.name:
-                    h,w = i.dims()
-                    clearence = np.max([h,w])
-                    h,w = self.dims()
-                    clearence += np.max([h,w])/2
-                    if np.linalg.norm(np.array(i.center())-np.array(self.center()))<clearence:
-                        check = True
-                        break
-            if time.time()-start>10:
-                return False
-            if check:
-                self.rotate(-theta)
-                continue
-            else:
-                break
-        
-        return True
+            if not index.collides(self.obj_bb):
+                return True
+            self.rotate(-theta)
+        print(self.name+" does not fit in "+self.roomname)
+        return False
                 
+    def snap_candidates(self,room_objects,step=SNAP_STEP):
+        '''
+        Spots with the back of the object against a room edge
+        Every edge long enough for the object width gets a spot every step meters, spans of
+        the edge taken by a door or a window are left out
+        @Return list of (theta, x, y, 4x2 corners) in random order, theta as orient_to_nearest_wall gives it
+        '''
+        width,depth = self.dims()
+        points = self.room_points
+        openings = [i for i in room_objects if 'Door' in i.name or 'Window' in i.name]
+        candidates = []
+        for a,b in zip(points[:-1],points[1:]):
+            L = np.linalg.norm(b-a)
+            if L < width:
+                continue
+            u = (b-a)/L
+            # normal of orient_to_nearest_wall, flipped if it points out of the room
+            n = np.array([u[1],-u[0]])
+            if not self.room_pol.contains(Point(*((a+b)/2+n*1e-3))):
+                n = -n
+            theta = (np.degrees(np.arctan2(n[1],n[0]))+90)%360
+            edge = LineString([a,b])
+            spans = []
+            for i in openings:
+                if i.obj_bb.distance(edge) < OPENING_GAP:
+                    s = (i.footprint.corners-a)@u
+                    spans.append([s.min(),s.max()])
+            s = np.unique(np.append(np.arange(width/2,L-width/2,step),L-width/2))
+            for lo,hi in spans:
+                s = s[(s+width/2 <= lo) | (s-width/2 >= hi)]
+            # object x axis after rotate(theta), along the edge
+            v = np.array([-n[1],n[0]])
+            for k in s:
+                c = a+u*k+n*depth/2
+                corners = np.array([c+v*width/2*i+n*depth/2*j for i,j in [(-1,-1),(1,-1),(1,1),(-1,1)]])
+                candidates.append((theta,c[0],c[1],corners))
+        return [candidates[i] for i in np.random.permutation(len(candidates))]
+
+    def Snap_Object(self,room_objects,index=None):
+        '''
+        Put the object against a wall at the first free spot of snap_candidates
+        Every spot is checked once, so the cost is fixed and a free spot is always found
+        @Param index, RoomIndex of room_objects, made when None
+        @Return placed
+        '''
+        if index is None:
+            index = RoomIndex(room_objects)
+        # corners on the wall may fall outside the room by rounding
+        room = self.room_pol.buffer(1e-6)
+        for theta,x,y,corners in self.snap_candidates(room_objects):
+            footprint = Polygon(corners)
+            if not room.contains(footprint) or index.collides(footprint):
+                continue
+            self.rotate(theta)
+            x_c,y_c = self.center()
+            self.translate(x-x_c,y-y_c)
+            return True
+        print(self.name+" does not fit against a wall of "+self.roomname)
+        return False
+
     def ray_trace(self):
+        '''
+        Walls hit by rays along the axes from the object center, see cast_rays
+        @Return hit points, index of the closest ray, distances, hit edge indices
+        '''
         x,y = self.center()
-        points = np.array(self.room_pol.exterior.coords.xy).T
-        Sym_pol = Pol(*points)
-        bb_x,bb_y = np.min(np.array(self.room_pol.exterior.coords.xy),axis=1)
-        bb_X,bb_Y = np.max(np.array(self.room_pol.exterior.coords.xy),axis=1)
-        d = np.max([bb_X-bb_x,bb_Y-bb_y])
-        rays = [Segment((x,y),(x+d,y)),
-                Segment((x,y),(x,y+d)),
-                Segment((x,y),(x-d,y)),
-                Segment((x,y),(x,y-d))]
-        ints = []
-        dists = []
-        for i,j in enumerate(rays):
-            end_point = N(j.intersection(Sym_pol)[0])
-            dists.append(np.linalg.norm(np.array([float(end_point.x),float(end_point.y)])-np.array([x,y])))
-            ints.append([float(end_point.x),float(end_point.y)])
+        ints, dists, edges = cast_rays([x,y], RAY_DIRECTIONS, self.room_points)
         closest_ray = np.argmin(dists)
-        return ints,closest_ray,dists
+        return ints.tolist(),closest_ray,dists.tolist(),edges
             
     def viz(self):
         return MultiPolygon([self.obj_bb,self.room_pol])
@@ -177,16 +402,25 @@ def read_object_boxes(config):
             BB[name]=bb
     return BB
     
-def create_room_with_objects(roomname,config):
-    room_with_objects = []
-    Rooms, BB, Inf = extract_polygons(config)
-    Cubi_Pols = [[i,BB[i]] for i in Inf[roomname][2] if i !='']+[['Door'+str(i),BB['Door'+str(i)]] for i in Inf[roomname][0]]+[['Window'+str(i),BB['Window'+str(i)]] for i in Inf[roomname][1]]
-    for i in Cubi_Pols:
-        room_with_objects.append(Shapley3Dobj(i[0],roomname,Rooms[roomname],i[1]))
-    return room_with_objects
-
-def get_objects_for_room(roomname,Room_add_list,config):
-    D = read_object_boxes(config)
+def as_scene(plan, config):
+    '''
+    Scene of a plan argument
+    @Param plan, Scene, (Rooms, BB, Inf) of Placement_Info.plan_polygons, or None to load the program folder
+    '''
+    if plan is None:
+        return extract_polygons(config)
+    if isinstance(plan, Scene):
+        return plan
+    return Scene.from_polygons(*plan)
+
+def create_room_with_objects(roomname,config,plan=None):
+    scene = as_scene(plan, config)
+    room_pol = scene.rooms[roomname].polygon
+    return [Shapley3Dobj(name,roomname,room_pol,bb) for name, bb in scene.room_boxes(roomname)]
+
+def get_objects_for_room(roomname,Room_add_list,config,D=None):
+    if D is None:
+        D = read_object_boxes(config)
     all_objects = np.unique([i.split('_')[0] for i in D])
     type_nos = []
     count = 0
@@ -203,47 +437,52 @@ def get_objects_for_room(roomname,Room_add_list,config):
             selected_objs.append([i+'_'+str(np.random.randint(type_nos[np.where(all_objects==i)[0][0]])+1),Room_add_list[roomname][i][1]])
     return selected_objs          
     
-def add_objects_to_room(roomname,config):
-    D = read_object_boxes(config)
-    Rooms, BB, Inf = extract_polygons(config)
-    object_list = create_room_with_objects(roomname,config)
-    objects = get_objects_for_room(roomname,Room_add_list,config)
+def add_objects_to_room(roomname,config,plan=None,D=None):
+    '''
+    Place the objects of Room_add_list in a room
+    @Param plan, Scene or (Rooms, BB, Inf), loaded from the program folder when None
+    @Param D, object boxes of read_object_boxes, read when None
+    '''
+    if D is None:
+        D = read_object_boxes(config)
+    scene = as_scene(plan, config)
+    room_pol = scene.rooms[roomname].polygon
+    object_list = create_room_with_objects(roomname,config,scene)
+    objects = get_objects_for_room(roomname,Room_add_list,config,D)
     obj_polygons = [[i[0],D[i[0]],i[1]] for i in objects] 
-    add_new = []
+    raster = None
+    index = RoomIndex(object_list)
     for i in obj_polygons:
-        C = Shapley3Dobj(i[0],roomname,Rooms[roomname],i[1])
-        check = C.Place_Object(object_list,snap=i[2])
+        C = Shapley3Dobj(i[0],roomname,room_pol,i[1])
+        if raster is None:
+            raster = OccupancyRaster(C.room_pol, object_list)
+        if i[2] and SNAP_CANDIDATES:
+            check = C.Snap_Object(object_list,index=index)
+        else:
+            check = C.Place_Object(object_list,snap=i[2],raster=raster,index=index)
         if check:
             object_list.append(C)
+            raster.add(C)
+            index.add(C)
     return object_list
     
+def place_objects(config,plan=None):
+    '''
+    Place objects in every room type of Room_add_list
+    @Param plan, Scene or (Rooms, BB, Inf), loaded from the program folder when None
+    @Return list of Shapley3Dobj, the placed ones have a '_' in their name
+    '''
+    scene = as_scene(plan, config)
+    boxes = read_object_boxes(config)
+    D = []
+    for i in scene.rooms:
+        if scene.rooms[i].type in Room_add_list:
+            D += add_objects_to_room(i,config,scene,boxes)
+    return D
+
 def extract_polygons(config):
-    Rooms = config.program_path+'/'+'rooms.txt'
-    n = open(Rooms,'r')
-    Rooms = n.readlines()
-    no_rooms = len(Rooms)/3
-    XYZ = {}
-    for i in range(int(no_rooms)):
-        xyz = Rooms[(i)*3:(i+1)*3]
-        name = xyz[0].split(',')[0]
-        x = [float(i) for i in xyz[0].split(',')[1:]]
-        y = [float(i) for i in xyz[1].split(',')[1:]]
-        z = [float(i) for i in xyz[2].split(',')[1:]]
-        XYZ[name]=[x,y,z]
-    Rooms = XYZ
-    Objects = config.program_path+'/'+'objects.txt'
-    n = open(Objects,'r')
-    Objects = n.readlines()
-    BB = {}
-    for i in Objects:
-        name = i.split(',')[0]
-        bb = [float(j) for j in i.split(',')[1:]]
-        BB[name]=bb
-    Room_info = config.program_path+'/'+'rooms_info.txt'
-    n = open(Room_info,'r')
-    Room_info = n.readlines()
-    Inf={}
-    for i in range(int(len(Room_info)/4)):
-        name,d,w,o = Room_info[(i)*4:(i+1)*4]
-        Inf[name[:-1]]=[[int(i) for i in d.split(',')[:-1]],[int(i) for i in w.split(',')[:-1]],o[:-2].split(',')]
-    return Rooms, BB, Inf
\ No newline at end of file
+    '''
+    Scene Placement_Info.py wrote into the program folder, see utils.scene_file
+    @Return Scene
+    '''
+    return load_scene(config.program_path)
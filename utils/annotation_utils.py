@@ -0,0 +1,26 @@
+import numpy as np
+
+'''
+Annotation utils
+Label transfer helpers of annotate-Blocky.py that do not need Blender,
+kept here so they can be benchmarked and reused outside Blender.
+'''
+
+def Annotate_Using_dd_list(Upsampled,Downsampled,ll):
+    batch_size = 1000
+    iters = len(Upsampled)/batch_size
+    L = len(Downsampled)
+    annotated = np.repeat(np.array([Downsampled]),batch_size,axis=0).swapaxes(0,1)
+    Labels_up = []
+
+    for i in range(int(np.floor(iters))+1):
+        batch = Upsampled[batch_size*i:batch_size*(i+1)]
+        batch = np.repeat(np.array([batch]),L,axis=0)
+        if i == int(np.floor(iters)):
+            annotated = np.repeat(np.array([Downsampled]),len(Upsampled[batch_size*i:batch_size*(i+1)]),axis=0).swapaxes(0,1)
+        dists = (batch - annotated)**2
+        dists = np.sum(dists,axis=2)
+        inds = np.argmin(dists,axis=0)
+        Labels_up.append(ll[inds])
+    Labels_up = np.hstack(Labels_up)
+    return Labels_up
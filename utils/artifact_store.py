@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+
+'''
+Artifact store
+Numbered floorplan folders (Data/<n>/) with a SQLite index of what they hold.
+
+New plan folders get their number from the index in one transaction, so two
+processes sharing Data/ never get the same folder and nothing walks the tree.
+Every plan row keeps the source SVG and image, door and window counts, the
+generated files, the output folder and a status
+(allocated -> generated -> placed -> rendered -> annotated, or empty),
+and one row per room with the Blender name and the room type.
+
+Folders made before the index existed are added once, as status unindexed.
+
+Query it with
+python -m utils.artifact_store Data/ --room Bedroom:2 --not-status rendered annotated
+'''
+
+STORE_FILE = 'plans.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT,
+    svg TEXT,
+    image TEXT,
+    status TEXT,
+    doors INTEGER,
+    windows INTEGER,
+    files TEXT,
+    output TEXT,
+    created REAL,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS rooms (
+    plan_id INTEGER REFERENCES plans(id),
+    idx INTEGER,
+    name TEXT,
+    type TEXT,
+    PRIMARY KEY (plan_id, idx)
+);
+CREATE INDEX IF NOT EXISTS rooms_type ON rooms(type);
+CREATE INDEX IF NOT EXISTS plans_status ON plans(status);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+'''
+
+# Columns record_plan may set
+PLAN_FIELDS = ['svg', 'image', 'status', 'doors', 'windows', 'files', 'output']
+
+def plan_number(path):
+    '''
+    Number of a plan folder, Data/3/ -> 3
+    '''
+    return int(os.path.basename(os.path.normpath(path)))
+
+class ArtifactStore:
+    '''
+    Index of the plan folders below root
+    @Param root, data folder, e.g. Data/
+    '''
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, STORE_FILE), timeout=60, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def folder(self, plan_id):
+        return os.path.join(self.root, str(plan_id)) + "/"
+
+    def _index_existing(self):
+        # one time, inside the allocation transaction
+        if self.db.execute("SELECT value FROM meta WHERE key = 'indexed'").fetchone() is not None:
+            return
+        now = time.time()
+        for name in os.listdir(self.root):
+            if name.isdigit() and os.path.isdir(os.path.join(self.root, name)):
+                self.db.execute("INSERT OR IGNORE INTO plans (id, path, status, created, updated) VALUES (?, ?, 'unindexed', ?, ?)",
+                                (int(name), self.folder(int(name)), now, now))
+        self.db.execute("INSERT INTO meta (key, value) VALUES ('indexed', '1')")
+
+    def allocate(self, **fields):
+        '''
+        Reserve the next plan folder
+        @Param fields, initial values of PLAN_FIELDS
+        @Return folder path, e.g. Data/4/
+        '''
+        while True:
+            now = time.time()
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self._index_existing()
+                if self.db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'plans'").fetchone() is None:
+                    # numbering starts at Data/0/ as before the index, AUTOINCREMENT would start at 1
+                    cur = self.db.execute("INSERT INTO plans (id, status, created, updated) VALUES (0, 'allocated', ?, ?)", (now, now))
+                else:
+                    cur = self.db.execute("INSERT INTO plans (status, created, updated) VALUES ('allocated', ?, ?)", (now, now))
+                plan_id = cur.lastrowid
+                path = self.folder(plan_id)
+                self.db.execute("UPDATE plans SET path = ? WHERE id = ?", (path, plan_id))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            try:
+                os.makedirs(path)
+            except FileExistsError:
+                # made by something that does not use the index, leave it alone
+                self.record_plan(path, status='unindexed')
+                continue
+            if fields:
+                self.record_plan(path, **fields)
+            return path
+
+    def record_plan(self, path, **fields):
+        '''
+        Update the row of a plan folder
+        @Param path, plan folder or number
+        @Param fields, values of PLAN_FIELDS, files is stored as json
+        '''
+        plan_id = path if isinstance(path, int) else plan_number(path)
+        unknown = [i for i in fields if i not in PLAN_FIELDS]
+        if unknown:
+            raise ValueError("Unknown plan fields " + str(unknown))
+        if 'files' in fields:
+            fields['files'] = json.dumps(fields['files'])
+        names = sorted(fields)
+        self.db.execute("UPDATE plans SET " + ", ".join(i + " = ?" for i in names) + ", updated = ? WHERE id = ?",
+                        [fields[i] for i in names] + [time.time(), plan_id])
+
+    def set_status(self, path, status):
+        self.record_plan(path, status=status)
+
+    def record_rooms(self, path, rooms):
+        '''
+        Replace the rooms of a plan
+        @Param rooms, list of (name, type), e.g. ('Bedroom.001', 'Bedroom')
+        '''
+        plan_id = path if isinstance(path, int) else plan_number(path)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("DELETE FROM rooms WHERE plan_id = ?", (plan_id,))
+            self.db.executemany("INSERT INTO rooms (plan_id, idx, name, type) VALUES (?, ?, ?, ?)",
+                                [(plan_id, i, name, typ) for i, (name, typ) in enumerate(rooms)])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def plan(self, path):
+        '''
+        Row of a plan with its rooms
+        @Return dict, None for an unknown plan
+        '''
+        plan_id = path if isinstance(path, int) else plan_number(path)
+        row = self.db.execute("SELECT * FROM plans WHERE id = ?", (plan_id,)).fetchone()
+        if row is None:
+            return None
+        plan = dict(row)
+        plan['files'] = json.loads(plan['files']) if plan['files'] else []
+        plan['rooms'] = [dict(r) for r in self.db.execute(
+            "SELECT name, type FROM rooms WHERE plan_id = ? ORDER BY idx", (plan_id,))]
+        return plan
+
+    def find(self, rooms={}, status=None, not_status=None):
+        '''
+        Plans matching all conditions
+        @Param rooms, dict room type -> least number of rooms, e.g. {'Bedroom': 2}
+        @Param status, list of allowed statuses, None for any
+        @Param not_status, list of excluded statuses
+        @Return list of plan rows as dicts
+        '''
+        where = []
+        params = []
+        if status:
+            where.append("p.status IN (" + ", ".join("?" for _ in status) + ")")
+            params += list(status)
+        if not_status:
+            where.append("p.status NOT IN (" + ", ".join("?" for _ in not_status) + ")")
+            params += list(not_status)
+        for typ, least in sorted(rooms.items()):
+            where.append("(SELECT COUNT(*) FROM rooms r WHERE r.plan_id = p.id AND r.type = ?) >= ?")
+            params += [typ, least]
+        sql = "SELECT p.* FROM plans p" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY p.id"
+        return [dict(r) for r in self.db.execute(sql, params)]
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Query the plan index of a data folder")
+    parser.add_argument('root', help="data folder, e.g. Data/")
+    parser.add_argument('--room', action='append', default=[], help="<type>:<least count>, e.g. Bedroom:2")
+    parser.add_argument('--status', nargs='*', help="allowed statuses")
+    parser.add_argument('--not-status', nargs='*', help="excluded statuses")
+    parser.add_argument('--json', action='store_true', help="print full rows as JSON lines")
+    args = parser.parse_args(argv)
+    rooms = {}
+    for r in args.room:
+        typ, _, least = r.partition(':')
+        rooms[typ] = int(least or 1)
+    store = ArtifactStore(args.root)
+    for row in store.find(rooms, args.status, args.not_status):
+        if args.json:
+            print(json.dumps(row))
+        else:
+            print("%6d %-12s %s %s" % (row['id'], row['status'], row['path'], row['svg'] or ''))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
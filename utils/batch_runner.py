@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import zlib
+import signal
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from utils import render_estimator
+
+'''
+Batch runner
+Generates point clouds for many CubiCasa plans with a pool of worker processes.
+
+Every job runs FloorplanToSTL.createFloorPlanPointCloud_svg in its own process
+and its own working directory, so the handoff files of the stages (config.txt,
+scene.json, Placed_polygons.txt, Data/<n>/) of two
+jobs never meet. Finished plans are appended to manifest.jsonl, which is read
+again on restart, so a crashed or interrupted batch continues where it stopped.
+
+Plans are submitted longest first by the render estimate of utils.render_estimator,
+calibrated from the telemetry of earlier jobs below the output folder, so a large
+plan does not start last and keep one worker busy while the others idle.
+
+With --shards the rooms of every finished job are appended to one set of dataset
+shards (utils.dataset_shards) by the batch process, so jobs never write them concurrently.
+
+Usage:
+python -m utils.batch_runner --plans <plan dirs...> --out <dir> --workers 32 --timeout 3600
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Resources the stages read from program_path, linked into every job directory
+SHARED_FILES = ['object.blend', 'Materials.blend', 'materials.json', 'object_boundbox.txt',
+                'Placement_Info.py', 'floorplan_to_PointClouds_in_blender.py', 'annotate-Blocky.py',
+                'blender_worker.py', 'door_window_automation.py', 'single_session.py']
+
+MANIFEST = 'manifest.jsonl'
+
+def plan_key(plan_dir):
+    '''
+    Name of a plan, unique inside CubiCasa5k, e.g. high_quality_architectural_10006
+    @Param plan_dir, folder containing model.svg and F1_scaled.png
+    '''
+    parts = os.path.normpath(plan_dir).split(os.sep)
+    return '_'.join(parts[-2:])
+
+def plan_seed(base_seed, plan_dir):
+    '''
+    Seed of a plan, depends only on the base seed and the plan, not on the job order
+    '''
+    return (base_seed * 1000003 + zlib.crc32(plan_key(plan_dir).encode())) % 2**32
+
+def read_manifest(out_root):
+    '''
+    Read manifest
+    @Param out_root, output folder of the batch
+    @Return dict plan_key -> last manifest entry of that plan
+    '''
+    entries = {}
+    path = os.path.join(out_root, MANIFEST)
+    if not os.path.isfile(path):
+        return entries
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # torn last line of a crashed run
+                continue
+            entries[entry['plan']] = entry
+    return entries
+
+def append_manifest(out_root, entry, lock=None):
+    '''
+    Append one entry to the manifest and flush it to disk
+    '''
+    line = json.dumps(entry) + '\n'
+    if lock is not None:
+        lock.acquire()
+    try:
+        with open(os.path.join(out_root, MANIFEST), 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        if lock is not None:
+            lock.release()
+
+def prepare_workdir(workdir):
+    '''
+    Create the job directory and link the shared resources into it
+    '''
+    os.makedirs(workdir, exist_ok=True)
+    for name in SHARED_FILES:
+        src = os.path.join(ROOT, name)
+        dst = os.path.join(workdir, name)
+        if os.path.exists(src) and not os.path.lexists(dst):
+            os.symlink(src, dst)
+    return workdir
+
+def run_job(plan_dir, workdir, seed, calc_an=True):
+    '''
+    Run one plan, called inside the job process
+    @Param plan_dir, folder containing model.svg and F1_scaled.png
+    @Param workdir, private working directory of this job
+    @Param seed, seed for placement
+    '''
+    # config resolves the Blender paths against ROOT, only the data goes to workdir
+    import config
+    config.program_path = workdir
+    # shards are written by the batch process only (--shards), dataset_shards_path would be shared by all jobs
+    config.dataset_shards = False
+    os.chdir(workdir)
+
+    import FloorplanToSTL as stl
+    stl.createFloorPlanPointCloud_svg(image_path=os.path.join(plan_dir, 'F1_scaled.png'),
+                                      target_path=config.target_path,
+                                      svg_path=os.path.join(plan_dir, 'model.svg'),
+                                      calc_an=calc_an,
+                                      seed=seed)
+
+def _kill_job(process):
+    # the job runs in its own session, take its Blender children down with it
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+def shard_job(writer, key, workdir):
+    '''
+    Append the rooms of the plan folders of a finished job to the shards
+    @Return number of rooms appended
+    '''
+    added = 0
+    for plan in sorted(os.listdir(workdir)):
+        if plan[:6] == '_Plan_' and os.path.isdir(os.path.join(workdir, plan)):
+            added += writer.append_plan(os.path.join(workdir, plan), key+'/'+plan)
+    return added
+
+def _run_one(plan_dir, out_root, base_seed, timeout, calc_an, lock, estimate=None, writer=None):
+    key = plan_key(plan_dir)
+    workdir = prepare_workdir(os.path.join(out_root, 'jobs', key))
+    seed = plan_seed(base_seed, plan_dir)
+    cmd = [sys.executable, '-m', 'utils.batch_runner', '--job', plan_dir,
+           '--workdir', workdir, '--seed', str(seed)]
+    if not calc_an:
+        cmd.append('--no-annotate')
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+
+    start = time.time()
+    with open(os.path.join(workdir, 'job.log'), 'a') as log:
+        process = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+        try:
+            returncode = process.wait(timeout=timeout)
+            status = 'done' if returncode == 0 else 'failed'
+        except subprocess.TimeoutExpired:
+            _kill_job(process)
+            returncode = None
+            status = 'timeout'
+
+    entry = {'plan': key,
+             'plan_dir': plan_dir,
+             'status': status,
+             'returncode': returncode,
+             'seed': seed,
+             'seconds': round(time.time() - start, 3),
+             'workdir': workdir,
+             'estimate': estimate,
+             'finished': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    if writer is not None and status == 'done':
+        with lock:
+            entry['shard_rooms'] = shard_job(writer, key, workdir)
+    append_manifest(out_root, entry, lock)
+    print("[" + status + "] " + key + " " + str(entry['seconds']) + " secs")
+    sys.stdout.flush()
+    return entry
+
+def run_batch(plan_dirs, out_root, workers=os.cpu_count(), timeout=None, seed=0,
+              calc_an=True, retry_failed=False, schedule=True, shards=None):
+    '''
+    Run batch
+    @Param plan_dirs, list of CubiCasa plan folders
+    @Param out_root, folder for job directories and manifest
+    @Param workers, number of plans processed at the same time
+    @Param timeout, seconds after which a job is killed, None for no limit
+    @Param seed, base seed, each plan derives its own from it
+    @Param retry_failed, also rerun plans that failed or timed out before
+    @Param schedule, submit the plans longest estimated render first, else in the given order
+    @Param shards, folder of dataset shards receiving the rooms of finished plans, None for none
+    @Return list of manifest entries of this run
+    '''
+    os.makedirs(out_root, exist_ok=True)
+    finished = read_manifest(out_root)
+    skip = ['done'] if retry_failed else ['done', 'failed', 'timeout']
+    todo = [i for i in plan_dirs if finished.get(plan_key(i), {}).get('status') not in skip]
+    print("Batch: " + str(len(plan_dirs) - len(todo)) + " plans already finished, " + str(len(todo)) + " to go")
+
+    estimates = {}
+    if schedule and todo:
+        estimator = render_estimator.from_telemetry(out_root)
+        estimates = dict((i, estimator.predict(os.path.join(i, 'model.svg'))) for i in todo)
+        costs = [estimates[i]['seconds'] for i in todo]
+        # the pool hands every free worker the next job, in this order that is LPT
+        bins, loads = render_estimator.lpt_schedule(costs, workers)
+        todo = sorted(todo, key=lambda i: -estimates[i]['seconds'])
+        print("Estimated " + str(round(sum(costs))) + " render secs, makespan " + str(round(max(loads))) +
+              " secs on " + str(workers) + " workers (" + str(estimator.samples) + " calibration samples)")
+
+    writer = None
+    if shards is not None:
+        from utils.dataset_shards import ShardWriter
+        writer = ShardWriter(shards)
+
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_one, i, out_root, seed, timeout, calc_an, lock, estimates.get(i), writer) for i in todo]
+        return [f.result() for f in futures]
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Parallel, resumable point cloud generation")
+    parser.add_argument('--plans', nargs='*', default=[], help="CubiCasa plan folders")
+    parser.add_argument('--plans-file', help="text file with one plan folder per line")
+    parser.add_argument('--out', default='Batch', help="output folder")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--timeout', type=float, default=None, help="seconds per plan")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-annotate', action='store_true')
+    parser.add_argument('--retry-failed', action='store_true')
+    parser.add_argument('--no-schedule', action='store_true', help="submit plans in the given order")
+    parser.add_argument('--shards', help="folder of dataset shards receiving the finished rooms")
+    # internal, used by run_batch to start one job
+    parser.add_argument('--job', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.job:
+        run_job(args.job, args.workdir, args.seed, calc_an=not args.no_annotate)
+        return
+
+    plans = list(args.plans)
+    if args.plans_file:
+        with open(args.plans_file, 'r') as f:
+            plans += [i.strip() for i in f if i.strip()]
+    run_batch(plans, os.path.abspath(args.out), workers=args.workers, timeout=args.timeout,
+              seed=args.seed, calc_an=not args.no_annotate, retry_failed=args.retry_failed,
+              schedule=not args.no_schedule, shards=os.path.abspath(args.shards) if args.shards else None)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,131 @@
+import os
+import time
+import socket
+import secrets
+import subprocess
+from multiprocessing.connection import Client
+
+'''
+Blender service
+Client side of blender_worker.py. Starts one background Blender and sends it
+pipeline jobs over a local socket instead of launching Blender for every script.
+'''
+
+def free_port(host='localhost'):
+    '''
+    Ask the OS for a free local port
+    @Param host
+    @Return port
+    '''
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+class BlenderWorker:
+    '''
+    Handle to a persistent background Blender
+    @Param blender_path, path to blender executable
+    @Param worker_script, path to blender_worker.py
+    @Param host, port, where the worker listens, port 0 picks a free one
+    '''
+    def __init__(self, blender_path, worker_script, host='localhost', port=0, startup_timeout=120):
+        self.blender_path = blender_path
+        self.worker_script = worker_script
+        self.host = host
+        self.port = port if port else free_port(host)
+        self.authkey = secrets.token_hex(16)
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.conn = None
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def start(self):
+        '''
+        Launch Blender with the worker script and connect to it
+        '''
+        self.process = subprocess.Popen([self.blender_path,
+            "-noaudio", # this is a dockerfile ubuntu hax fix
+            "--background",
+            "--python",
+            self.worker_script,
+            "--",
+            self.host, str(self.port), self.authkey])
+
+        start = time.time()
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError("Blender worker exited during startup with code " + str(self.process.returncode))
+            try:
+                self.conn = Client(self.address, authkey=self.authkey.encode())
+                return self
+            except ConnectionRefusedError:
+                if time.time() - start > self.startup_timeout:
+                    self.kill()
+                    raise TimeoutError("Blender worker did not start within " + str(self.startup_timeout) + " secs")
+                time.sleep(0.2)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None and self.conn is not None
+
+    def run(self, script, args=None, cwd=None, env=None):
+        '''
+        Run a pipeline script in the worker, same contract as check_output
+        @Param script, path to script
+        @Param args, arguments normally given after the script on the command line
+        @Param cwd, working directory for the job, defaults to ours
+        @Param env, extra environment variables for the job
+        @Return job result dict
+        '''
+        if not self.alive():
+            self.start()
+        job = {'script': script,
+               'args': [str(i) for i in args or []],
+               'cwd': os.getcwd() if cwd is None else cwd,
+               'env': {} if env is None else env}
+        self.conn.send(job)
+        try:
+            result = self.conn.recv()
+        except EOFError:
+            self.conn = None
+            raise subprocess.CalledProcessError(-1, [self.blender_path, script] + job['args'],
+                                                output="Blender worker died during job")
+        if result['returncode'] != 0:
+            raise subprocess.CalledProcessError(result['returncode'], [self.blender_path, script] + job['args'],
+                                                output=result['error'])
+        return result
+
+    def close(self, timeout=30):
+        '''
+        Ask the worker to stop, kill it if it does not
+        '''
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+                self.conn.recv()
+            except (EOFError, OSError):
+                pass
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.kill()
+            self.process = None
+
+    def kill(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import numpy as np
+from utils.virtual_scan import label_class
+
+'''
+Dataset shards
+Training ready copy of the generated rooms in a few large files.
+
+Rooms of _Plan_<n>/<room>/ (<room>_downsampled.npy, <room>_downsampled(cls).npy,
+<room>_labels.npy) are appended to fixed size shards, one flat little endian file
+per field:
+  shard_<k>.coords  float32 n x 3, the downsampled coordinates
+  shard_<k>.colors  uint8 n x 3, the downsampled colors scaled to 0-255
+  shard_<k>.labels  int16 n, class of every point, position in classes.json, -1 unlabelled
+index.jsonl holds one line per room {plan, room, shard, offset, count}, offset and
+count in points. A room is never split, a shard is closed once the next room would
+take it over shard_points.
+
+Loaders mmap a shard once and slice rooms out of it with ShardReader, no per room
+file opens. Data is written before its index line, so rooms of an interrupted write
+are dropped again when the writer is reopened.
+
+Pack finished plan folders with
+python -m utils.dataset_shards <shard dir> <plan folders...>
+'''
+
+FIELDS = {'coords': ('<f4', 3), 'colors': ('u1', 3), 'labels': ('<i2', 1)}
+
+INDEX = 'index.jsonl'
+CLASSES = 'classes.json'
+
+# Points per shard, 2**24 points are 256 MB of coordinates, colors and labels
+SHARD_POINTS = 2**24
+
+def shard_file(root, shard, field):
+    return os.path.join(root, 'shard_%05d.%s' % (shard, field))
+
+def read_index(root):
+    '''
+    Rooms of a shard folder
+    @Return list of index entries, in write order
+    '''
+    entries = []
+    path = os.path.join(root, INDEX)
+    if not os.path.isfile(path):
+        return entries
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # torn last line of a crashed writer
+                continue
+    return entries
+
+def read_classes(root):
+    path = os.path.join(root, CLASSES)
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def load_room(room_dir):
+    '''
+    Arrays of one finished room folder
+    @Return coords, colors, label names or None when the room is not labelled
+    '''
+    name = os.path.basename(os.path.normpath(room_dir))
+    base = os.path.join(room_dir, name)
+    coords = np.load(base+'_downsampled.npy')
+    colors = np.load(base+'_downsampled(cls).npy')
+    labels = np.load(base+'_labels.npy') if os.path.isfile(base+'_labels.npy') else None
+    return coords, colors, labels
+
+class ShardWriter:
+    '''
+    Appends rooms to the shards of a folder, one writer per folder at a time
+    @Param root, shard folder, created if missing
+    @Param shard_points, points after which a new shard is started
+    '''
+    def __init__(self, root, shard_points=SHARD_POINTS):
+        self.root = root
+        self.shard_points = shard_points
+        os.makedirs(root, exist_ok=True)
+        self.entries = read_index(root)
+        self.classes = read_classes(root)
+        self.class_ids = dict((c, i) for i, c in enumerate(self.classes))
+        self.done = set((e['plan'], e['room']) for e in self.entries)
+        if self.entries:
+            last = self.entries[-1]
+            self.shard = last['shard']
+            self.size = last['offset'] + last['count']
+        else:
+            self.shard = 0
+            self.size = 0
+        self._truncate()
+
+    def _truncate(self):
+        # drop data of rooms whose index line was never written
+        for field, (dtype, width) in FIELDS.items():
+            path = shard_file(self.root, self.shard, field)
+            if os.path.isfile(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(self.size * width * np.dtype(dtype).itemsize)
+
+    def _label_ids(self, labels):
+        names, inverse = np.unique(np.asarray(labels).astype(str), return_inverse=True)
+        ids = []
+        for name in names:
+            cls = label_class(name)
+            if cls not in self.class_ids:
+                self.class_ids[cls] = len(self.classes)
+                self.classes.append(cls)
+                with open(os.path.join(self.root, CLASSES), 'w') as f:
+                    json.dump(self.classes, f, indent=1)
+            ids.append(self.class_ids[cls])
+        return np.array(ids, dtype='<i2')[inverse]
+
+    def append(self, plan, room, coords, colors, labels=None):
+        '''
+        Append one room
+        @Param plan, plan key, e.g. the plan folder
+        @Param room, room name inside the plan
+        @Param coords, nx3 coordinates
+        @Param colors, nx3 colors in [0, 1]
+        @Param labels, n label names of annotate-Blocky.py, None when not labelled
+        @Return index entry
+        '''
+        count = len(coords)
+        if self.size > 0 and self.size + count > self.shard_points:
+            self.shard += 1
+            self.size = 0
+        data = {'coords': np.asarray(coords, dtype='<f4').reshape(-1, 3),
+                'colors': np.clip(np.round(np.asarray(colors)*255), 0, 255).astype('u1').reshape(-1, 3),
+                'labels': np.full(count, -1, dtype='<i2') if labels is None else self._label_ids(labels)}
+        # a new shard may hold data of an interrupted write
+        mode = 'ab' if self.size > 0 else 'wb'
+        for field, array in data.items():
+            with open(shard_file(self.root, self.shard, field), mode) as f:
+                f.write(np.ascontiguousarray(array).tobytes())
+        entry = {'plan': plan, 'room': room, 'shard': self.shard, 'offset': self.size, 'count': count}
+        with open(os.path.join(self.root, INDEX), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.size += count
+        self.entries.append(entry)
+        self.done.add((plan, room))
+        return entry
+
+    def append_plan(self, plan_dir, plan=None):
+        '''
+        Append every finished room of a plan folder that is not in the shards yet
+        @Param plan_dir, _Plan_<n> folder
+        @Param plan, plan key, the plan folder when None
+        @Return number of rooms appended
+        '''
+        plan = plan_dir if plan is None else plan
+        added = 0
+        for room in sorted(os.listdir(plan_dir)):
+            room_dir = os.path.join(plan_dir, room)
+            if (plan, room) in self.done or not os.path.isfile(os.path.join(room_dir, room+'_downsampled.npy')):
+                continue
+            coords, colors, labels = load_room(room_dir)
+            if len(coords) == 0:
+                continue
+            self.append(plan, room, coords, colors, labels)
+            added += 1
+        return added
+
+class ShardReader:
+    '''
+    Random access to the rooms of a shard folder
+    @Param root, shard folder
+    '''
+    def __init__(self, root):
+        self.root = root
+        self.entries = read_index(root)
+        self.classes = read_classes(root)
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _map(self, shard, field):
+        key = (shard, field)
+        if key not in self._maps:
+            dtype, width = FIELDS[field]
+            array = np.memmap(shard_file(self.root, shard, field), dtype=dtype, mode='r')
+            self._maps[key] = array.reshape(-1, width) if width > 1 else array
+        return self._maps[key]
+
+    def room(self, i):
+        '''
+        Arrays of the i-th room, views into the mapped shards
+        @Return dict coords, colors, labels, plan, room
+        '''
+        e = self.entries[i]
+        s = slice(e['offset'], e['offset'] + e['count'])
+        room = dict((field, self._map(e['shard'], field)[s]) for field in FIELDS)
+        room['plan'] = e['plan']
+        room['room'] = e['room']
+        return room
+
+    def __getitem__(self, i):
+        return self.room(i)
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Pack finished plan folders into dataset shards")
+    parser.add_argument('root', help="shard folder")
+    parser.add_argument('plans', nargs='*', help="_Plan_<n> folders")
+    parser.add_argument('--shard-points', type=int, default=SHARD_POINTS)
+    args = parser.parse_args(argv)
+    writer = ShardWriter(args.root, args.shard_points)
+    for plan in args.plans:
+        print(plan + ": " + str(writer.append_plan(os.path.abspath(plan))) + " rooms")
+    print(str(len(writer.entries)) + " rooms, " + str(writer.shard + 1) + " shards, " + str(len(writer.classes)) + " classes")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
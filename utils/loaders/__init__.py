@@ -1,4 +1,21 @@
-from utils.loaders.svg_loader import FloorplanSVG
-from utils.loaders import svg_utils
-from utils.loaders.augmentations import *
-from utils.loaders import house
+import importlib
+
+'''
+Loaders
+The training loaders need torch, lmdb and cv2, the SVG parsing of svg_utils and
+svg_cache does not. Submodules and the names of svg_loader and augmentations are
+imported on first use, so importing utils.loaders.svg_utils stays light.
+'''
+
+SUBMODULES = ['svg_loader', 'svg_utils', 'svg_cache', 'augmentations', 'house']
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module('utils.loaders.' + name)
+    if name == 'FloorplanSVG':
+        from utils.loaders.svg_loader import FloorplanSVG
+        return FloorplanSVG
+    augmentations = importlib.import_module('utils.loaders.augmentations')
+    if not name.startswith('_') and hasattr(augmentations, name):
+        return getattr(augmentations, name)
+    raise AttributeError("module 'utils.loaders' has no attribute " + repr(name))
@@ -1,7 +1,7 @@
 import math
 import numpy as np
-from utils.loaders.svg_utils import PolygonWall, get_polygon, calc_distance, get_room_number, get_icon, get_icon_number, get_points, get_direction, get_gaussian2D
-from xml.dom import minidom
+from utils.loaders.svg_utils import PolygonWall, calc_distance, get_room_number, get_icon_number, get_direction, get_gaussian2D, shape_polygon
+from utils.loaders.svg_cache import load_plan
 from skimage.draw import polygon
 import cv2
 
@@ -359,7 +359,7 @@ class House:
         self.height = height
         self.width = width
         shape = height, width
-        svg = minidom.parse(path)
+        svg = load_plan(path)
         self.walls = np.empty((height, width), dtype=np.uint8)
         self.walls.fill(0)
         self.wall_ids = np.empty((height, width), dtype=np.uint8)
@@ -386,9 +386,9 @@ class House:
 
         self.icon_areas = []
 
-        for e in svg.getElementsByTagName('g'):
+        for e in svg:
             try: 
-                if e.getAttribute("id") == "Wall":
+                if e.kind == "Wall":
                     wall = PolygonWall(e, wall_id, shape)
                     wall.rr, wall.cc = self._clip_outside(wall.rr, wall.cc)
                     self.wall_objs.append(wall)
@@ -398,7 +398,7 @@ class House:
 
                     wall_id += 1
 
-                if e.getAttribute("id") == "Railing":
+                if e.kind == "Railing":
                     wall = PolygonWall(e, wall_id, shape)
                     wall.rr, wall.cc = self._clip_outside(wall.rr, wall.cc)
                     self.wall_objs.append(wall)
@@ -413,8 +413,8 @@ class House:
                     raise k
                 continue
 
-            if e.getAttribute("id") == "Window":
-                X, Y = get_points(e)
+            if e.kind == "Window":
+                X, Y = e.X, e.Y
                 rr, cc = polygon(X, Y)
                 cc, rr = self._clip_outside(cc, rr)
                 direction = get_direction(X, Y)
@@ -455,9 +455,9 @@ class House:
                 self.icons[cc, rr] = 1
                 self.icon_types.append(1)
 
-            if e.getAttribute("id") == "Door":
+            if e.kind == "Door":
                 # How to reperesent empty door space
-                X, Y = get_points(e)
+                X, Y = e.X, e.Y
                 rr, cc = polygon(X, Y)
                 cc, rr = self._clip_outside(cc, rr)
                 direction = get_direction(X, Y)
@@ -498,12 +498,13 @@ class House:
                 self.icons[cc, rr] = 2
                 self.icon_types.append(2)
 
-            if "FixedFurniture " in e.getAttribute("class"):
+            if e.kind == "FixedFurniture":
                 num = get_icon_number(e, icon_list)
                 if num is not None:
-                    rr, cc, X, Y = get_icon(e)
+                    X, Y = e.X, e.Y
                     # only four corner icons
                     if len(X) == 4:
+                        rr, cc = shape_polygon(e)
                         locs = np.column_stack((X, Y))
                         up_left_index = locs.sum(axis=1).argmin()
                         self.icon_corners['upper_left'].append(locs[up_left_index])
@@ -518,7 +519,7 @@ class House:
                         locs = np.delete(locs, up_right_index, axis=0)
                         self.icon_corners['lower_left'].append(locs[0])
 
-                        icon_name = e.getAttribute('class').replace('FixedFurniture ', '').split(' ')[0]
+                        icon_name = e.cls.replace('FixedFurniture ', '').split(' ')[0]
                         icon_name = icon_name_map[icon_name]
 
                         icon_rep = [[up_left, down_right], [icon_name, 1, 1]]
@@ -529,9 +530,9 @@ class House:
                         self.icons[rr, cc] = num
                         self.icon_types.append(num)
 
-            if "Space " in e.getAttribute("class"):
+            if e.kind == "Space":
                 num = get_room_number(e, room_list)
-                rr, cc = get_polygon(e)
+                rr, cc = shape_polygon(e)
                 if len(rr) != 0:
                     rr, cc = self._clip_outside(rr, cc)
                     if len(rr) != 0 and len(cc) != 0:
@@ -541,7 +542,7 @@ class House:
                         rr_mean = int(round(np.mean(rr)))
                         cc_mean = int(round(np.mean(cc)))
                         center_box = [[rr_mean-10, cc_mean-10], [rr_mean+10, cc_mean+10]]
-                        room_name = e.getAttribute('class').replace('Space ', '').split(' ')[0]
+                        room_name = e.cls.replace('Space ', '').split(' ')[0]
                         room_name = room_name_map[room_name]
                         self.representation['labels'].append([center_box, [room_name, 1, 1]])
 
@@ -0,0 +1,177 @@
+import os
+import sys
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from utils.loaders.svg_utils import SvgShape, SvgPlan, parse_svg
+
+'''
+SVG cache
+Parsed CubiCasa plan geometry stored next to the SVG, model.svg -> model.svg.npz.
+
+The npz holds the shapes of parse_svg as flat arrays: kind code, id and class of
+every shape, its point count and all X, Y points concatenated. It is keyed by the
+sha1 of the SVG, size and mtime only decide whether the hash has to be checked
+again. The last MEMORY_PLANS plans loaded are also kept in memory, so House,
+generate_svg_plan and the render estimator of one plan share one parse.
+
+Pre-warm a dataset with
+python -m utils.loaders.svg_cache <data folder> [--list train.txt] [--workers 8]
+'''
+
+CACHE_SUFFIX = '.npz'
+CACHE_VERSION = 1
+
+KINDS = ["Wall", "Railing", "Door", "Window", "FixedFurniture", "Space"]
+
+# Plans kept in memory, least recently used dropped first
+MEMORY_PLANS = 8
+
+_plans = OrderedDict()
+
+def clear_memory():
+    '''
+    Forget the plans kept in memory, the next load_plan reads the npz
+    '''
+    _plans.clear()
+
+def svg_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def write_cache(path, plan, digest=None):
+    '''
+    Store a parsed plan next to its svg
+    @Param path, model.svg
+    @Param plan, SvgPlan of parse_svg
+    @Return cache path
+    '''
+    stat = os.stat(path)
+    shapes = plan.shapes
+    arrays = {'version': np.array(CACHE_VERSION),
+              'hash': np.array(digest or svg_hash(path)),
+              'stat': np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64),
+              'kinds': np.array([KINDS.index(i.kind) for i in shapes], dtype=np.uint8),
+              'ids': np.array([i.id for i in shapes], dtype=str),
+              'classes': np.array([i.cls for i in shapes], dtype=str),
+              'counts': np.array([len(i.X) for i in shapes], dtype=np.int32),
+              'X': np.concatenate([np.asarray(i.X, dtype=np.float64) for i in shapes] or [np.zeros(0)]),
+              'Y': np.concatenate([np.asarray(i.Y, dtype=np.float64) for i in shapes] or [np.zeros(0)])}
+    cache = path + CACHE_SUFFIX
+    tmp = cache + '.%d.tmp' % os.getpid()
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, cache)
+    return cache
+
+def read_cache(path):
+    '''
+    Plan of a cache file written by write_cache
+    @Return SvgPlan, stored hash, stored [size, mtime_ns]; None when the cache is missing or outdated
+    '''
+    cache = path + CACHE_SUFFIX
+    if not os.path.isfile(cache):
+        return None
+    try:
+        with np.load(cache) as data:
+            if int(data['version']) != CACHE_VERSION:
+                return None
+            kinds, ids, classes = data['kinds'], data['ids'], data['classes']
+            ends = np.cumsum(data['counts'])
+            X = np.split(data['X'], ends[:-1]) if len(ends) else []
+            Y = np.split(data['Y'], ends[:-1]) if len(ends) else []
+            shapes = [SvgShape(KINDS[kinds[i]], str(ids[i]), str(classes[i]), X[i], Y[i]) for i in range(len(kinds))]
+            return SvgPlan(shapes), str(data['hash']), data['stat'].tolist()
+    except (OSError, ValueError, KeyError):
+        # torn or foreign file, parse again
+        return None
+
+def load_plan(path):
+    '''
+    Parsed plan of a model.svg, from memory, from the cache next to it or parsed and cached
+    The shapes are shared between callers, copy X, Y before changing them
+    @Param path, model.svg
+    @Return SvgPlan
+    '''
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    if key in _plans and _plans[key][0] == [stat.st_size, stat.st_mtime_ns]:
+        _plans.move_to_end(key)
+        return _plans[key][1]
+
+    digest = None
+    plan = None
+    cached = read_cache(path)
+    if cached is not None:
+        plan, stored, stored_stat = cached
+        if stored_stat != [stat.st_size, stat.st_mtime_ns]:
+            # copied or touched, still the same plan if the content is
+            digest = svg_hash(path)
+            if digest != stored:
+                plan = None
+            cached = None
+    if plan is None:
+        plan = parse_svg(path)
+    if cached is None:
+        try:
+            write_cache(path, plan, digest)
+        except OSError:
+            # read only dataset, keep it in memory only
+            pass
+    _plans[key] = ([stat.st_size, stat.st_mtime_ns], plan)
+    _plans.move_to_end(key)
+    while len(_plans) > MEMORY_PLANS:
+        _plans.popitem(last=False)
+    return plan
+
+def svg_files(folder, list_file=None, svg_name='model.svg'):
+    '''
+    model.svg files of a dataset
+    @Param list_file, FloorplanSVG style file of plan folders relative to folder, None to walk folder
+    '''
+    if list_file is not None:
+        with open(os.path.join(folder, list_file), 'r') as f:
+            return [os.path.join(folder + i.strip(), svg_name) for i in f if i.strip()]
+    files = []
+    for root, dirs, names in os.walk(folder):
+        if svg_name in names:
+            files.append(os.path.join(root, svg_name))
+    return sorted(files)
+
+def _cache_mtime(path):
+    cache = path + CACHE_SUFFIX
+    return os.stat(cache).st_mtime_ns if os.path.isfile(cache) else None
+
+def _prewarm(path):
+    try:
+        before = _cache_mtime(path)
+        load_plan(path)
+        return path, _cache_mtime(path) != before, None
+    except Exception as e:
+        return path, False, str(e)
+
+def main(argv):
+    import argparse
+    from multiprocessing import Pool
+    parser = argparse.ArgumentParser(description="Parse and cache every model.svg of a dataset")
+    parser.add_argument('folder', help="dataset folder, e.g. data/cubicasa5k/")
+    parser.add_argument('--list', help="file of plan folders inside folder, e.g. train.txt")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    files = svg_files(args.folder, args.list)
+    parsed = 0
+    failed = 0
+    with Pool(max(1, args.workers)) as pool:
+        for path, new, error in pool.imap_unordered(_prewarm, files, chunksize=16):
+            if error is not None:
+                failed += 1
+                print(path + ": " + error)
+            parsed += new
+    print(str(len(files)) + " plans, " + str(parsed) + " parsed, " + str(len(files)-parsed-failed) + " cached, " + str(failed) + " failed")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
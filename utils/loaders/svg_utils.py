@@ -1,61 +1,227 @@
 import math
 import numpy as np
-from xml.dom import minidom
-from skimage.draw import polygon
-from svgpathtools import parse_path
+from xml.etree import ElementTree
 from logging import warning
 
 
-def get_labels(path, height, width):
-    svg = minidom.parse(path)
+class SvgShape:
+    '''
+    One element of a CubiCasa model.svg as found by parse_svg
+    kind is Wall, Railing, Door, Window, FixedFurniture or Space.
+    X, Y are the rounded polygon points, for FixedFurniture the transformed icon corners of get_icon
+    '''
+    __slots__ = ['kind', 'id', 'cls', 'X', 'Y']
+
+    def __init__(self, kind, id, cls, X, Y):
+        self.kind = kind
+        self.id = id
+        self.cls = cls
+        self.X = X
+        self.Y = Y
+
+
+class SvgPlan:
+    '''
+    Shapes of a model.svg in document order, and per kind
+    '''
+    def __init__(self, shapes):
+        self.shapes = shapes
+        self.walls = [i for i in shapes if i.kind == "Wall"]
+        self.railings = [i for i in shapes if i.kind == "Railing"]
+        self.doors = [i for i in shapes if i.kind == "Door"]
+        self.windows = [i for i in shapes if i.kind == "Window"]
+        self.furniture = [i for i in shapes if i.kind == "FixedFurniture"]
+        self.spaces = [i for i in shapes if i.kind == "Space"]
+
+    def __iter__(self):
+        return iter(self.shapes)
+
+
+def _tag(el):
+    # tag without the svg namespace
+    return el.tag.rsplit('}', 1)[-1]
+
+
+def _child(el, tag):
+    return next((p for p in el if _tag(p) == tag), None)
+
+
+def _points_XY(points):
+    # get_points on a points attribute
+    X, Y = np.array([]), np.array([])
+    for a in points.split(' ')[:-1]:
+        x, y = a.split(',')
+        X = np.append(X, np.round(float(x)))
+        Y = np.append(Y, np.round(float(y)))
+    return X, Y
+
+
+def _matrix(transform):
+    strings = transform.split(',')
+    return np.array([[float(strings[0][7:]), float(strings[2]), float(strings[-2])],
+                     [float(strings[1]), float(strings[3]), float(strings[-1][:-1])],
+                     [0, 0, 1]])
+
+
+def _corners(g):
+    # get_corners on an ElementTree element
+    x_all, y_all = [], []
+    for pol in g:
+        tag = _tag(pol)
+        if tag == 'polygon':
+            x, y = get_XY(pol.get('points', '').split(' '))
+        elif tag == 'path':
+            x, y = path_box(pol.get('d', ''))
+        elif tag == 'rect':
+            x0 = float(pol.get('x') or 1.0)
+            y0 = float(pol.get('y') or 1.0)
+            x = [x0, x0 + float(pol.get('width'))]
+            y = [y0, y0 + float(pol.get('height'))]
+        else:
+            continue
+        x_all = np.append(x_all, x)
+        y_all = np.append(y_all, y)
+    return x_all, y_all
+
+
+def _icon_XY(ee, parent):
+    # get_icon on an ElementTree element, corners only
+    M = _matrix(ee.get("transform"))
+    M_p = None
+    if parent is not None and parent.get("class") == "FixedFurnitureSet":
+        M_p = _matrix(parent.get("transform"))
+
+    boundary = next((p for p in ee if _tag(p) == 'g' and p.get("class") == "BoundaryPolygon"), None)
+    if boundary is None:
+        x_all, y_all = [], []
+        for g in ee:
+            if _tag(g) == 'g':
+                x, y = _corners(g)
+                x_all = np.append(x_all, x)
+                y_all = np.append(y_all, y)
+        X, Y = get_max_corners(np.column_stack((x_all, y_all)))
+    elif _child(boundary, 'polygon') is not None:
+        X, Y = get_XY(_child(boundary, 'polygon').get('points', '').split(' '))
+    else:
+        X, Y = get_max_corners(np.column_stack(_corners(boundary)))
+
+    if len(X) < 4:
+        return X, Y
+
+    points = M @ np.vstack([X, Y, np.ones(len(X))])
+    if M_p is not None:
+        points = M_p @ points
+    points = np.round(points)
+    return points[0], points[1]
+
+
+def parse_svg(path):
+    '''
+    Read a CubiCasa model.svg in one pass with ElementTree.iterparse
+    Every <g> is handled at its end tag and cleared afterwards, furniture keeps its
+    subtree until its icon is done. Shapes are ordered by start tag, the order of
+    minidom getElementsByTagName('g').
+    @Param path, model.svg
+    @Return SvgPlan
+    '''
+    found = []
+    stack = []
+    order = 0
+    furniture = 0
+    for event, el in ElementTree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if _tag(el) == 'g':
+                stack.append((el, order))
+                order += 1
+                if "FixedFurniture " in el.get("class", ""):
+                    furniture += 1
+            continue
+        if _tag(el) != 'g':
+            continue
+
+        el, n = stack.pop()
+        el_id = el.get("id", "")
+        cls = el.get("class", "")
+        pol = _child(el, 'polygon')
+        if el_id in ["Wall", "Railing", "Window", "Door"] and pol is not None:
+            X, Y = _points_XY(pol.get("points"))
+            found.append((n, SvgShape(el_id, el_id, cls, X, Y)))
+        if "FixedFurniture " in cls:
+            furniture -= 1
+            X, Y = _icon_XY(el, stack[-1][0] if stack else None)
+            found.append((n, SvgShape("FixedFurniture", el_id, cls, X, Y)))
+        if "Space " in cls and pol is not None:
+            X, Y = _points_XY(pol.get("points"))
+            found.append((n, SvgShape("Space", el_id, cls, X, Y)))
+        if furniture == 0:
+            el.clear()
+
+    found.sort(key=lambda i: i[0])
+    return SvgPlan([shape for n, shape in found])
+
+
+def shape_polygon(shape):
+    '''
+    Raster of a shape, same as get_polygon on its element
+    @Return rr, cc
+    '''
+    from skimage.draw import polygon
+    return polygon(shape.Y, shape.X)
+
+
+def get_labels(path, height, width, icons, rooms):
     walls = np.empty((height, width), dtype=np.uint8)
     walls.fill(len(rooms))
-    icons = np.zeros((height, width), dtype=np.uint8)
-    for e in svg.getElementsByTagName('g'):
-        if e.getAttribute("id") == "Wall":
-            rr, cc = get_polygon(e)
+    labels = np.zeros((height, width), dtype=np.uint8)
+    for e in parse_svg(path):
+        if e.kind == "Wall":
+            rr, cc = shape_polygon(e)
             walls[rr, cc] = 0
 
-        if e.getAttribute("id") == "Window":
-            rr, cc = get_polygon(e)
-            icons[rr, cc] = 1
+        if e.kind == "Window":
+            rr, cc = shape_polygon(e)
+            labels[rr, cc] = 1
 
-        if e.getAttribute("id") == "Door":
+        if e.kind == "Door":
             # How to reperesent empty door space
-            rr, cc = get_polygon(e)
-            icons[rr, cc] = 2
+            rr, cc = shape_polygon(e)
+            labels[rr, cc] = 2
 
-        if "FixedFurniture " in e.getAttribute("class"):
-            num = get_icon_number(e)
-            rr, cc = get_icon(e)
-            icons[rr, cc] = num
+        if e.kind == "FixedFurniture" and len(e.X) >= 4:
+            num = get_icon_number(e, icons)
+            rr, cc = shape_polygon(e)
+            labels[rr, cc] = num
 
-        if "Space " in e.getAttribute("class"):
-            num = get_room_number(e)
-            rr, cc = get_polygon(e)
+        if e.kind == "Space":
+            num = get_room_number(e, rooms)
+            rr, cc = shape_polygon(e)
             walls[rr, cc] = num
 
-    return walls, icons
+    return walls, labels
+
+
+def _class(e):
+    return e.cls if isinstance(e, SvgShape) else e.getAttribute("class")
 
 
 def get_room_number(e, rooms):
-    name_list = e.getAttribute("class").split(" ")
+    name_list = _class(e).split(" ")
     room_type = name_list[1]
     try:
         return rooms[room_type]
     except KeyError:
-        warning("Room type " + e.getAttribute("class") + " not defined.")
+        warning("Room type " + _class(e) + " not defined.")
         return rooms['Undefined']
 
 
 def get_icon_number(e, icons):
-    name_list = e.getAttribute("class").split(" ")
+    name_list = _class(e).split(" ")
     icon_type = name_list[1]
 
     try:
         return icons[icon_type]
     except KeyError:
-        warning("Icon type " + e.getAttribute("class") + " not defined.")
+        warning("Icon type " + _class(e) + " not defined.")
         return icons['Misc']
 
 
@@ -127,6 +293,7 @@ def get_icon(ee):
             X[i] = new_x
             Y[i] = new_y
 
+    from skimage.draw import polygon
     rr, cc = polygon(Y, X)
 
     return rr, cc, X, Y
@@ -203,8 +370,12 @@ def make_boudary_polygon(pol):
 
 
 def get_icon_path(pol):
-    path = pol.getAttribute("d")
+    return path_box(pol.getAttribute("d"))
+
+
+def path_box(path):
     try:
+        from svgpathtools import parse_path
         path_alt = parse_path(path)
         minx, maxx, miny, maxy = path_alt.bbox()
     except ValueError as e:
@@ -292,6 +463,7 @@ def get_polygon(e):
         X = np.append(X, np.round(float(x)))
         Y = np.append(Y, np.round(float(y)))
 
+    from skimage.draw import polygon
     rr, cc = polygon(X, Y)
 
     return rr, cc
@@ -514,7 +686,7 @@ class LineWall(Wall):
 class PolygonWall(Wall):
     def __init__(self, e, id, shape=None):
         self.id = id
-        self.name = e.getAttribute('id')
+        self.name = e.id if isinstance(e, SvgShape) else e.getAttribute('id')
         self.X, self.Y = self.get_points(e)
         if abs(max(self.X)-min(self.X)) < 4 or abs(max(self.Y)-min(self.Y)) < 4:
             # wall is too small and we ignore it.
@@ -523,6 +695,7 @@ class PolygonWall(Wall):
             self.X = np.clip(self.X, 0, shape[1])
             self.Y = np.clip(self.Y, 0, shape[0])
         # self.X, self.Y = self.sort_X_Y(self.X, self.Y)
+        from skimage.draw import polygon
         self.rr, self.cc = polygon(self.Y, self.X)
         direction = self.get_direction(self.X, self.Y)
         end_points = self.get_end_points(self.X, self.Y, direction)
@@ -535,6 +708,8 @@ class PolygonWall(Wall):
         self.min_coord, self.max_coord = self.get_width_coods(self.X, self.Y)
 
     def get_points(self, e):
+        if isinstance(e, SvgShape):
+            return e.X.copy(), e.Y.copy()
         pol = next(p for p in e.childNodes if p.nodeName == "polygon")
         points = pol.getAttribute("points").split(' ')
         points = points[:-1]
@@ -0,0 +1,155 @@
+import numpy as np
+from utils.plan_scene import euler_matrix
+
+'''
+Mesh builder
+Builds the wall meshes of create_floorplan from numpy arrays instead of
+from_pydata plus an edit mode extrude.
+
+The extruded prism of every wall is computed here (bottom cap, top cap and one quad
+per outline edge) and written into the Blender mesh with foreach_set on vertices,
+loops and polygons, so no operator and no edit mode toggle is needed. A category
+(TopWalls, Door_Walls, ...) is either one object per wall, named <category><i> as
+before, or one merged mesh on the category object with a wall_id face attribute.
+
+Walls are extruded along world +z, like extrude_context_move under the Floorplan
+parent rotated by (0, pi, 0).
+'''
+
+# Rotation of the Floorplan parent, see create_floorplan
+PARENT_ROTATION = (0, np.pi, 0)
+
+def polygon_arrays(faces):
+    '''
+    Flat loop arrays of a face list
+    @Param faces, list of vertex index lists
+    @Return totals (verts per polygon), loops (vertex index of every corner)
+    '''
+    faces = [np.asarray(f, dtype=np.int32).ravel() for f in faces]
+    totals = np.array([len(f) for f in faces], dtype=np.int32)
+    loops = np.concatenate(faces) if faces else np.zeros(0, dtype=np.int32)
+    return totals, loops
+
+def loop_starts(totals):
+    return (np.cumsum(totals) - totals).astype(np.int32)
+
+def extrude(verts, totals, loops, offset):
+    '''
+    Closed prism of a polygon mesh moved by offset
+    @Param verts, nx3
+    @Param totals, loops, polygons as returned by polygon_arrays
+    @Param offset, translation of the top cap
+    @Return verts 2n x 3, totals, loops
+    '''
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+    n = len(verts)
+    starts = np.repeat(loop_starts(totals), totals)
+    ends = np.repeat(loop_starts(totals) + totals, totals)
+    idx = np.arange(len(loops))
+
+    # bottom cap flipped, top cap as given
+    bottom = loops[2*starts + (ends - starts) - 1 - idx]
+    top = loops + n
+
+    # outline edges are the ones used by a single polygon
+    nxt = np.where(idx + 1 == ends, starts, idx + 1)
+    a, b = loops, loops[nxt]
+    key = np.minimum(a, b).astype(np.int64)*n + np.maximum(a, b)
+    _, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+    edge = counts[inverse] == 1
+    a, b = a[edge], b[edge]
+    sides = np.stack([a, b, b + n, a + n], axis=1).ravel()
+
+    out_verts = np.concatenate([verts, verts + np.asarray(offset, dtype=np.float64)])
+    out_totals = np.concatenate([totals, totals, np.full(len(a), 4, dtype=np.int32)])
+    out_loops = np.concatenate([bottom, top, sides]).astype(np.int32)
+    return out_verts, out_totals, out_loops
+
+def merge(parts):
+    '''
+    One mesh of several
+    @Param parts, list of (verts, totals, loops)
+    @Return verts, totals, loops, part index of every polygon
+    '''
+    if not parts:
+        return np.zeros((0, 3)), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    shift = np.cumsum([0] + [len(v) for v, t, l in parts[:-1]])
+    verts = np.concatenate([v for v, t, l in parts])
+    totals = np.concatenate([t for v, t, l in parts])
+    loops = np.concatenate([l + s for (v, t, l), s in zip(parts, shift)]).astype(np.int32)
+    ids = np.repeat(np.arange(len(parts), dtype=np.int32), [len(t) for v, t, l in parts])
+    return verts, totals, loops, ids
+
+def fill_mesh(mesh, verts, totals, loops):
+    '''
+    Write the arrays into an empty Blender mesh
+    '''
+    mesh.vertices.add(len(verts))
+    mesh.vertices.foreach_set('co', np.asarray(verts, dtype=np.float32).ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set('vertex_index', np.asarray(loops, dtype=np.int32))
+    mesh.polygons.add(len(totals))
+    mesh.polygons.foreach_set('loop_start', loop_starts(totals))
+    mesh.polygons.foreach_set('loop_total', np.asarray(totals, dtype=np.int32))
+    mesh.update(calc_edges=True)
+    return mesh
+
+def add_face_ids(mesh, ids, name='wall_id'):
+    '''
+    Integer face attribute, e.g. the wall every polygon of a merged mesh came from
+    '''
+    import bpy
+    # the face domain is called POLYGON before Blender 3.0
+    domain = 'FACE' if bpy.app.version >= (3, 0, 0) else 'POLYGON'
+    attribute = mesh.attributes.new(name, 'INT', domain)
+    attribute.data.foreach_set('value', np.asarray(ids, dtype=np.int32))
+    return attribute
+
+def create_walls(category, verts, faces, height, pos, rot, cen, mat, merged=False):
+    '''
+    Create the extruded walls of one category
+    @Param category, name of the category object, e.g. TopWalls
+    @Param verts, faces, per wall data of the floorplan container
+    @Param height, extrusion along world z
+    @Param pos, rot, cen, as given to create_custom_mesh
+    @Param mat, material of all walls
+    @Param merged, one mesh on the category object instead of one child per wall
+    @Return category object
+    '''
+    import bpy
+    parent_center = np.array([int(cen[0]/2), int(cen[1]/2), int(cen[2])], dtype=np.float64)
+    pos = np.asarray(pos, dtype=np.float64)
+    rotation = euler_matrix(rot)
+    # world +z in the frame of the category object and of a wall under it
+    lift = euler_matrix(PARENT_ROTATION).T @ np.array([0, 0, height])
+    up = rotation.T @ lift
+
+    mesh = bpy.data.meshes.new(category)
+    category_obj = bpy.data.objects.new(category, mesh)
+    bpy.context.collection.objects.link(category_obj)
+
+    parts = []
+    for i in range(len(verts)):
+        v = np.asarray(verts[i], dtype=np.float64).reshape(-1, 3)
+        center = v.mean(axis=0)
+        totals, loops = polygon_arrays(faces[i])
+        if merged:
+            # the rotation of a wall is about its own center
+            local = (v - center) @ rotation.T + center - parent_center + pos
+            parts.append(extrude(local, totals, loops, lift))
+            continue
+        wall_mesh = bpy.data.meshes.new(category+str(i))
+        fill_mesh(wall_mesh, *extrude(v - center, totals, loops, up))
+        wall = bpy.data.objects.new(category+str(i), wall_mesh)
+        bpy.context.collection.objects.link(wall)
+        wall.location = tuple(center - parent_center + pos)
+        wall.rotation_euler = rot
+        wall_mesh.materials.append(mat)
+        wall.parent = category_obj
+
+    if merged:
+        all_verts, totals, loops, ids = merge(parts)
+        fill_mesh(mesh, all_verts, totals, loops)
+        add_face_ids(mesh, ids)
+        mesh.materials.append(mat)
+    return category_obj
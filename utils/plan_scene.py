@@ -0,0 +1,426 @@
+import os
+import random
+import numpy as np
+from utils.FloorplanToBlenderLib import IO
+from utils.scene_file import SceneRoom, Scene
+
+'''
+Plan scene
+The scene floorplan_to_PointClouds_in_blender.py builds, rebuilt from the Data/<n>/
+files of generate_svg_plan without Blender.
+
+Every object is a triangle mesh in world coordinates (meters, the Floorplan parent
+rotation (0, pi, 0) already applied) and carries the name Blender would give it,
+so labels match the ones of annotate-Blocky.py:
+TopWalls<i>, Door_Walls<i>, Window_Walls<i>, Bot_Window_Walls<i> are the extruded
+wall pieces, rooms are their floor faces, Door<i>/Window<i> stand for the archimesh
+door and window, furniture is named like the appended object.blend objects (Bed_1.001).
+
+Doors, windows and furniture are their bounding boxes, not the library meshes.
+placement_scene gives the same plan as the input of Placement_utils, so the
+placement stage needs no Blender either.
+'''
+
+# Rooms the render script scans, see dict in floorplan_to_PointClouds_in_blender.py
+SCANNED_ROOMS = ['Bedroom', 'LivingRoom', 'Kitchen']
+
+# Library objects replacing the SVG icons of a room, Type_List of Populate_Room
+ICON_TYPES = {'Kitchen': {'Closet': [1, 2], 'ElectricalAppliance': [1], 'Sink': [2],
+                          'Curtain': [1, 2, 3], 'Toilet': [1]},
+              'Bath': {'Toilet': [1], 'Sink': [1], 'Closet': [1, 2], 'Curtain': [1, 2, 3]},
+              'Bedroom': {'Closet': [1, 2], 'Curtain': [1, 2, 3], 'Toilet': [1]},
+              'LivingRoom': {'Closet': [1, 2], 'Curtain': [1, 2, 3], 'Toilet': [1]}}
+
+# Extrusion heights of create_floorplan
+WALL_HEIGHT = 2.5
+DOOR_HEIGHT = 2.1
+WINDOW_BOTTOM = 1.15
+WINDOW_TOP = 2.15
+CURTAIN_DEPTH = 0.2
+
+def read_data(path, name):
+    '''
+    Read one data file of generate_svg_plan from the floorplan container
+    @Param path, Data/<n>/ folder
+    @Param name, data file name, e.g. rooms_verts
+    '''
+    return IO.read_from_file(os.path.join(path, name))
+
+def euler_matrix(rot):
+    '''
+    Rotation matrix of a Blender XYZ euler
+    '''
+    rx, ry, rz = rot
+    Rx = np.array([[1, 0, 0], [0, np.cos(rx), -np.sin(rx)], [0, np.sin(rx), np.cos(rx)]])
+    Ry = np.array([[np.cos(ry), 0, np.sin(ry)], [0, 1, 0], [-np.sin(ry), 0, np.cos(ry)]])
+    Rz = np.array([[np.cos(rz), -np.sin(rz), 0], [np.sin(rz), np.cos(rz), 0], [0, 0, 1]])
+    return Rz @ Ry @ Rx
+
+def to_world(verts, transform, pos):
+    '''
+    World coordinates of a mesh made by create_custom_mesh under the Floorplan parent
+    @Param verts, verts of one mesh from a Data file
+    @Param transform, content of the transform file
+    @Param pos, pos argument given to create_custom_mesh
+    @Return nx3 array
+    '''
+    v = np.array(verts, dtype=float)
+    cen = transform['shape']
+    parent_center = np.array([int(cen[0]/2), int(cen[1]/2), int(cen[2])])
+    center = v.mean(axis=0)
+    local = v - center
+    if any(transform['rotation']):
+        local = local @ euler_matrix(transform['rotation']).T
+    p = local + center - parent_center + np.array(pos, dtype=float)
+    # parent rotation (0, pi, 0) mirrors x and z
+    return np.stack([-p[:, 0], p[:, 1], -p[:, 2]], axis=1)
+
+def clean_polygon(xy):
+    '''
+    Drop the closing point and repeated points of a 2d polygon
+    '''
+    xy = np.asarray(xy, dtype=float)[:, :2]
+    keep = [0]
+    for i in range(1, len(xy)):
+        if np.any(xy[i] != xy[keep[-1]]):
+            keep.append(i)
+    if len(keep) > 1 and np.all(xy[keep[-1]] == xy[keep[0]]):
+        keep.pop()
+    return xy[keep]
+
+def polygon_area(xy):
+    x, y = xy[:, 0], xy[:, 1]
+    return 0.5*np.sum(x*np.roll(y, -1) - np.roll(x, -1)*y)
+
+def _cross(a, b, c):
+    return (b[0]-a[0])*(c[1]-a[1]) - (b[1]-a[1])*(c[0]-a[0])
+
+def _in_triangle(p, a, b, c):
+    return _cross(a, b, p) >= 0 and _cross(b, c, p) >= 0 and _cross(c, a, p) >= 0
+
+def triangulate_polygon(xy):
+    '''
+    Ear clipping of a simple 2d polygon
+    @Param xy, nx2 polygon without closing point
+    @Return list of index triples
+    '''
+    idx = list(range(len(xy)))
+    if polygon_area(xy) < 0:
+        idx.reverse()
+    tris = []
+    while len(idx) > 3:
+        n = len(idx)
+        for k in range(n):
+            i0, i1, i2 = idx[k-1], idx[k], idx[(k+1) % n]
+            a, b, c = xy[i0], xy[i1], xy[i2]
+            if _cross(a, b, c) <= 0:
+                continue
+            if any(_in_triangle(xy[j], a, b, c) for j in idx if j not in (i0, i1, i2)):
+                continue
+            tris.append((i0, i1, i2))
+            idx.pop(k)
+            break
+        else:
+            # no ear left, only collinear points or a self touching outline
+            straight = [k for k in range(n) if _cross(xy[idx[k-1]], xy[idx[k]], xy[idx[(k+1) % n]]) == 0]
+            if not straight:
+                tris += [(idx[0], idx[k], idx[k+1]) for k in range(1, n-1)]
+                return tris
+            idx.pop(straight[0])
+    if len(idx) == 3:
+        tris.append(tuple(idx))
+    return tris
+
+def prism(xy, z0, z1):
+    '''
+    Closed triangle mesh of a 2d polygon extruded from z0 to z1
+    @Return vertices nx3, triangles mx3
+    '''
+    xy = clean_polygon(xy)
+    n = len(xy)
+    verts = np.concatenate([np.column_stack([xy, np.full(n, z0)]),
+                            np.column_stack([xy, np.full(n, z1)])])
+    tris = []
+    for i in range(n):
+        j = (i+1) % n
+        tris += [(i, j, n+j), (i, n+j, n+i)]
+    for a, b, c in triangulate_polygon(xy):
+        tris += [(a, c, b), (n+a, n+b, n+c)]
+    return verts, np.array(tris, dtype=np.int64)
+
+def flat(xy, z):
+    '''
+    Triangle mesh of a 2d polygon at height z
+    '''
+    xy = clean_polygon(xy)
+    verts = np.column_stack([xy, np.full(len(xy), z)])
+    return verts, np.array(triangulate_polygon(xy), dtype=np.int64).reshape(-1, 3)
+
+def bbox_xy(xy):
+    xy = np.asarray(xy)
+    return [xy[:, 0].min(), xy[:, 1].min(), xy[:, 0].max(), xy[:, 1].max()]
+
+def bbox_polygon(xmin, ymin, xmax, ymax):
+    return np.array([[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax]])
+
+def overlap_xy(box1, box2, tol=0):
+    '''
+    xy overlap of two [xmin, ymin, xmax, ymax] boxes, check_inter(xy=True) of the render script
+    '''
+    return (box1[2]+tol >= box2[0]-tol and box2[2]+tol >= box1[0]-tol and
+            box1[3]+tol >= box2[1]-tol and box2[3]+tol >= box1[1]-tol)
+
+def unit_vector(vector):
+    return np.array(vector) / np.linalg.norm(vector)
+
+def conv_to_vectors(polygon):
+    '''
+    Edges of a room outline, same dicts as conv_to_vectors of the render script
+    @Param polygon, world xy of the room mesh vertices in mesh order
+    @Return list of {'vector', 'tail', 'mag', 'direction'}
+    '''
+    b = [list(i) for i in np.asarray(polygon)[:, :2]]
+    b.append(b[0])
+    vectors = [{'vector': [i-j for i, j in zip(b[k+1], b[k])], 'tail': b[k]} for k in range(len(b)-1)]
+    axis_fix = np.array([1, 0])
+    for i in vectors:
+        i['mag'] = np.linalg.norm(i['vector'])
+        if i['vector'][1] == 0:
+            i['direction'] = np.arccos(np.dot(i['vector'], axis_fix)/i['mag'])
+        else:
+            i['direction'] = -1*np.sign(i['vector'][1])*np.arccos(np.dot(i['vector'], axis_fix)/i['mag'])
+    return vectors
+
+def usable_room(name, polygon):
+    '''
+    Room filter of the render script, scanned room type without point or slanted walls
+    '''
+    if name.split('.')[0] not in SCANNED_ROOMS:
+        return False
+    for k in [i['vector'] for i in conv_to_vectors(polygon)]:
+        # POINT WALL FILTER
+        if k[0] == 0 and k[1] == 0:
+            return False
+        # SLANT WALL FILTER
+        if int(k[0]) != 0 and int(k[1]) != 0:
+            return False
+    return True
+
+def unique_name(name, taken):
+    '''
+    Blender style name, Bedroom, Bedroom.001, ...
+    '''
+    new = name
+    count = 0
+    while new in taken:
+        count += 1
+        new = name + '.%03d' % (count)
+    taken.add(new)
+    return new
+
+def read_object_boxes(path):
+    '''
+    Local bounding boxes of the object.blend objects
+    @Param path, object_boundbox.txt
+    @Return dict name -> [xmin, ymin, zmin, xmax, ymax, zmax]
+    '''
+    boxes = {}
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 7:
+                boxes[parts[0]] = [float(i) for i in parts[1:]]
+    return boxes
+
+def read_placed_polygons(path):
+    '''
+    Objects placed by Placement_utils
+    @Return list of (name, x, y, rotation in degrees)
+    '''
+    placed = []
+    if not os.path.isfile(path):
+        return placed
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split(',')
+            if len(parts) < 4:
+                continue
+            placed.append((parts[0], float(parts[1]), float(parts[2]), float(parts[3])))
+    return placed
+
+class PlanScene:
+    '''
+    Plan scene
+    Meshes of one floorplan in world coordinates
+    '''
+    def __init__(self):
+        self.names = []
+        self.vertices = []
+        self.triangles = []
+        self.rooms = {}
+        self.taken = set()
+
+    def add(self, name, vertices, triangles):
+        '''
+        Add one object
+        @Return name, made unique the way Blender does
+        '''
+        name = unique_name(name, self.taken)
+        self.names.append(name)
+        self.vertices.append(np.asarray(vertices, dtype=float))
+        self.triangles.append(np.asarray(triangles, dtype=np.int64))
+        return name
+
+    def bbox(self, name):
+        v = self.vertices[self.names.index(name)]
+        return list(v.min(axis=0)) + list(v.max(axis=0))
+
+    def usable_rooms(self):
+        return [i for i in sorted(self.rooms) if usable_room(i, self.rooms[i])]
+
+    def room_parts(self, prefix, roomname, tol=0.001):
+        '''
+        Objects of a group touching a room in xy, like Room_Window_List
+        '''
+        room = bbox_xy(self.rooms[roomname])
+        out = []
+        for name, v in zip(self.names, self.vertices):
+            if name.startswith(prefix) and name[len(prefix):].isdigit() and overlap_xy(room, bbox_xy(v), tol):
+                out.append(name)
+        return out
+
+def add_walls(scene, path, name, transform, pos, height, prefix):
+    verts = read_data(path, name)
+    z = []
+    for i, v in enumerate(verts):
+        w = to_world(v, transform, pos)
+        z0 = w[:, 2].mean()
+        scene.add(prefix+str(i), *prism(w[:, :2], z0, z0+height))
+        z.append(z0)
+    return z
+
+def add_furniture(scene, name, box, angle, center):
+    '''
+    Box of a library object rotated about z and moved to center
+    @Param box, local [xmin, ymin, zmin, xmax, ymax, zmax]
+    @Param angle, radians
+    '''
+    corners = bbox_polygon(box[0], box[1], box[3], box[4])
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    corners = corners @ rot.T + np.array(center[:2])
+    return scene.add(name, *prism(corners, box[2], box[5]))
+
+def add_structure(scene, path, transform):
+    '''
+    Walls, rooms, doors and windows of a plan, as send_floorplan of Placement_Info.py builds them
+    @Return pos of the rooms and icons
+    '''
+    pos = list(transform['position'])
+
+    add_walls(scene, path, 'top_wall_verts', transform, pos, WALL_HEIGHT, 'TopWalls')
+    door_z = add_walls(scene, path, 'doors_verts', transform, [0, 0, -1-DOOR_HEIGHT], WALL_HEIGHT-DOOR_HEIGHT, 'Door_Walls')
+    window_z = add_walls(scene, path, 'windows_verts', transform, [0, 0, -1-WINDOW_BOTTOM-1], WALL_HEIGHT-WINDOW_TOP, 'Window_Walls')
+    add_walls(scene, path, 'windows_verts', transform, [0, 0, -1], WINDOW_BOTTOM, 'Bot_Window_Walls')
+
+    # rooms and icons sit at pos z = -1
+    pos[2] = -1
+    names = read_data(path, 'room_names')
+    for name, v in zip(names, read_data(path, 'rooms_verts')):
+        w = to_world(v, transform, pos)
+        name = scene.add(name, *flat(w[:, :2], w[:, 2].mean()))
+        scene.rooms[name] = w[:, :2]
+
+    # archimesh doors and windows fill the openings below and between the wall pieces
+    for i, v in enumerate(read_data(path, 'doors_verts')):
+        w = to_world(v, transform, pos)
+        scene.add('Door'+str(i), *prism(w[:, :2], 0, door_z[i]))
+    for i, v in enumerate(read_data(path, 'windows_verts')):
+        w = to_world(v, transform, pos)
+        scene.add('Window'+str(i), *prism(w[:, :2], window_z[i]-1, window_z[i]))
+    return pos
+
+def placement_scene(path):
+    '''
+    Input of the placement stage without Blender
+    Same rooms, room contents and boxes as Placement_Info.plan_polygons reads from the
+    built scene, the archimesh doors and windows are the boxes of their openings
+    @Param path, Data/<n>/ folder of generate_svg_plan
+    @Return utils.scene_file.Scene
+    '''
+    scene = PlanScene()
+    transform = read_data(path, 'transform')
+    pos = add_structure(scene, path, transform)
+
+    # icons are named after the rooms, Blender names are unique over both
+    icons = []
+    boxes = {}
+    for name, v in zip(read_data(path, 'icon_names'), read_data(path, 'icons_verts')):
+        w = to_world(v, transform, pos)
+        name = unique_name(name, scene.taken)
+        icons.append((name, bbox_xy(w)))
+        boxes[name] = list(w.min(axis=0)) + list(w.max(axis=0))
+    for name in scene.names:
+        if (name.startswith('Door') and name[4:].isdigit()) or (name.startswith('Window') and name[6:].isdigit()):
+            boxes[name] = scene.bbox(name)
+
+    rooms = []
+    for name, v in zip(scene.rooms, read_data(path, 'rooms_verts')):
+        w = to_world(v, transform, pos)
+        room = bbox_xy(scene.rooms[name])
+        rooms.append(SceneRoom(name, [list(t) for t in w.T],
+                               [int(i[len('Door_Walls'):]) for i in scene.room_parts('Door_Walls', name)],
+                               [int(i[len('Window_Walls'):]) for i in scene.room_parts('Window_Walls', name)],
+                               [i for i, b in icons if overlap_xy(b, room)]))
+    return Scene(rooms, boxes)
+
+def load_plan(path, object_boxes='object_boundbox.txt', placed_polygons='Placed_polygons.txt', seed=None):
+    '''
+    Build the scene of a plan
+    @Param path, Data/<n>/ folder of generate_svg_plan
+    @Param object_boxes, object_boundbox.txt
+    @Param placed_polygons, output of the placement stage, missing file means no furniture
+    @Param seed, for the library types replacing icons
+    @Return PlanScene
+    '''
+    rnd = random.Random(seed)
+    scene = PlanScene()
+    transform = read_data(path, 'transform')
+    pos = add_structure(scene, path, transform)
+
+    boxes = read_object_boxes(object_boxes) if os.path.isfile(object_boxes) else {}
+    icons = [(name, bbox_xy(to_world(v, transform, pos)))
+             for name, v in zip(read_data(path, 'icon_names'), read_data(path, 'icons_verts'))]
+
+    # library copies get .001, .002 per type, shared by icons and placed objects
+    index = {}
+    def library_name(name):
+        count = index.get(name, 0)
+        index[name] = count + 1
+        return name if count == 0 else name + '.%03d' % (count)
+
+    for roomname in scene.usable_rooms():
+        room_type = roomname.split('.')[0]
+        room = bbox_xy(scene.rooms[roomname])
+        center = np.mean(scene.rooms[roomname], axis=0)
+        places = [(i, b) for i, b in icons if overlap_xy(room, b)]
+        for i in scene.room_parts('Window_Walls', roomname):
+            xmin, ymin, xmax, ymax = bbox_xy(scene.vertices[scene.names.index(i)])
+            # curtain strip on the room side of the window
+            if xmax-xmin > ymax-ymin:
+                y = ymax if abs(center[1]-ymax) < abs(center[1]-ymin) else ymin - CURTAIN_DEPTH
+                places.append(('Curtain', [xmin, y, xmax, y+CURTAIN_DEPTH]))
+            else:
+                x = xmax if abs(center[0]-xmax) < abs(center[0]-xmin) else xmin - CURTAIN_DEPTH
+                places.append(('Curtain', [x, ymin, x+CURTAIN_DEPTH, ymax]))
+        for obj, b in places:
+            if obj not in ICON_TYPES.get(room_type, {}):
+                continue
+            name = obj + '_' + str(rnd.choice(ICON_TYPES[room_type][obj]))
+            z = boxes.get(name, [0, 0, 0, 0, 0, 1])
+            scene.add(library_name(name), *prism(bbox_polygon(*b), z[2], z[5]))
+
+    for name, x, y, rot in read_placed_polygons(placed_polygons):
+        if name not in boxes:
+            continue
+        add_furniture(scene, library_name(name), boxes[name], np.radians(rot), [x, y])
+    return scene
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import heapq
+
+'''
+Render estimator
+Predicts the render cost of a plan before any rendering starts.
+
+MakeAnimation of floorplan_to_PointClouds_in_blender.py walks the camera along every
+wall of a room, one frame per meter plus two per corner, so the number of frames a
+plan renders follows from the "Space <type>" polygons of its SVG alone:
+frames of a room = 3 + sum(int(wall length) + 2), for the rooms the render script keeps.
+
+Seconds are base + per_room * rooms + per_frame * frames. The three costs are fitted
+to the plan spans of past runs (python -m utils.telemetry records), or, when the runs
+lack plan spans with an svg, per_frame is taken from the render_room and rgbd_fusion
+spans alone.
+
+python -m utils.render_estimator --telemetry <run_dir> <model.svg...>
+'''
+
+# Costs used before any telemetry exists, seconds
+DEFAULT_BASE = 60.0
+DEFAULT_PER_ROOM = 20.0
+DEFAULT_PER_FRAME = 2.0
+
+def svg_rooms(svg_path):
+    '''
+    Rooms of a CubiCasa svg, same parsing and names as generate_svg_plan
+    @Return list of (room name, polygon in meters)
+    '''
+    from utils.loaders.svg_utils import get_room_number
+    from utils.loaders.svg_cache import load_plan
+    from utils.FloorplanToBlenderLib.generate import rooms_list, saved_room_names
+    rooms = []
+    for e in load_plan(svg_path).spaces:
+        num = get_room_number(e, rooms_list)
+        polygon = [[x/100.0, y/100.0] for x, y in zip(e.X, e.Y)]
+        rooms.append((saved_room_names[num], polygon))
+    return rooms
+
+def room_frames(polygon):
+    '''
+    Frames MakeAnimation renders for a room
+    '''
+    from utils.plan_scene import conv_to_vectors
+    return 3 + sum(int(i['mag']) + 2 for i in conv_to_vectors(polygon))
+
+def plan_frames(svg_path):
+    '''
+    Frames and rendered rooms of a plan
+    @Return frames, rooms
+    '''
+    from utils.plan_scene import usable_room
+    frames = 0
+    rooms = 0
+    for name, polygon in svg_rooms(svg_path):
+        if len(polygon) < 3 or not usable_room(name, polygon):
+            continue
+        frames += room_frames(polygon)
+        rooms += 1
+    return frames, rooms
+
+def _solve(a, b):
+    # gaussian elimination with partial pivoting, a is square
+    n = len(a)
+    m = [list(a[i]) + [b[i]] for i in range(n)]
+    for c in range(n):
+        p = max(range(c, n), key=lambda r: abs(m[r][c]))
+        if abs(m[p][c]) < 1e-12:
+            return None
+        m[c], m[p] = m[p], m[c]
+        for r in range(n):
+            if r != c:
+                f = m[r][c] / m[c][c]
+                m[r] = [x - f*y for x, y in zip(m[r], m[c])]
+    return [m[i][n] / m[i][i] for i in range(n)]
+
+class RenderEstimator:
+    '''
+    Render cost model, seconds = base + per_room * rooms + per_frame * frames
+    '''
+    def __init__(self, base=DEFAULT_BASE, per_frame=DEFAULT_PER_FRAME, per_room=DEFAULT_PER_ROOM):
+        self.base = base
+        self.per_frame = per_frame
+        self.per_room = per_room
+        self.samples = 0
+
+    def seconds(self, frames, rooms):
+        return self.base + self.per_room*rooms + self.per_frame*frames
+
+    def predict(self, svg_path):
+        '''
+        Estimate of one plan
+        @Param svg_path, model.svg of the plan
+        @Return dict frames, rooms, seconds
+        '''
+        if not os.path.isfile(svg_path):
+            return {'frames': 0, 'rooms': 0, 'seconds': self.base}
+        frames, rooms = plan_frames(svg_path)
+        return {'frames': frames, 'rooms': rooms, 'seconds': round(self.seconds(frames, rooms), 1)}
+
+    def calibrate(self, records):
+        '''
+        Fit the costs to telemetry records
+        @Param records, list of records of utils.telemetry.read_run
+        @Return self
+        '''
+        rows = []
+        for r in records:
+            svg = r.get('counts', {}).get('svg')
+            if r['stage'] != 'plan' or r.get('status', 'ok') != 'ok' or not svg or not os.path.isfile(svg):
+                continue
+            frames, rooms = plan_frames(svg)
+            rows.append((1.0, float(rooms), float(frames), r['seconds']))
+
+        if len(rows) >= 3:
+            # least squares over [1, rooms, frames]
+            ata = [[sum(row[i]*row[j] for row in rows) for j in range(3)] for i in range(3)]
+            atb = [sum(row[i]*row[3] for row in rows) for i in range(3)]
+            x = _solve(ata, atb)
+            if x is not None and x[2] > 0:
+                self.base, self.per_room, self.per_frame = [max(0.0, i) for i in x]
+                self.samples = len(rows)
+                return self
+
+        # no usable plan spans, per frame cost of the render spans only
+        seconds = sum(r['seconds'] for r in records if r['stage'] in ['render_room', 'rgbd_fusion'])
+        frames = sum(r.get('counts', {}).get('frames', 0) for r in records if r['stage'] == 'render_room')
+        if frames > 0:
+            self.per_frame = seconds / frames
+            self.samples = len([r for r in records if r['stage'] == 'render_room'])
+        return self
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'base': self.base, 'per_frame': self.per_frame,
+                       'per_room': self.per_room, 'samples': self.samples}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            d = json.load(f)
+        estimator = cls(d['base'], d['per_frame'], d['per_room'])
+        estimator.samples = d.get('samples', 0)
+        return estimator
+
+def from_telemetry(run_dir):
+    '''
+    Estimator calibrated from a run directory, defaults when it has no telemetry
+    '''
+    from utils.telemetry import read_run
+    estimator = RenderEstimator()
+    if run_dir and os.path.exists(run_dir):
+        estimator.calibrate(read_run(run_dir))
+    return estimator
+
+def lpt_schedule(costs, workers):
+    '''
+    Longest processing time first, every job goes to the least loaded worker
+    @Param costs, list of job costs
+    @Param workers, number of workers
+    @Return bins (list of job indices per worker), loads (summed cost per worker)
+    '''
+    workers = max(1, workers)
+    bins = [[] for _ in range(workers)]
+    loads = [0.0] * workers
+    heap = [(0.0, w) for w in range(workers)]
+    for i in sorted(range(len(costs)), key=lambda i: -costs[i]):
+        load, w = heapq.heappop(heap)
+        bins[w].append(i)
+        loads[w] = load + costs[i]
+        heapq.heappush(heap, (loads[w], w))
+    return bins, loads
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Predicted frames and render seconds of plans")
+    parser.add_argument('svgs', nargs='+', help="model.svg files")
+    parser.add_argument('--telemetry', help="run directory or telemetry .jsonl to calibrate from")
+    parser.add_argument('--model', help="saved estimator .json, written with --save")
+    parser.add_argument('--save', help="write the calibrated estimator to this .json")
+    parser.add_argument('--workers', type=int, default=1, help="print the makespan for this many workers")
+    args = parser.parse_args(argv)
+
+    estimator = RenderEstimator.load(args.model) if args.model else from_telemetry(args.telemetry)
+    if args.save:
+        estimator.save(args.save)
+    print("base %.1f s, per room %.2f s, per frame %.3f s (%d samples)" % (
+        estimator.base, estimator.per_room, estimator.per_frame, estimator.samples))
+    costs = []
+    for svg in args.svgs:
+        p = estimator.predict(svg)
+        costs.append(p['seconds'])
+        print("%-60s %6d frames %3d rooms %9.1f s" % (svg, p['frames'], p['rooms'], p['seconds']))
+    bins, loads = lpt_schedule(costs, args.workers)
+    print("Total %.1f s, makespan on %d workers %.1f s" % (sum(costs), args.workers, max(loads)))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
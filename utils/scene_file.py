@@ -0,0 +1,139 @@
+import os
+import json
+
+'''
+Scene file
+One structured description of a placed plan, written by Placement_Info.py as
+<program_path>/scene.json and read once per plan by Placement_utils:
+
+{"version": 1,
+ "rooms": [{"name": "Bedroom.001", "polygon": [[x...], [y...], [z...]],
+            "doors": [3, 4], "windows": [1], "objects": ["Closet_1.002"]}, ...],
+ "boxes": {"Door3": [xmin, ymin, zmin, xmax, ymax, zmax], ...}}
+
+Rooms keep the Blender names and their order, boxes are the world AABBs of the
+appended objects, doors and windows. The older rooms.txt, rooms_info.txt and
+objects.txt of a program folder are still read when no scene.json exists.
+'''
+
+SCENE_FILE = 'scene.json'
+SCENE_VERSION = 1
+
+# Text files of older Placement_Info.py runs
+LEGACY_FILES = ['rooms.txt', 'rooms_info.txt', 'objects.txt']
+
+class SceneRoom:
+    '''
+    A room of the scene
+    @Param polygon, [x list, y list, z list] of the floor outline
+    @Param doors, windows, numbers of the Door<i> / Window<i> boxes touching the room
+    @Param objects, names of the appended objects in the room
+    '''
+    __slots__ = ['name', 'polygon', 'doors', 'windows', 'objects']
+
+    def __init__(self, name, polygon, doors, windows, objects):
+        self.name = name
+        self.polygon = polygon
+        self.doors = doors
+        self.windows = windows
+        self.objects = objects
+
+    @property
+    def type(self):
+        # Bedroom of Bedroom.001
+        return self.name.split('.')[0]
+
+class Scene:
+    '''
+    Rooms and object boxes of a plan
+    @Param rooms, list of SceneRoom
+    @Param boxes, dict name -> world AABB
+    '''
+    def __init__(self, rooms, boxes):
+        self.rooms = dict((r.name, r) for r in rooms)
+        self.boxes = boxes
+
+    @classmethod
+    def from_polygons(cls, Rooms, BB, Inf):
+        '''
+        Scene of the (Rooms, BB, Inf) dicts of Placement_Info.plan_polygons
+        '''
+        rooms = [SceneRoom(name, Rooms[name], list(Inf[name][0]), list(Inf[name][1]),
+                           [i for i in Inf[name][2] if i != '']) for name in Rooms]
+        return cls(rooms, BB)
+
+    def room_boxes(self, roomname):
+        '''
+        Boxes already in a room, its objects then doors then windows
+        @Return list of (name, AABB)
+        '''
+        room = self.rooms[roomname]
+        names = room.objects + ['Door'+str(i) for i in room.doors] + ['Window'+str(i) for i in room.windows]
+        return [(i, self.boxes[i]) for i in names]
+
+    def to_dict(self):
+        return {'version': SCENE_VERSION,
+                'rooms': [{'name': r.name, 'polygon': [[float(j) for j in t] for t in r.polygon],
+                           'doors': [int(j) for j in r.doors], 'windows': [int(j) for j in r.windows],
+                           'objects': r.objects} for r in self.rooms.values()],
+                'boxes': dict((name, [float(j) for j in bb]) for name, bb in self.boxes.items())}
+
+def write_scene(directory, scene):
+    '''
+    Write scene.json and remove the text files it replaces
+    @Param directory, program folder
+    @Param scene, Scene
+    @Return path of scene.json
+    '''
+    for i in LEGACY_FILES:
+        if os.path.exists(os.path.join(directory, i)):
+            os.remove(os.path.join(directory, i))
+    path = os.path.join(directory, SCENE_FILE)
+    with open(path+'.tmp', 'w') as f:
+        json.dump(scene.to_dict(), f)
+    os.replace(path+'.tmp', path)
+    return path
+
+def read_scene(path):
+    '''
+    Scene of a scene.json
+    '''
+    with open(path, 'r') as f:
+        d = json.load(f)
+    if d.get('version') != SCENE_VERSION:
+        raise ValueError("Unknown scene version " + str(d.get('version')) + " in " + path)
+    rooms = [SceneRoom(r['name'], r['polygon'], r['doors'], r['windows'], r['objects']) for r in d['rooms']]
+    return Scene(rooms, d['boxes'])
+
+def read_legacy_scene(directory):
+    '''
+    Scene of rooms.txt, rooms_info.txt and objects.txt
+    '''
+    with open(os.path.join(directory, 'rooms.txt'), 'r') as f:
+        lines = f.readlines()
+    Rooms = {}
+    for i in range(len(lines)//3):
+        xyz = lines[i*3:(i+1)*3]
+        Rooms[xyz[0].split(',')[0]] = [[float(j) for j in t.split(',')[1:]] for t in xyz]
+    BB = {}
+    with open(os.path.join(directory, 'objects.txt'), 'r') as f:
+        for line in f:
+            BB[line.split(',')[0]] = [float(j) for j in line.split(',')[1:]]
+    with open(os.path.join(directory, 'rooms_info.txt'), 'r') as f:
+        lines = f.readlines()
+    Inf = {}
+    for i in range(len(lines)//4):
+        name, d, w, o = lines[i*4:(i+1)*4]
+        Inf[name[:-1]] = [[int(j) for j in d.split(',')[:-1]], [int(j) for j in w.split(',')[:-1]], o[:-2].split(',')]
+    return Scene.from_polygons(Rooms, BB, Inf)
+
+def load_scene(directory):
+    '''
+    Scene of a program folder, scene.json or the older text files
+    @Param directory, program folder
+    @Return Scene
+    '''
+    path = os.path.join(directory, SCENE_FILE)
+    if os.path.isfile(path):
+        return read_scene(path)
+    return read_legacy_scene(directory)
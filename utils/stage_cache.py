@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import hashlib
+
+'''
+Stage cache
+Content addressed store for the outputs of the pipeline stages
+(generate -> placement -> render -> downsample -> annotate).
+
+A stage's key is the sha256 of everything its output depends on: bytes of the
+input files (SVG, image, scripts), its parameters and the keys of the stages
+before it. When the key is already in the cache the stage is skipped and its
+outputs are copied back, so changing e.g. only the voxel size reruns only
+downsample and annotate.
+
+Layout: <root>/<stage>/<key>/<name> for every stored file or folder, plus meta.json.
+'''
+
+def hash_file(path, h=None):
+    '''
+    Feed bytes of a file or all files below a folder into a hash
+    @Param path, file or folder
+    @Param h, hashlib object, new sha256 if None
+    @Return hashlib object
+    '''
+    if h is None:
+        h = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for f in sorted(files):
+                full = os.path.join(root, f)
+                h.update(os.path.relpath(full, path).encode())
+                hash_file(full, h)
+        return h
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h
+
+def _copy(src, dst):
+    parent = os.path.dirname(dst)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    if os.path.isdir(src):
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+class StageCache:
+    '''
+    Local stage cache
+    @Param root, folder of the cache
+    '''
+    def __init__(self, root):
+        self.root = root
+
+    def key(self, stage, files=[], params={}, parents=[]):
+        '''
+        Key of a stage
+        @Param stage, stage name
+        @Param files, input files and scripts whose bytes the output depends on
+        @Param params, json serializable parameters
+        @Param parents, keys of the stages this one consumes
+        @Return hex digest
+        '''
+        h = hashlib.sha256()
+        h.update(stage.encode())
+        for k in parents:
+            h.update(k.encode())
+        for f in files:
+            h.update(b'\0file\0')
+            if os.path.exists(f):
+                hash_file(f, h)
+            else:
+                h.update(b'missing ' + f.encode())
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def entry(self, stage, key):
+        return os.path.join(self.root, stage, key)
+
+    def has(self, stage, key):
+        return os.path.isfile(os.path.join(self.entry(stage, key), 'meta.json'))
+
+    def store(self, stage, key, outputs, meta={}):
+        '''
+        Store outputs of a stage
+        @Param outputs, dict name -> file or folder produced by the stage, missing ones are left out
+        @Param meta, extra json data returned by restore
+        '''
+        if self.has(stage, key):
+            return
+        entry = self.entry(stage, key)
+        tmp = entry + '.tmp' + str(os.getpid())
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        stored = [name for name, src in outputs.items() if os.path.exists(src)]
+        for name in stored:
+            _copy(outputs[name], os.path.join(tmp, name))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'stage': stage, 'outputs': sorted(stored), 'meta': meta}, f)
+        try:
+            # rename is atomic, a concurrent writer of the same key just loses
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp)
+
+    def restore(self, stage, key, outputs):
+        '''
+        Copy cached outputs of a stage back into place
+        @Param outputs, dict name -> destination path
+        @Return meta given to store
+        '''
+        entry = self.entry(stage, key)
+        with open(os.path.join(entry, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        for name, dst in outputs.items():
+            if name in meta['outputs']:
+                _copy(os.path.join(entry, name), dst)
+        return meta['meta']
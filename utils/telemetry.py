@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import socket
+import contextlib
+
+'''
+Telemetry
+Per stage timing and resource records for the point cloud pipeline.
+
+Code under measurement is wrapped in span(stage), which appends one JSON line
+{stage, start, seconds, peak_rss_mb, counts, pid, host} to the file named by the
+PIPELINE_TELEMETRY environment variable. Without the variable spans cost nothing.
+The variable is inherited by the Blender processes, so the Blender scripts write
+to the same file.
+
+peak_rss_mb is the high water mark of the process (and of its finished children,
+e.g. Blender launched with check_output) at the end of the span, not of the span alone.
+
+Aggregate a run directory (every *telemetry*.jsonl below it) with
+python -m utils.telemetry <run_dir>
+'''
+
+TELEMETRY_ENV = 'PIPELINE_TELEMETRY'
+
+def peak_rss_mb():
+    '''
+    Peak resident set size of this process and its waited for children
+    @Return megabytes, None where resource is not available
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    scale = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0
+    return round(max(self_rss, child_rss) / scale, 1)
+
+def enabled():
+    return bool(os.environ.get(TELEMETRY_ENV))
+
+def write(record):
+    '''
+    Append one record to the telemetry file
+    '''
+    path = os.environ.get(TELEMETRY_ENV)
+    if not path:
+        return
+    # one write per line, lines of concurrent writers do not interleave
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+@contextlib.contextmanager
+def span(stage, **counts):
+    '''
+    Time a stage
+    @Param stage, stage name, e.g. render_frame
+    @Param counts, item counts known up front, e.g. rooms=3
+    Yields the counts dict, counts known only at the end can be added to it
+    '''
+    if not enabled():
+        yield counts
+        return
+    start = time.time()
+    status = 'ok'
+    try:
+        yield counts
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        write({'stage': stage,
+               'start': start,
+               'seconds': round(time.time() - start, 6),
+               'peak_rss_mb': peak_rss_mb(),
+               'counts': counts,
+               'status': status,
+               'pid': os.getpid(),
+               'host': socket.gethostname()})
+
+def read_run(run_dir):
+    '''
+    Read all telemetry records below a run directory
+    @Param run_dir, folder or single .jsonl file
+    @Return list of records
+    '''
+    if os.path.isfile(run_dir):
+        files = [run_dir]
+    else:
+        files = []
+        for root, dirs, names in os.walk(run_dir):
+            files += [os.path.join(root, i) for i in names if 'telemetry' in i and i.endswith('.jsonl')]
+    records = []
+    for path in sorted(files):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+def percentile(values, q):
+    '''
+    Linear interpolated percentile of a sorted list
+    '''
+    if not values:
+        return None
+    pos = (len(values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+def summarize(records, percentiles=(50, 90, 99)):
+    '''
+    Per stage statistics
+    @Return dict stage -> {n, total, p50..., max, peak_rss_mb, counts totals}
+    '''
+    stages = {}
+    for r in records:
+        stages.setdefault(r['stage'], []).append(r)
+    summary = {}
+    for stage, rs in stages.items():
+        seconds = sorted(r['seconds'] for r in rs)
+        rss = [r['peak_rss_mb'] for r in rs if r.get('peak_rss_mb') is not None]
+        counts = {}
+        for r in rs:
+            for k, v in r.get('counts', {}).items():
+                if isinstance(v, (int, float)):
+                    counts[k] = counts.get(k, 0) + v
+        s = {'n': len(rs), 'total': sum(seconds), 'max': seconds[-1]}
+        for q in percentiles:
+            s['p'+str(q)] = percentile(seconds, q)
+        s['peak_rss_mb'] = max(rss) if rss else None
+        s['counts'] = counts
+        s['failed'] = len([r for r in rs if r.get('status', 'ok') != 'ok'])
+        summary[stage] = s
+    return summary
+
+def print_summary(summary):
+    header = "%-22s %7s %10s %9s %9s %9s %9s %9s  %s" % ('stage', 'n', 'total s', 'p50', 'p90', 'p99', 'max', 'rss MB', 'counts')
+    print(header)
+    print('-' * len(header))
+    for stage, s in sorted(summary.items(), key=lambda kv: -kv[1]['total']):
+        print("%-22s %7d %10.2f %9.3f %9.3f %9.3f %9.3f %9s  %s" % (
+            stage, s['n'], s['total'], s['p50'], s['p90'], s['p99'], s['max'],
+            '-' if s['peak_rss_mb'] is None else s['peak_rss_mb'],
+            ' '.join(k+'='+str(v) for k, v in sorted(s['counts'].items()))))
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Per stage percentiles of a pipeline run")
+    parser.add_argument('run_dir', help="run directory or telemetry .jsonl file")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args(argv)
+    summary = summarize(read_run(args.run_dir))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
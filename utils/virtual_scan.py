@@ -0,0 +1,369 @@
+import os
+import sys
+import numpy as np
+from utils import plan_scene
+from utils.telemetry import span
+
+'''
+Virtual scan
+Blender free replacement of the render stage. Casts the camera rays of
+floorplan_to_PointClouds_in_blender.py on CPU into the plan scene of
+utils.plan_scene and writes each room's labelled point cloud directly,
+no Cycles render and no RGB/EXR round trip.
+
+The camera follows the trajectory MakeAnimation keys, frame by frame, with the
+same FOV, resolution and clip range. Keys are interpolated linearly, Blender's
+default Bezier easing only changes how the frames are spread along the path.
+
+Output has the layout of the render and annotate stages:
+_Plan_<n>/<room>/<room>.ply (world/1000, like the fused RGBD cloud), pose/, Intrinsic/,
+<room>_downsampled.npy, <room>_downsampled(cls).npy, <room>_labels.npy and
+<room>_labels_norm.npy. Labels come from the hit triangle, not from a nearest
+object search. Colors are a fixed color per object class.
+
+Rays are cast with open3d.t RaycastingScene, or with plain numpy when it is missing.
+
+Usage:
+python -m utils.virtual_scan Data/<n>/ --placed Placed_polygons.txt
+'''
+
+CAMERA_FOV = 1.49484
+IMAGE_WIDTH = 640
+IMAGE_HEIGHT = 480
+CLIP_START = 0.4
+CLIP_END = 10
+CAMERA_HEIGHT = 1.5
+CROP_BUFFER = 0.2
+LABEL_VOXEL = 0.05
+
+def intrinsic():
+    '''
+    Camera matrix of the render script, sensor fit AUTO with a horizontal FOV
+    '''
+    f = (IMAGE_WIDTH/2.0)/np.tan(CAMERA_FOV/2.0)
+    return np.array([[f, 0, IMAGE_WIDTH/2.0], [0, f, IMAGE_HEIGHT/2.0], [0, 0, 1]])
+
+def camera_keyframes(polygon):
+    '''
+    Keyframes of MakeAnimation
+    @Param polygon, world xy outline of the room
+    @Return location keys {frame: xyz}, rotation keys {frame: euler}, frame_end
+    '''
+    pi = np.pi
+    pol = plan_scene.conv_to_vectors(polygon)
+    poly = np.array([i['tail'] for i in pol])
+    mean = poly.mean(axis=0)
+    cam_poly = (poly - mean)*0.5 + mean
+    loc = {}
+    rot = {}
+    f = 1.0
+    for j, i in enumerate(pol):
+        if j == 0:
+            if i['direction'] in [0, pi]:
+                i['direction'] = pi if i['direction'] == 0 else 0
+            st_angle = i['direction']
+        k = j + 1 if j < len(pol)-1 else 0
+        switch_angle = -pi/2
+        r = np.array([[np.cos(switch_angle), -np.sin(switch_angle)], [np.sin(switch_angle), np.cos(switch_angle)]])
+        d = list((r @ np.array([plan_scene.unit_vector(i['vector'])]).T).T[0].astype('int8'))
+        if d != list(plan_scene.unit_vector(pol[k]['vector']).astype('int8')):
+            switch_angle = pi/2
+        step = int(i['mag']/1)
+        loc[f] = (cam_poly[j][0], cam_poly[j][1], CAMERA_HEIGHT)
+        loc[f+step] = (cam_poly[k][0], cam_poly[k][1], CAMERA_HEIGHT)
+        rot[f+step] = (pi/2, 0, st_angle)
+        f = f+step
+        loc[f+2] = (cam_poly[k][0], cam_poly[k][1], CAMERA_HEIGHT)
+        rot[f+2] = (pi/2, 0, st_angle+switch_angle)
+        f = f+2
+        st_angle = st_angle+switch_angle
+    f = f+1
+    loc[f] = (mean[0], mean[1], 3)
+    rot[f] = (0, 0, 0)
+    f = f+1
+    return loc, rot, int(f+1)
+
+def evaluate(keys, frame):
+    '''
+    Linear interpolation of keys, constant before the first and after the last
+    '''
+    frames = sorted(keys)
+    values = np.array([keys[i] for i in frames], dtype=float)
+    return np.array([np.interp(frame, frames, values[:, c]) for c in range(values.shape[1])])
+
+def camera_trajectory(polygon):
+    '''
+    Camera location and euler of every rendered frame
+    The render loop runs frame_start (1) to frame_end, starting at frame 0
+    @Return list of (location, euler)
+    '''
+    loc, rot, frame_end = camera_keyframes(polygon)
+    return [(evaluate(loc, f), evaluate(rot, f)) for f in range(frame_end-1)]
+
+def world_to_cv(location, euler):
+    '''
+    3x4 world to computer vision camera matrix, get_3x4_RT_matrix_from_blender
+    '''
+    R_bcam2cv = np.diag([1, -1, -1])
+    R_world2bcam = plan_scene.euler_matrix(euler).T
+    T_world2bcam = -R_world2bcam @ location
+    return np.column_stack([R_bcam2cv @ R_world2bcam, R_bcam2cv @ T_world2bcam])
+
+def camera_rays(location, euler, stride=1):
+    '''
+    Rays through the pixel centers, starting on the near clip plane
+    Directions have unit depth, so the hit distance is the planar depth
+    @Param stride, cast every stride-th pixel in both directions
+    @Return origins nx3, directions nx3
+    '''
+    K = intrinsic()
+    u, v = np.meshgrid(np.arange(0, IMAGE_WIDTH, stride) + 0.5, np.arange(0, IMAGE_HEIGHT, stride) + 0.5)
+    # Blender camera looks down -z with y up
+    local = np.stack([(u.ravel()-K[0, 2])/K[0, 0], -(v.ravel()-K[1, 2])/K[1, 1], -np.ones(u.size)], axis=1)
+    directions = local @ plan_scene.euler_matrix(euler).T
+    origins = np.asarray(location, dtype=float) + CLIP_START*directions
+    return origins, directions
+
+class RayCaster:
+    '''
+    Ray caster
+    Closest hit of rays on the plan scene
+    @Param scene, PlanScene
+    '''
+    def __init__(self, scene):
+        self.names = list(scene.names)
+        try:
+            import open3d as o3d
+            self.o3d = o3d
+            self.scene = o3d.t.geometry.RaycastingScene()
+            # geometry id -> index of the object
+            self.lookup = np.full(len(scene.names), -1)
+            for n, (v, t) in enumerate(zip(scene.vertices, scene.triangles)):
+                if len(t) == 0:
+                    continue
+                gid = self.scene.add_triangles(o3d.core.Tensor(v.astype(np.float32)),
+                                               o3d.core.Tensor(t.astype(np.uint32)))
+                self.lookup[gid] = n
+        except (ImportError, AttributeError):
+            self.o3d = None
+            tris = [v[t] for v, t in zip(scene.vertices, scene.triangles) if len(t)]
+            self.tris = np.concatenate(tris)
+            self.owner = np.concatenate([np.full(len(t), n) for n, t in enumerate(scene.triangles) if len(t)])
+
+    def cast(self, origins, directions):
+        '''
+        @Return hit distance (inf for misses), index of the hit object (-1 for misses)
+        '''
+        if self.o3d is not None:
+            rays = self.o3d.core.Tensor(np.hstack([origins, directions]).astype(np.float32))
+            ans = self.scene.cast_rays(rays)
+            t = ans['t_hit'].numpy().astype(float)
+            gid = ans['geometry_ids'].numpy().astype(np.int64)
+            # misses carry RaycastingScene.INVALID_ID
+            hit = np.isfinite(t) & (gid < len(self.lookup))
+            obj = np.full(len(t), -1)
+            obj[hit] = self.lookup[gid[hit]]
+            return t, obj
+        return self._cast_numpy(origins, directions)
+
+    def _cast_numpy(self, origins, directions, batch=256):
+        # Moller-Trumbore against every triangle, in batches of rays
+        v0 = self.tris[:, 0]
+        e1 = self.tris[:, 1] - v0
+        e2 = self.tris[:, 2] - v0
+        t_all = np.full(len(origins), np.inf)
+        obj_all = np.full(len(origins), -1)
+        for s in range(0, len(origins), batch):
+            o = origins[s:s+batch, None, :]
+            d = directions[s:s+batch, None, :]
+            p = np.cross(d, e2[None])
+            det = np.sum(e1[None]*p, axis=2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                inv = 1.0/det
+                tv = o - v0[None]
+                u = np.sum(tv*p, axis=2)*inv
+                q = np.cross(tv, e1[None])
+                v = np.sum(d*q, axis=2)*inv
+                t = np.sum(e2[None]*q, axis=2)*inv
+            hit = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u+v <= 1) & (t > 0)
+            t = np.where(hit, t, np.inf)
+            best = np.argmin(t, axis=1)
+            t_best = t[np.arange(len(best)), best]
+            t_all[s:s+batch] = t_best
+            obj_all[s:s+batch] = np.where(np.isfinite(t_best), self.owner[best], -1)
+        return t_all, obj_all
+
+def points_in_polygon(xy, polygon):
+    '''
+    Even odd test of many points against one polygon
+    '''
+    polygon = np.asarray(polygon)
+    inside = np.zeros(len(xy), dtype=bool)
+    x, y = xy[:, 0], xy[:, 1]
+    for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        cross = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xs = (x2-x1)*(y-y1)/(y2-y1) + x1
+        inside ^= cross & (x < xs)
+    return inside
+
+def crop_polygon(polygon):
+    '''
+    Room outline grown by CROP_BUFFER, the crop of RGBD_to_PointCloud
+    '''
+    from shapely.geometry import Polygon
+    return np.array(Polygon(polygon).buffer(CROP_BUFFER).exterior.coords[:])
+
+def scan_room(scene, caster, roomname, stride=1):
+    '''
+    Scan one room along its camera trajectory
+    @Return points nx3 in meters, object index per point, list of 3x4 poses
+    '''
+    crop = crop_polygon(scene.rooms[roomname])
+    points = []
+    labels = []
+    poses = []
+    for location, euler in camera_trajectory(scene.rooms[roomname]):
+        poses.append(world_to_cv(location, euler))
+        origins, directions = camera_rays(location, euler, stride)
+        t, obj = caster.cast(origins, directions)
+        keep = (obj >= 0) & (t + CLIP_START <= CLIP_END)
+        hits = origins[keep] + directions[keep]*t[keep][:, None]
+        inside = points_in_polygon(hits[:, :2], crop)
+        points.append(hits[inside])
+        labels.append(obj[keep][inside])
+    return np.concatenate(points), np.concatenate(labels), poses
+
+def label_class(name):
+    '''
+    Object class of a label, TopWalls3 -> TopWalls, Bed_1.001 -> Bed
+    '''
+    return name.split('.')[0].rstrip('0123456789').rstrip('_')
+
+def label_colors(scene):
+    '''
+    Fixed color of every object class, all rooms share one floor color
+    @Return nx3 colors in [0, 1], one per object of the scene
+    '''
+    import zlib
+    colors = []
+    for name in scene.names:
+        cls = 'Floor' if name in scene.rooms else label_class(name)
+        h = zlib.crc32(cls.encode())
+        colors.append([(h & 255)/255.0, ((h >> 8) & 255)/255.0, ((h >> 16) & 255)/255.0])
+    return np.array(colors).reshape(-1, 3)
+
+def write_ply(path, points, colors):
+    '''
+    Binary ply with double xyz and uchar rgb, the format open3d writes
+    '''
+    data = np.empty(len(points), dtype=[('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+                                        ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+    data['x'], data['y'], data['z'] = points[:, 0], points[:, 1], points[:, 2]
+    rgb = np.clip(np.round(colors*255), 0, 255).astype('u1')
+    data['red'], data['green'], data['blue'] = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    header = ("ply\nformat binary_little_endian 1.0\nelement vertex %d\n" % len(points) +
+              "property double x\nproperty double y\nproperty double z\n" +
+              "property uchar red\nproperty uchar green\nproperty uchar blue\nend_header\n")
+    with open(path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        f.write(data.tobytes())
+
+def quantize(points, voxel_size):
+    '''
+    One point per voxel, the sparse_quantize of FloorplanToSTL.load_file
+    @Return quantized coordinates, index of the kept points
+    '''
+    coords = np.floor(points / voxel_size)
+    _, inds = np.unique(coords, axis=0, return_index=True)
+    return coords[inds]*voxel_size, inds
+
+def voxel_labels(points, labels, voxel_size):
+    '''
+    Labels of the voxel_down_sample points annotate-Blocky.py labels, nearest labelled point
+    '''
+    import open3d as o3d
+    if len(points) == 0:
+        return np.array(labels)
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(points)
+    down = np.asarray(pcd.voxel_down_sample(voxel_size=voxel_size).points)
+    tree = o3d.geometry.KDTreeFlann(pcd)
+    return np.array([labels[tree.search_knn_vector_3d(p, 1)[1][0]] for p in down])
+
+def next_plan(program_path):
+    number = [i for i in os.listdir(program_path) if '_Plan_'==i[:6] and os.path.isdir(program_path+'/'+i)]
+    return program_path+'/_Plan_'+str(len(number))
+
+def save_matrix(path, matrix):
+    with open(path, 'wb') as f:
+        for line in np.matrix(matrix):
+            np.savetxt(f, line)
+
+def scan_plan(data_path, program_path, placed_polygons='Placed_polygons.txt', voxel_size=0.02,
+              stride=1, calc_an=True, seed=None):
+    '''
+    Scan every usable room of a plan
+    @Param data_path, Data/<n>/ folder of generate_svg_plan
+    @Param program_path, folder receiving _Plan_<n>, holds object_boundbox.txt
+    @Param placed_polygons, output of the placement stage
+    @Param stride, pixel stride of the camera rays, 1 for the full 640x480
+    @Param calc_an, also write the label files
+    @Return plan folder, None when the plan has no usable rooms
+    '''
+    with span('scene_build') as counts:
+        scene = plan_scene.load_plan(data_path, os.path.join(program_path, 'object_boundbox.txt'),
+                                     placed_polygons, seed=seed)
+        caster = RayCaster(scene)
+        rooms = scene.usable_rooms()
+        counts.update(objects=len(scene.names), rooms=len(rooms))
+    if rooms == []:
+        print("No usable rooms in Plan")
+        return None
+
+    plan = next_plan(program_path)
+    names = np.array(scene.names)
+    colors = label_colors(scene)
+    for roomname in rooms:
+        path = plan+'/'+roomname+'/'
+        os.makedirs(path+'pose', exist_ok=True)
+        os.makedirs(path+'Intrinsic', exist_ok=True)
+        with span('scan_room', rooms=1) as counts:
+            points, obj, poses = scan_room(scene, caster, roomname, stride)
+            counts.update(frames=len(poses), points=len(points))
+        for n, RT in enumerate(poses):
+            save_matrix(path+'pose/pose_%d.txt' % (n+1), np.vstack([RT, [0, 0, 0, 1]]))
+        save_matrix(path+'Intrinsic/Camera_Intrinsic.txt', intrinsic())
+        write_ply(path+roomname+'.ply', points/1000, colors[obj])
+
+        with span('downsample', rooms=1) as counts:
+            pnts, inds = quantize(points, voxel_size)
+            np.save(path+roomname+'_downsampled.npy', pnts)
+            np.save(path+roomname+'_downsampled(cls).npy', colors[obj[inds]])
+            counts.update(points=len(points), downsampled=len(pnts))
+        if calc_an:
+            with span('labeling', rooms=1) as counts:
+                labels = names[obj[inds]]
+                np.save(path+roomname+'_labels.npy', labels)
+                np.save(path+roomname+'_labels_norm.npy', voxel_labels(pnts, labels, LABEL_VOXEL))
+                counts['points'] = len(pnts)
+        print("Scanned "+roomname+" "+str(len(points))+" points")
+    return plan
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Labelled room point clouds without Blender")
+    parser.add_argument('data_path', help="Data/<n>/ folder of generate_svg_plan")
+    parser.add_argument('--program-path', default=os.getcwd(), help="folder with object_boundbox.txt, receives _Plan_<n>")
+    parser.add_argument('--placed', default='Placed_polygons.txt', help="placement output, furniture is left out when missing")
+    parser.add_argument('--voxel-size', type=float, default=0.02)
+    parser.add_argument('--stride', type=int, default=1, help="pixel stride of the camera rays")
+    parser.add_argument('--no-annotate', action='store_true')
+    args = parser.parse_args(argv)
+    plan = scan_plan(args.data_path, args.program_path, args.placed, args.voxel_size, args.stride,
+                     calc_an=not args.no_annotate)
+    if plan is not None:
+        print("Created "+plan)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])